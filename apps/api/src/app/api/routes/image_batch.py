@@ -0,0 +1,307 @@
+# apps/api/src/app/api/routes/image_batch.py
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from ...db.session import SessionLocal
+from ...services.db import crud
+from ...services.watermarking.image_service import embed_image_file
+from ...services.uploads import UploadTooLarge, ingest_upload, sha256_file
+from app.services.compute import ComputeOverloaded, get_compute_executor, image_cost, run_compute_retrying
+from app.core.config import settings
+from .watermarking import (
+    DATA_DIR,
+    asset_params,
+    build_image_payload_bits,
+    claim_owner_media,
+    resolve_embed_params,
+)
+
+router = APIRouter(prefix="/watermark/image", tags=["watermark"])
+
+# per-item manifest keys (the /image form fields minus PGP, plus file/output)
+_ITEM_KEYS = {
+    "file", "output", "text",
+    "preset", "profile", "qim_step", "repetition", "use_y_channel", "use_ecc", "ecc_parity_bytes",
+    "pre_generic", "pre_generic_long_edge", "pre_generic_jpeg_q",
+    "auto_register_media", "override_owner_email_sha", "override_media_id", "media_label", "user_uuid",
+}
+
+
+class _ZipSink(io.RawIOBase):
+    """
+    Write-only, non-seekable file for zipfile: it falls back to data
+    descriptors, so members can be streamed out as soon as they're written.
+    take() drains what has been written so far.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buf += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def take(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+def _parse_manifest(manifest: str) -> tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    try:
+        doc = json.loads(manifest or "{}")
+    except json.JSONDecodeError as e:
+        raise HTTPException(400, f"manifest is not valid JSON: {e}")
+    if isinstance(doc, list):
+        doc = {"items": doc}
+    if not isinstance(doc, dict):
+        raise HTTPException(400, "manifest must be an object or a list of items")
+    defaults = doc.get("defaults") or {}
+    items = doc.get("items") or []
+    if not isinstance(defaults, dict) or not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+        raise HTTPException(400, "manifest.defaults must be an object and manifest.items a list of objects")
+    for where, obj in [("defaults", defaults), *((f"items[{i}]", it) for i, it in enumerate(items))]:
+        unknown = set(obj) - _ITEM_KEYS
+        if unknown:
+            raise HTTPException(400, f"manifest.{where}: unknown keys {sorted(unknown)}")
+    return defaults, items
+
+
+def _unpack_zip(archive: Path, dest: Path) -> Dict[str, Path]:
+    """Extract the archive's files (size-checked, names flattened) into dest; name -> path."""
+    sources: Dict[str, Path] = {}
+    basenames: Dict[str, Optional[Path]] = {}
+    total = 0
+    with zipfile.ZipFile(archive) as zf:
+        for i, info in enumerate(zf.infolist()):
+            name = info.filename
+            base = Path(name).name
+            if info.is_dir() or name.startswith("__MACOSX/") or base.startswith("."):
+                continue
+            total += info.file_size
+            if info.file_size > settings.upload_max_image_bytes:
+                raise UploadTooLarge(settings.upload_max_image_bytes)
+            if total > settings.upload_max_batch_bytes:
+                raise UploadTooLarge(settings.upload_max_batch_bytes)
+            out = dest / f"zip{i}{Path(base).suffix}"
+            with zf.open(info) as src, open(out, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            sources[name] = out
+            basenames[base] = None if base in basenames else out   # ambiguous basenames need the full name
+    for base, path in basenames.items():
+        if path is not None:
+            sources.setdefault(base, path)
+    return sources
+
+
+def _record_batch(assets: List[dict], fingerprints: List[dict], media_ids: List[dict]) -> int:
+    """All MediaAsset / AssetFingerprint / MediaId rows of a batch in one transaction."""
+    with SessionLocal() as db:
+        objs = crud.bulk_create_media_assets(db, assets)
+        crud.bulk_create_asset_fingerprints(db, [{"asset_id": o.id, **fp} for o, fp in zip(objs, fingerprints)])
+        added = crud.bulk_register_media_ids(db, media_ids)
+        db.commit()
+    return added
+
+
+async def _embed_one(sem: asyncio.Semaphore, job: Dict[str, Any]) -> Dict[str, Any]:
+    ep = job["ep"]
+    out: Dict[str, Any] = {"index": job["index"], "file": job["file"], "output": job["output"]}
+    async with sem:
+        try:
+            metrics = await run_compute_retrying(
+                embed_image_file, str(job["src"]), str(job["out_path"]), job["payload_bits"],
+                qim_step=ep["qim_step"], repetition=ep["repetition"], use_y_channel=ep["use_y_channel"],
+                long_edge=ep["long_edge"], jpeg_quality=ep["jpeg_quality"],
+                cost=job["cost"],
+            )
+        except ComputeOverloaded as e:
+            out["error"] = f"compute pool busy: {e.detail}"
+            return out
+        except Exception as e:
+            out["error"] = f"Watermark failed: {e}"
+            return out
+    out["sha256"] = await run_in_threadpool(sha256_file, str(job["out_path"]))
+    out["psnr_y"] = round(metrics["psnr_y"], 3)
+    out["ssim_y"] = round(metrics["ssim_y"], 4)
+    out["fingerprint"] = {"phash": metrics["phash"], "dhash": metrics["dhash"]}
+    out["params"] = asset_params(ep, text=job["text"], profile=job["profile"], pre_generic=job["pre_generic"],
+                                 use_ecc=job["use_ecc"], psnr_y=metrics["psnr_y"], ssim_y=metrics["ssim_y"])
+    return out
+
+
+@router.post("/batch")
+async def watermark_image_batch(
+    files: Optional[List[UploadFile]] = File(None, description="images, as a multi-file upload"),
+    archive: Optional[UploadFile] = File(None, description="or one ZIP of images"),
+    manifest: str = Form(
+        "{}",
+        description='{"defaults": {...}, "items": [{"file": "a.png", "text": "owner:..|media:..", '
+                    '"preset": "whatsapp", "output": "a_bob.png"}, ...]}; keys are the /image form fields. '
+                    "Without items every file is marked once with the defaults.",
+    ),
+):
+    """
+    Mark many images in one request: each manifest item is one file marked
+    for one recipient (a file may appear in several items). Items are embedded
+    in parallel on the compute pool and the response is a ZIP streamed as
+    they complete: one PNG per item, then manifest.json with PSNR / SSIM,
+    params and the output SHA-256 (or the error) per item. MediaAsset and
+    MediaId rows for the whole batch are written in one transaction.
+    """
+    if bool(files) == bool(archive):
+        raise HTTPException(400, "Send either files or archive")
+    defaults, items = _parse_manifest(manifest)
+
+    workdir = Path(tempfile.mkdtemp(prefix="wm_batch_"))
+    try:
+        sources: Dict[str, Path] = {}
+        if archive is not None:
+            up = await ingest_upload(archive, max_bytes=settings.upload_max_batch_bytes,
+                                     default_suffix=".zip", dest_dir=str(workdir))
+            try:
+                sources = await run_in_threadpool(_unpack_zip, up.path, workdir)
+            except zipfile.BadZipFile:
+                raise HTTPException(400, "archive is not a valid ZIP")
+            finally:
+                up.unlink()
+        else:
+            for f in files:
+                name = Path(f.filename or "").name
+                if not name or name in sources:
+                    raise HTTPException(400, f"Missing or duplicate file name '{name}'")
+                up = await ingest_upload(f, max_bytes=settings.upload_max_image_bytes,
+                                         default_suffix=".png", dest_dir=str(workdir))
+                sources[name] = up.path
+        if not sources:
+            raise HTTPException(400, "No files in the upload")
+
+        if not items:
+            items = [{"file": name} for name in sorted(sources)]
+        if len(items) > settings.batch_max_items:
+            raise HTTPException(400, f"At most {settings.batch_max_items} items per batch")
+
+        # resolve every item up front so a bad manifest fails before any work starts
+        jobs: List[Dict[str, Any]] = []
+        outputs: set[str] = set()
+        for i, item in enumerate(items):
+            it = {**defaults, **item}
+            where = f"manifest item {i}"
+            if not it.get("file") or it["file"] not in sources:
+                raise HTTPException(400, f"{where}: file '{it.get('file')}' is not in the upload")
+            if not it.get("text"):
+                raise HTTPException(400, f"{where}: text (the claim) is required")
+            try:
+                ep = resolve_embed_params(
+                    preset=it.get("preset"), profile=it.get("profile"), qim_step=it.get("qim_step"),
+                    repetition=it.get("repetition"), ecc_parity_bytes=it.get("ecc_parity_bytes"),
+                    use_y_channel=it.get("use_y_channel"), pre_generic=bool(it.get("pre_generic", False)),
+                    pre_generic_long_edge=it.get("pre_generic_long_edge"),
+                    pre_generic_jpeg_q=it.get("pre_generic_jpeg_q"),
+                )
+                owner_sha, media_id = (claim_owner_media(it["text"], it.get("override_owner_email_sha"),
+                                                         it.get("override_media_id"))
+                                       if it.get("auto_register_media", True) else (None, None))
+            except HTTPException as e:
+                raise HTTPException(400, f"{where}: {e.detail}")
+            use_ecc = bool(it.get("use_ecc", True))
+
+            output = Path(it.get("output") or f"wm_{Path(it['file']).stem}.png").name
+            if output in outputs:
+                output = f"{Path(output).stem}_{i}.png"
+            outputs.add(output)
+
+            src = sources[it["file"]]
+            jobs.append({
+                "index": i, "file": it["file"], "output": output, "src": src,
+                "out_path": DATA_DIR / f"wm_{workdir.name}_{i}.png",
+                "ep": ep, "use_ecc": use_ecc, "profile": it.get("profile"),
+                "pre_generic": bool(it.get("pre_generic", False)),
+                "payload_bits": build_image_payload_bits(it["text"], use_ecc, ep["ecc_parity_bytes"]),
+                "cost": image_cost(str(src), passes=4),
+                "owner_sha": owner_sha, "media_id": media_id,
+                "user_uuid": it.get("user_uuid"), "media_label": it.get("media_label"),
+                "text": it["text"],
+                "claim_sha256": hashlib.sha256(it["text"].encode("utf-8")).hexdigest(),
+            })
+    except BaseException:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+
+    async def body():
+        t0 = time.perf_counter()
+        sink = _ZipSink()
+        zf = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED)   # PNGs are compressed already
+        sem = asyncio.Semaphore(get_compute_executor().workers)
+        tasks = [asyncio.ensure_future(_embed_one(sem, job)) for job in jobs]
+        results: List[Dict[str, Any]] = []
+        try:
+            for fut in asyncio.as_completed(tasks):
+                res = await fut
+                results.append(res)
+                if "error" not in res:
+                    data = await run_in_threadpool(jobs[res["index"]]["out_path"].read_bytes)
+                    zf.writestr(zipfile.ZipInfo(res["output"], time.localtime()[:6]), data)
+                yield sink.take()
+
+            results.sort(key=lambda r: r["index"])
+            ok = [r for r in results if "error" not in r]
+            assets = [{
+                "user_id": None, "original_filename": r["file"],
+                "stored_path": str(jobs[r["index"]]["out_path"]), "sha256_hex": r["sha256"],
+                "pgp_fingerprint": None, "pgp_signature_armored": None, "params": r["params"],
+            } for r in ok]
+            media_ids = [{
+                "owner_email_sha": j["owner_sha"], "media_id": j["media_id"],
+                "user_uuid": j["user_uuid"], "label": j["media_label"],
+            } for j in (jobs[r["index"]] for r in ok) if j["owner_sha"] and j["media_id"]]
+            summary: Dict[str, Any] = {"items": len(jobs), "ok": len(ok), "failed": len(jobs) - len(ok)}
+            try:
+                summary["media_ids_registered"] = await run_in_threadpool(
+                    _record_batch, assets, [r["fingerprint"] for r in ok], media_ids)
+            except Exception as e:
+                summary["db_error"] = str(e)
+            for r in results:
+                r["claim_sha256"] = jobs[r["index"]]["claim_sha256"]
+            summary["seconds"] = round(time.perf_counter() - t0, 3)
+
+            zf.writestr("manifest.json", json.dumps({**summary, "results": results}, indent=2),
+                        compress_type=zipfile.ZIP_DEFLATED)
+            zf.close()
+            yield sink.take()
+        finally:
+            for t in tasks:
+                t.cancel()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return StreamingResponse(
+        body(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": 'attachment; filename="watermarked.zip"',
+            "X-Batch-Items": str(len(jobs)),
+        },
+    )
@@ -12,6 +12,7 @@ from sqlalchemy.orm import Session
 
 from app.db.session import get_db
 from app.db.models import MediaId, User
+from app.services.db import crud
 
 router = APIRouter(prefix="/media", tags=["media"])
 
@@ -149,6 +150,7 @@ def create_media(body: MediaCreate, db: Session = Depends(get_db)):
         if not row.active:
             row.active = True
             row.revoked_at = None
+            crud.bump_owner_catalog(db, owner_sha)
             changed = True
         if changed:
             db.flush()
@@ -161,6 +163,7 @@ def create_media(body: MediaCreate, db: Session = Depends(get_db)):
             active=True,
         )
         db.add(row)
+        crud.bump_owner_catalog(db, owner_sha)
         db.flush()
 
     db.commit()
@@ -1,22 +1,40 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, AsyncIterator, Optional, List, Dict
 from pathlib import Path
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import os
+import shutil
 import tempfile
+import time
+
+import numpy as np
 
 from sqlalchemy.orm import Session
-from ...db.session import get_db
+from ...db.session import SessionLocal, get_db
 from ...services.db import crud
+from app.db.models import MediaAsset
 
 # Reuse the same watermarking/extraction helpers & presets
 from .watermarking import PRESETS   # constant only, avoids duplicate params
-from ...services.watermarking.schemas import DCTConfig
-from ...services.watermarking.image_extract import (
-    extract_dct_image,
-    extract_dct_image_ychannel,
-)
+from ...services.watermarking.image_service import extract_image_bits_file
 from ...services.watermarking.helpers import bits_to_bytes
 from ...services.watermarking.ecc import ecc_encode_sha256, ecc_decode_to_sha256
+from ...services.watermarking.video_extract import SAMPLING_MODES
+from ...services.watermarking.video_service import run_video_extract
+from ...services.watermarking.perceptual import fingerprints_file
+from app.services.compute import get_compute_executor, image_cost, run_compute, run_compute_retrying
+from ...services.uploads import IngestedUpload, RAW_BODY_OPENAPI, ingest_request, ingest_upload
+from app.services.result_cache import cached_result
+from app.services.fingerprint_index import find_near_duplicates
+from app.services.codeword_index import nearest_codeword
+from app.core.config import settings
 
 router = APIRouter(prefix="/verify", tags=["verify"])
 
@@ -31,6 +49,14 @@ class AutoVerifyResult(BaseModel):
     matched_media_id: Optional[str] = None
     checked_media_ids: int
     preset: Optional[str] = None
+    # the asset the answer is based on: byte-identical to its output (exact_match,
+    # no decoding was done) or its nearest perceptual match (fingerprint_distance bits)
+    exact_match: bool = False
+    asset_id: Optional[int] = None
+    asset_params: Optional[Dict[str, Any]] = None
+    fingerprint_distance: Optional[int] = None
+    # set when RS decoding failed and the match is the nearest registered codeword instead
+    false_positive_p: Optional[float] = None
 
 
 def _hex64_from_any(v) -> str:
@@ -90,21 +116,11 @@ def _resolve_params(
     return preset_name or None, qim_step, rep, parity, use_y, payload_bits
 
 def _try_one_candidate(
-    work_path: str,
+    rec_bits: np.ndarray,
     check_text: str,
-    payload_bits: int,
-    qim_step: float,
-    repetition: int,
-    use_y: bool,
     use_ecc: bool,
     ecc_parity_bytes: int,
 ):
-    cfg = DCTConfig(qim_step=qim_step, repetition=repetition)
-    if use_y:
-        rec_bits = extract_dct_image_ychannel(work_path, payload_bits, cfg)
-    else:
-        rec_bits = extract_dct_image(work_path, payload_bits, cfg)
-
     # ECC-aware verification, identical to /watermark/image/extract
     recovered_bytes = bits_to_bytes(rec_bits)
     ecc_ok = None
@@ -148,35 +164,230 @@ async def verify_auto(
     repetition: Optional[int] = Form(None),
     use_y_channel: Optional[bool] = Form(None),
 
+    response: Response = None,
     db: Session = Depends(get_db),
 ):
     # 1) Canonicalize params the same way as the existing routes
-    preset_name, qim_step, rep, parity, use_y, payload_bits = _resolve_params(
-        preset, use_ecc, ecc_parity_bytes, repetition, use_y_channel
+    resolved = _resolve_params(preset, use_ecc, ecc_parity_bytes, repetition, use_y_channel)
+
+    # 2) Persist the uploaded file to a temp path (streamed in chunks)
+    upload = await ingest_upload(file, max_bytes=settings.upload_max_image_bytes, default_suffix=".png")
+    try:
+        return await _verify_auto_image(upload, db, owner_email_sha, use_ecc, *resolved, response=response)
+    finally:
+        upload.unlink()
+
+
+@router.post("/auto/raw", response_model=AutoVerifyResult, openapi_extra=RAW_BODY_OPENAPI)
+async def verify_auto_raw(
+    request: Request,
+    owner_email_sha: str = Query(...),
+    preset: Optional[str] = Query(None),
+    use_ecc: bool = Query(True),
+    ecc_parity_bytes: Optional[int] = Query(None),
+    repetition: Optional[int] = Query(None),
+    use_y_channel: Optional[bool] = Query(None),
+    response: Response = None,
+    db: Session = Depends(get_db),
+):
+    """Raw-body (application/octet-stream) variant of POST /auto; parameters in the query string."""
+    resolved = _resolve_params(preset, use_ecc, ecc_parity_bytes, repetition, use_y_channel)
+    upload = await ingest_request(request, max_bytes=settings.upload_max_image_bytes, default_suffix=".png")
+    try:
+        return await _verify_auto_image(upload, db, owner_email_sha, use_ecc, *resolved, response=response)
+    finally:
+        upload.unlink()
+
+
+class NearDuplicate(BaseModel):
+    asset_id: int
+    phash_distance: int
+    dhash_distance: int
+    params: Dict[str, Any]
+
+
+class SimilarAssetsResult(BaseModel):
+    phash: str
+    dhash: str
+    max_distance: int
+    matches: List[NearDuplicate]
+
+
+@router.post("/similar", response_model=SimilarAssetsResult)
+async def similar_assets(
+    file: UploadFile = File(...),
+    max_distance: Optional[int] = Form(None, description="defaults to settings.fingerprint_max_distance"),
+    limit: int = Form(5),
+    db: Session = Depends(get_db),
+):
+    """Which of our image assets a (possibly degraded) copy derives from: perceptual-hash neighbours, nearest first."""
+    radius = settings.fingerprint_max_distance if max_distance is None else max_distance
+    if not 0 <= radius <= 32:
+        raise HTTPException(400, "max_distance must be between 0 and 32")
+    if not 1 <= limit <= 100:
+        raise HTTPException(400, "limit must be between 1 and 100")
+    upload = await ingest_upload(file, max_bytes=settings.upload_max_image_bytes, default_suffix=".png")
+    try:
+        fp = await run_compute(fingerprints_file, str(upload.path), cost=image_cost(str(upload.path), passes=0.1))
+    finally:
+        upload.unlink()
+    matches = await run_in_threadpool(find_near_duplicates, db, fp["phash"], fp["dhash"], radius, limit)
+    return SimilarAssetsResult(phash=fp["phash"], dhash=fp["dhash"], max_distance=radius,
+                               matches=[NearDuplicate(**m) for m in matches])
+
+
+async def _verify_auto_image(
+    upload: IngestedUpload,
+    db: Session,
+    owner_email_sha: str,
+    use_ecc: bool,
+    preset_name: Optional[str],
+    qim_step: float,
+    rep: int,
+    parity: int,
+    use_y: bool,
+    payload_bits: int,
+    response: Optional[Response] = None,
+) -> AutoVerifyResult:
+    # Same bytes + params + owner catalog version -> same answer; serve it from the result cache
+    owner = owner_email_sha.strip().lower()
+    params = {"use_ecc": use_ecc, "preset": preset_name, "qim_step": qim_step, "repetition": rep,
+              "parity": parity, "use_y_channel": use_y, "payload_bits": payload_bits}
+    return await cached_result(
+        response, AutoVerifyResult, "verify-auto", upload.sha256_hex, params,
+        lambda: _verify_auto_image_uncached(upload, db, owner, use_ecc, preset_name,
+                                            qim_step, rep, parity, use_y, payload_bits),
+        owner_email_sha=owner,
+        catalog_version=crud.owner_catalog_versions(db, [owner])[owner],
     )
 
-    # 2) Persist the uploaded file to a temp path (same pattern as your routes)
-    suffix = Path(file.filename).suffix or ".png"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        tmp.write(await file.read())
-        vpath = tmp.name
 
+async def _verify_auto_image_uncached(
+    upload: IngestedUpload,
+    db: Session,
+    owner_email_sha: str,
+    use_ecc: bool,
+    preset_name: Optional[str],
+    qim_step: float,
+    rep: int,
+    parity: int,
+    use_y: bool,
+    payload_bits: int,
+) -> AutoVerifyResult:
     # 3) Get all media_ids for this owner
     media_ids: List[str] = crud.list_media_ids_by_owner_sha(db, owner_email_sha)
+
+    # 3b) Byte-identical to one of our outputs? Answer from its stored claim, no decoding
+    exact = _exact_image_result(crud.get_media_asset_by_sha256(db, upload.sha256_hex),
+                                owner_email_sha, media_ids)
+    if exact is not None:
+        return exact
     if not media_ids:
         # No registrations for this owner
-        return AutoVerifyResult(
-            exists=False,
-            ecc_ok=False if use_ecc else None,
-            match_text_hash=False,
-            similarity=None,
-            used_repetition=rep,
-            payload_bits=payload_bits,
-            owner_email_sha=owner_email_sha,
-            matched_media_id=None,
-            checked_media_ids=0,
-            preset=preset_name,
+        return _image_result(owner_email_sha, [], None, None, None, use_ecc,
+                             preset_name, rep, payload_bits)
+
+    # 4-5) Near-duplicate lookup, then extract on the compute pool and match
+    return await _extract_and_match(upload.path, owner_email_sha, media_ids, use_ecc,
+                                    (preset_name, qim_step, rep, parity, use_y, payload_bits), run_compute)
+
+
+async def _extract_and_match(path: Path, owner_email_sha: str, media_ids: List[str], use_ecc: bool,
+                             resolved: tuple, run) -> AutoVerifyResult:
+    """
+    Extract with the requested params and compare against every candidate
+    claim. If the upload is a near-duplicate of one of our assets, that
+    asset's stored params are tried first and its media_id is checked first.
+    `run` is run_compute or a batch's admission-aware equivalent.
+    """
+    attempts = [(use_ecc, resolved)]
+    near = await _nearest_asset(path, run)
+    if near is not None:
+        stored = _asset_resolved(near["params"])
+        if stored is not None and (stored[0], stored[1][1:]) != (use_ecc, resolved[1:]):
+            attempts.insert(0, stored)
+        if near["params"].get("media_id"):
+            media_ids = sorted(media_ids, key=lambda m: _hex64_from_any(m) != near["params"]["media_id"])
+
+    for item_ecc, (item_preset, item_qim, item_rep, item_parity, item_use_y, item_bits) in attempts:
+        rec_bits = await run(
+            extract_image_bits_file, str(path), item_bits,
+            qim_step=item_qim, repetition=item_rep, use_y_channel=item_use_y,
+            cost=image_cost(str(path)),
         )
+        hex_id, sim, ecc_ok = _match_image_bits(rec_bits, owner_email_sha, media_ids, item_ecc, item_parity)
+        nearest = None
+        if hex_id is None and ecc_ok is False:
+            # RS gave up: the owner's nearest registered codeword, unless that is likely chance
+            nearest = await run_in_threadpool(nearest_codeword, rec_bits, item_parity, owner_email_sha,
+                                              settings.codeword_fallback_max_fp)
+            if nearest is not None and any(_hex64_from_any(m) == nearest["media_id"] for m in media_ids):
+                hex_id, sim = nearest["media_id"], nearest["similarity"]
+            else:
+                nearest = None
+        result = _image_result(owner_email_sha, media_ids, hex_id, sim, ecc_ok, item_ecc,
+                               item_preset, item_rep, item_bits)
+        if nearest is not None:
+            result = result.model_copy(update={"match_text_hash": None,
+                                               "false_positive_p": nearest["false_positive_p"]})
+        if near is not None:
+            result = result.model_copy(update={"asset_id": near["asset_id"], "asset_params": near["params"],
+                                               "fingerprint_distance": near["phash_distance"]})
+        if hex_id is not None:
+            break
+    return result
+
+
+def _find_near_duplicates(phash: str, dhash: str, max_distance: int, limit: int) -> List[Dict[str, Any]]:
+    with SessionLocal() as db:
+        return find_near_duplicates(db, phash, dhash, max_distance, limit)
+
+
+async def _nearest_asset(path: Path, run) -> Optional[Dict[str, Any]]:
+    """The closest image asset by perceptual hash (see find_near_duplicates), or None."""
+    if settings.fingerprint_max_distance < 0:
+        return None
+    fp = await run(fingerprints_file, str(path), cost=image_cost(str(path), passes=0.1))
+    hits = await run_in_threadpool(_find_near_duplicates, fp["phash"], fp["dhash"],
+                                   settings.fingerprint_max_distance, 1)
+    return hits[0] if hits else None
+
+
+def _asset_resolved(p: Dict[str, Any]) -> Optional[tuple[bool, tuple]]:
+    """(use_ecc, _resolve_params-shaped tuple) from MediaAsset.params, None if they are incomplete."""
+    try:
+        use_ecc = bool(p["use_ecc"])
+        parity = int(p.get("ecc_parity_bytes") or 0) if use_ecc else 0
+        preset = p.get("preset")
+        return use_ecc, (None if preset in (None, "custom") else preset, float(p["qim_step"]),
+                         int(p["repetition"]), parity, bool(p["use_y_channel"]),
+                         (32 + parity) * 8 if use_ecc else 256)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _match_image_bits(
+    rec_bits: np.ndarray,
+    owner_email_sha: str,
+    media_ids: List[str],
+    use_ecc: bool,
+    parity: int,
+) -> tuple[Optional[str], Optional[float], Optional[bool]]:
+    """
+    (matched 64-hex media_id, similarity, ecc_ok) for bits extracted from an
+    image; without a match (None, None, whether RS decoding succeeded) with
+    ECC, else (None, None, None). With ECC the codeword is decoded once and
+    looked up in the owner's claim index; the result is the same as trying
+    every candidate claim in turn, which is what the non-ECC path still does.
+    """
+    if use_ecc:
+        orig32, ok = ecc_decode_to_sha256(bits_to_bytes(rec_bits), parity_bytes=parity)
+        hex_id = _claim_index(owner_email_sha, media_ids).get(bytes(orig32)) if ok else None
+        if hex_id is None:
+            return None, None, bool(ok)
+        expected_bits = np.unpackbits(np.frombuffer(ecc_encode_sha256(orig32, parity_bytes=parity), dtype=np.uint8))
+        L = min(len(rec_bits), len(expected_bits))
+        return hex_id, float((rec_bits[:L] == expected_bits[:L]).mean()), True
 
     for mid in media_ids:
         hex_id = _hex64_from_any(mid)
@@ -185,25 +396,52 @@ async def verify_auto(
             f"owner:{owner_email_sha}|media:0x{hex_id}",    # with 0x
         )
         for check_text in candidates:
-            hit, sim, ecc_ok = _try_one_candidate(
-                vpath, check_text, payload_bits, qim_step=qim_step,
-                repetition=rep, use_y=use_y, use_ecc=use_ecc, ecc_parity_bytes=parity
-            )
+            hit, sim, ecc_ok = _try_one_candidate(rec_bits, check_text, use_ecc=use_ecc, ecc_parity_bytes=parity)
             if hit:
-                return AutoVerifyResult(
-                    exists=True,
-                    ecc_ok=ecc_ok,
-                    match_text_hash=True if use_ecc else None,
-                    similarity=sim,
-                    used_repetition=rep,
-                    payload_bits=payload_bits,
-                    owner_email_sha=owner_email_sha,
-                    matched_media_id=f"0x{hex_id}",  # surface a friendly form
-                    checked_media_ids=len(media_ids),
-                    preset=preset_name,
-                )
-
-    # 5) No match
+                return hex_id, sim, ecc_ok
+    return None, None, None
+
+
+def _exact_image_result(asset: Optional[MediaAsset], owner_email_sha: str,
+                        media_ids: List[str]) -> Optional[AutoVerifyResult]:
+    """
+    The /auto answer for an upload whose SHA-256 equals a MediaAsset's output:
+    its stored claim hash is looked up in the owner's claim index, which is
+    what decoding the file would end in. The codeword is exact, so ecc_ok
+    holds even when the claim is another owner's (exists=False). None for
+    assets recorded without a claim hash; those still go through extraction.
+    """
+    p = (asset.params or {}) if asset is not None else {}
+    if not p.get("claim_sha256"):
+        return None
+    resolved = _asset_resolved(p)
+    if resolved is None:
+        return None
+    use_ecc, (preset_name, _, rep, _, _, payload_bits) = resolved
+    hex_id = _claim_index(owner_email_sha, media_ids).get(bytes.fromhex(p["claim_sha256"]))
+    result = _image_result(owner_email_sha, media_ids, hex_id, 1.0 if hex_id else None,
+                           True if use_ecc else None, use_ecc, preset_name, rep, payload_bits)
+    return result.model_copy(update={"ecc_ok": True if use_ecc else None, "exact_match": True,
+                                     "asset_id": asset.id, "asset_params": p})
+
+
+def _image_result(owner_email_sha: str, media_ids: List[str], hex_id: Optional[str],
+                  sim: Optional[float], ecc_ok: Optional[bool], use_ecc: bool,
+                  preset_name: Optional[str], rep: int, payload_bits: int) -> AutoVerifyResult:
+    if hex_id is not None:
+        return AutoVerifyResult(
+            exists=True,
+            ecc_ok=ecc_ok,
+            match_text_hash=True if use_ecc else None,
+            similarity=sim,
+            used_repetition=rep,
+            payload_bits=payload_bits,
+            owner_email_sha=owner_email_sha,
+            matched_media_id=f"0x{hex_id}",  # surface a friendly form
+            checked_media_ids=len(media_ids),
+            preset=preset_name,
+        )
+    # No match
     return AutoVerifyResult(
         exists=False,
         ecc_ok=False if use_ecc else None,
@@ -216,3 +454,398 @@ async def verify_auto(
         checked_media_ids=len(media_ids),
         preset=preset_name,
     )
+
+
+# ---------- batch ----------
+class AutoVerifyBatchItem(BaseModel):
+    index: int
+    id: Optional[Any] = None          # filename (multipart) or the caller's id (NDJSON)
+    result: Optional[AutoVerifyResult] = None
+    error: Optional[str] = None
+
+
+class AutoVerifyBatchResult(BaseModel):
+    results: List[AutoVerifyBatchItem]
+    owners_loaded: int
+    seconds: float
+
+
+# per-item knobs a batch item may override (same as the /auto form fields)
+_BATCH_ITEM_KEYS = {"owner_email_sha", "preset", "use_ecc", "ecc_parity_bytes", "repetition", "use_y_channel"}
+
+
+def _batch_item_params(defaults: Dict[str, Any], item: Dict[str, Any]) -> tuple[str, bool, tuple]:
+    """(owner, use_ecc, _resolve_params tuple) for one item over the batch defaults."""
+    it = {**defaults, **{k: v for k, v in item.items() if k in _BATCH_ITEM_KEYS and v is not None}}
+    owner = (it.get("owner_email_sha") or "").strip().lower()
+    if not owner:
+        raise HTTPException(400, "owner_email_sha is required")
+    use_ecc = bool(it.get("use_ecc", True))
+    resolved = _resolve_params(it.get("preset"), use_ecc, it.get("ecc_parity_bytes"),
+                               it.get("repetition"), it.get("use_y_channel"))
+    return owner, use_ecc, resolved
+
+
+async def _verify_batch_item(sem: asyncio.Semaphore, path: Path, owner: str, use_ecc: bool,
+                             resolved: tuple, media_ids: List[str],
+                             asset: Optional[MediaAsset] = None) -> AutoVerifyResult:
+    """
+    One /auto verification with the owner's catalog (and the MediaAsset whose
+    output digest equals the upload's, if any) already loaded; unlinks `path`.
+    """
+    preset_name, _, rep, _, _, payload_bits = resolved
+    try:
+        exact = _exact_image_result(asset, owner, media_ids)
+        if exact is not None:
+            return exact
+        if not media_ids:
+            return _image_result(owner, [], None, None, None, use_ecc, preset_name, rep, payload_bits)
+
+        async def run(fn, *args, **kwargs):
+            async with sem:
+                return await run_compute_retrying(fn, *args, **kwargs)
+
+        return await _extract_and_match(path, owner, media_ids, use_ecc, resolved, run)
+    finally:
+        path.unlink(missing_ok=True)
+
+
+async def _batch_item(index: int, item_id: Any, coro) -> AutoVerifyBatchItem:
+    try:
+        return AutoVerifyBatchItem(index=index, id=item_id, result=await coro)
+    except HTTPException as e:
+        return AutoVerifyBatchItem(index=index, id=item_id, error=str(e.detail))
+    except Exception as e:
+        return AutoVerifyBatchItem(index=index, id=item_id, error=f"Verify failed: {e}")
+
+
+async def _raise(exc: Exception):
+    raise exc
+
+
+def _batch_semaphore() -> asyncio.Semaphore:
+    # keep roughly one job per worker queued so a batch can't flood admission
+    return asyncio.Semaphore(2 * get_compute_executor().workers)
+
+
+def _load_catalogs(owners) -> Dict[str, List[str]]:
+    with SessionLocal() as db:
+        return crud.list_media_ids_by_owner_shas(db, owners)
+
+
+def _load_assets(sha256_hexes) -> Dict[str, MediaAsset]:
+    with SessionLocal() as db:
+        assets = crud.media_assets_by_sha256(db, sha256_hexes)
+        db.expunge_all()   # only .id / .params are read, after the session is gone
+        return assets
+
+
+@router.post("/auto/batch", response_model=AutoVerifyBatchResult)
+async def verify_auto_batch(
+    files: List[UploadFile] = File(...),
+    owner_email_sha: Optional[str] = Form(None, description="owner for every file unless items override it"),
+    items: str = Form("[]", description='per-file overrides in upload order, e.g. [{"owner_email_sha": "..."}, {}]'),
+    preset: Optional[str] = Form(None),
+    use_ecc: bool = Form(True),
+    ecc_parity_bytes: Optional[int] = Form(None),
+    repetition: Optional[int] = Form(None),
+    use_y_channel: Optional[bool] = Form(None),
+):
+    """
+    /auto for many images (one or many owners) in one request. Parameters are
+    resolved once per distinct combination, every owner's catalog is loaded
+    in a single query, and the images are extracted in parallel on the compute
+    pool. Results come back in upload order; a bad item gets an error, not a
+    failed batch.
+    """
+    try:
+        overrides = json.loads(items or "[]")
+    except json.JSONDecodeError as e:
+        raise HTTPException(400, f"items is not valid JSON: {e}")
+    if not isinstance(overrides, list) or len(overrides) > len(files) or \
+            not all(isinstance(o, dict) for o in overrides):
+        raise HTTPException(400, "items must be a list of objects, at most one per file")
+    if len(files) > settings.batch_max_items:
+        raise HTTPException(400, f"At most {settings.batch_max_items} files per batch")
+    defaults = {"owner_email_sha": owner_email_sha, "preset": preset, "use_ecc": use_ecc,
+                "ecc_parity_bytes": ecc_parity_bytes, "repetition": repetition, "use_y_channel": use_y_channel}
+
+    t0 = time.perf_counter()
+    specs: List[Any] = []
+    for i, f in enumerate(files):
+        try:
+            specs.append(_batch_item_params(defaults, overrides[i] if i < len(overrides) else {}))
+        except HTTPException as e:
+            specs.append(e)
+    catalogs = await run_in_threadpool(_load_catalogs, {s[0] for s in specs if isinstance(s, tuple)})
+
+    uploads: List[Optional[IngestedUpload]] = []
+    try:
+        for f, spec in zip(files, specs):
+            uploads.append(None if isinstance(spec, HTTPException) else await ingest_upload(
+                f, max_bytes=settings.upload_max_image_bytes, default_suffix=".png"))
+    except BaseException:
+        for u in uploads:
+            if u is not None:
+                u.unlink()
+        raise
+    assets = await run_in_threadpool(_load_assets, {u.sha256_hex for u in uploads if u is not None})
+
+    sem = _batch_semaphore()
+    tasks = []
+    for i, (f, spec, upload) in enumerate(zip(files, specs, uploads)):
+        if upload is None:
+            tasks.append(_batch_item(i, f.filename, _raise(spec)))
+        else:
+            owner, item_ecc, resolved = spec
+            tasks.append(_batch_item(i, f.filename, _verify_batch_item(
+                sem, upload.path, owner, item_ecc, resolved, catalogs.get(owner, []),
+                assets.get(upload.sha256_hex))))
+    results = await asyncio.gather(*tasks)
+    return AutoVerifyBatchResult(results=list(results), owners_loaded=len(catalogs),
+                                 seconds=round(time.perf_counter() - t0, 3))
+
+
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body keeps reading the request: the stock class
+    listens for http.disconnect on `receive` while streaming, which would
+    swallow request body chunks. Disconnects surface from request.stream()
+    instead.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+
+
+async def _ndjson_lines(chunks: AsyncIterator[bytes], max_line: int) -> AsyncIterator[bytes | None]:
+    """Split a byte stream into lines; a line longer than max_line yields None (and is skipped)."""
+    buf = bytearray()
+    overlong = False
+    async for chunk in chunks:
+        buf += chunk
+        while True:
+            nl = buf.find(b"\n")
+            if nl < 0:
+                break
+            line, buf = bytes(buf[:nl]), buf[nl + 1:]
+            if overlong:
+                overlong = False
+                yield None
+            elif line.strip():
+                yield line
+        if len(buf) > max_line:
+            overlong = True
+            buf.clear()
+    if overlong:
+        yield None
+    elif buf.strip():
+        yield bytes(buf)
+
+
+@router.post("/auto/batch/ndjson")
+async def verify_auto_batch_ndjson(
+    request: Request,
+    owner_email_sha: Optional[str] = Query(None),
+    preset: Optional[str] = Query(None),
+    use_ecc: bool = Query(True),
+    ecc_parity_bytes: Optional[int] = Query(None),
+    repetition: Optional[int] = Query(None),
+    use_y_channel: Optional[bool] = Query(None),
+):
+    """
+    Streaming /auto/batch for crawlers that keep one request open. The body is
+    NDJSON, one image per line: {"id": ..., "image_b64": "...", "filename":
+    "x.jpg", "owner_email_sha": "...", ...}; any /auto knob not given on a line
+    falls back to the query string. The response is NDJSON too, one
+    AutoVerifyBatchItem per input line in input order, written as soon as that
+    line and every line before it are done. An owner's catalog is loaded the
+    first time the owner appears and reused for the rest of the stream.
+    """
+    defaults = {"owner_email_sha": owner_email_sha, "preset": preset, "use_ecc": use_ecc,
+                "ecc_parity_bytes": ecc_parity_bytes, "repetition": repetition, "use_y_channel": use_y_channel}
+    max_line = settings.upload_max_image_bytes * 4 // 3 + 64 * 1024   # base64 + JSON overhead
+    workdir = Path(tempfile.mkdtemp(prefix="verify_ndjson_"))
+    sem = _batch_semaphore()
+    catalogs: Dict[str, List[str]] = {}
+    catalog_lock = asyncio.Lock()
+
+    async def catalog(owner: str) -> List[str]:
+        async with catalog_lock:
+            if owner not in catalogs:
+                catalogs.update(await run_in_threadpool(_load_catalogs, {owner}))
+            return catalogs[owner]
+
+    async def verify_line(index: int, line: Optional[bytes]) -> AutoVerifyBatchItem:
+        if line is None:
+            return AutoVerifyBatchItem(index=index, error=f"line exceeds {max_line} bytes")
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError as e:
+            return AutoVerifyBatchItem(index=index, error=f"invalid JSON: {e}")
+        if not isinstance(obj, dict):
+            return AutoVerifyBatchItem(index=index, error="each line must be a JSON object")
+
+        async def run() -> AutoVerifyResult:
+            owner, item_ecc, resolved = _batch_item_params(defaults, obj)
+            try:
+                data = base64.b64decode(obj.get("image_b64") or "", validate=True)
+            except (binascii.Error, ValueError):
+                raise HTTPException(400, "image_b64 is not valid base64")
+            if not data:
+                raise HTTPException(400, "image_b64 is required")
+            suffix = Path(str(obj.get("filename") or "")).suffix or ".png"
+            fd, name = tempfile.mkstemp(suffix=suffix, dir=workdir)
+            with os.fdopen(fd, "wb") as out:
+                out.write(data)
+            sha = hashlib.sha256(data).hexdigest()
+            asset = (await run_in_threadpool(_load_assets, {sha})).get(sha)
+            return await _verify_batch_item(sem, Path(name), owner, item_ecc, resolved, await catalog(owner), asset)
+
+        return await _batch_item(index, obj.get("id"), run())
+
+    # bounded look-ahead: at most this many lines are in flight before output catches up
+    pending: asyncio.Queue = asyncio.Queue(maxsize=4 * get_compute_executor().workers)
+
+    async def reader() -> None:
+        try:
+            index = 0
+            async for line in _ndjson_lines(request.stream(), max_line):
+                await pending.put(asyncio.ensure_future(verify_line(index, line)))
+                index += 1
+        finally:
+            await pending.put(None)
+
+    async def body():
+        read_task = asyncio.ensure_future(reader())
+        try:
+            while True:
+                fut = await pending.get()
+                if fut is None:
+                    break
+                item = await fut
+                yield (item.model_dump_json() + "\n").encode()
+            await read_task
+        finally:
+            read_task.cancel()
+            while not pending.empty():
+                fut = pending.get_nowait()
+                if fut is not None:
+                    fut.cancel()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return _DuplexStreamingResponse(body(), media_type="application/x-ndjson")
+
+
+# ---------- video ----------
+class AutoVerifyVideoResult(BaseModel):
+    exists: bool
+    ecc_ok: Optional[bool] = None
+    similarity: Optional[float] = None
+    used_repetition: Optional[int] = None
+    payload_bits: int
+    payload_hex: Optional[str] = None
+    owner_email_sha: str
+    matched_media_id: Optional[str] = None
+    checked_media_ids: int
+    frames_used: Optional[int] = None
+    sampling: Optional[str] = None
+    early_exit: Optional[str] = None
+    mean_confidence: Optional[float] = None
+
+
+def _claim_index(owner_email_sha: str, media_ids: List[str]) -> Dict[bytes, str]:
+    """SHA256(claim) -> 64-hex media_id for both claim spellings (with / without 0x)."""
+    index: Dict[bytes, str] = {}
+    for mid in media_ids:
+        hex_id = _hex64_from_any(mid)
+        for check_text in (f"owner:{owner_email_sha}|media:{hex_id}",
+                           f"owner:{owner_email_sha}|media:0x{hex_id}"):
+            index[hashlib.sha256(check_text.encode("utf-8")).digest()] = hex_id
+    return index
+
+
+def _nearest_claim(payload: bytes, index: Dict[bytes, str]) -> tuple[Optional[str], Optional[float]]:
+    """Without ECC: best bit agreement between the raw 256-bit payload and every claim hash."""
+    if not index:
+        return None, None
+    keys = list(index)
+    want = np.unpackbits(np.frombuffer(b"".join(keys), dtype=np.uint8)).reshape(len(keys), 256)
+    got = np.unpackbits(np.frombuffer(payload[:32].ljust(32, b"\0"), dtype=np.uint8))
+    sims = (want == got).mean(axis=1)
+    best = int(np.argmax(sims))
+    return index[keys[best]], float(sims[best])
+
+
+@router.post("/auto/video", response_model=AutoVerifyVideoResult)
+async def verify_auto_video(
+    file: UploadFile = File(...),
+    owner_email_sha: str = Form(...),
+
+    # same knobs as /watermark/video/extract
+    qim_step: float = Form(24.0),
+    repetition: int = Form(160),
+    frame_step: int = Form(2),
+    use_ecc: bool = Form(True),
+    ecc_parity_bytes: int = Form(64),
+    sampling: str = Form("dense"),
+
+    db: Session = Depends(get_db),
+):
+    """
+    Decode and vote the video once (no claim needed: ECC success is the stop
+    signal), then look the recovered claim hash up among every claim the owner
+    has registered. Cost no longer grows with the number of media_ids.
+    """
+    sampling = (sampling or "dense").strip().lower()
+    if sampling not in SAMPLING_MODES:
+        raise HTTPException(400, f"Unknown sampling '{sampling}'")
+    if qim_step <= 0 or repetition <= 0:
+        raise HTTPException(400, "qim_step and repetition must be > 0")
+    if use_ecc and ecc_parity_bytes <= 0:
+        raise HTTPException(400, "ecc_parity_bytes must be > 0 when use_ecc=true")
+    payload_bits = (32 + (ecc_parity_bytes if use_ecc else 0)) * 8
+
+    owner = owner_email_sha.strip().lower()
+    media_ids: List[str] = crud.list_media_ids_by_owner_sha(db, owner)
+    index = _claim_index(owner, media_ids)
+
+    upload = await ingest_upload(file, max_bytes=settings.upload_max_video_bytes, default_suffix=".mp4")
+    vpath = upload.path
+    try:
+        data = await run_video_extract(
+            str(vpath),
+            qim_step=qim_step, repetition=repetition, frame_step=frame_step,
+            use_ecc=use_ecc, ecc_parity_bytes=ecc_parity_bytes,
+            check_text=None, sampling=sampling,
+        )
+    except Exception as e:
+        raise HTTPException(400, f"Video extract failed: {e}")
+    finally:
+        vpath.unlink(missing_ok=True)
+
+    payload_hex = data.get("payload_hex")
+    matched, similarity = None, None
+    if payload_hex and use_ecc:
+        matched = index.get(bytes.fromhex(payload_hex))
+        similarity = 1.0 if matched else None
+    elif payload_hex:
+        best, sim = _nearest_claim(bytes.fromhex(payload_hex), index)
+        if best is not None and sim > 0.95:
+            matched, similarity = best, sim
+
+    return AutoVerifyVideoResult(
+        exists=matched is not None,
+        ecc_ok=data.get("ecc_ok"),
+        similarity=similarity,
+        used_repetition=data.get("used_repetition"),
+        payload_bits=payload_bits,
+        payload_hex=payload_hex,
+        owner_email_sha=owner,
+        matched_media_id=f"0x{matched}" if matched else None,
+        checked_media_ids=len(media_ids),
+        frames_used=data.get("frames_used"),
+        sampling=data.get("sampling"),
+        early_exit=data.get("early_exit"),
+        mean_confidence=data.get("mean_confidence"),
+    )
@@ -1,41 +1,41 @@
 # apps/api/src/app/api/routes/video.py
 from __future__ import annotations
 
-import json
 import os
 import shutil
 import tempfile
-import subprocess
 from pathlib import Path
 from typing import Optional, Dict, Any
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 # reuse existing image/video libs you already have
 from ...services.watermarking.video_embed import (
-    DCTVideoConfig,
-    embed_dct_video,
     VIDEO_PRESETS,   # dict of platform presets
+    EMBED_MODES,
+    OUTPUT_MODES,
 )
-from ...services.watermarking.ecc import ecc_encode_sha256
+from ...services.watermarking.video_extract import SAMPLING_MODES
+from ...services.watermarking.video_service import (
+    build_video_embed_config,
+    build_video_payload,
+    open_video_embed_stream,
+    plan_video_config,
+    run_video_embed,
+    run_video_extract,
+    run_video_localize,
+    video_embed_headers,
+)
+from ...services.uploads import IngestedUpload, RAW_BODY_OPENAPI, ingest_request, ingest_upload
+from app.core.config import settings
 
 router = APIRouter(prefix="/watermark/video", tags=["watermark-video"])
 
-# resolve ffmpeg/ffprobe + python
+# resolve ffmpeg/ffprobe
 FFMPEG = os.environ.get("FFMPEG_BIN") or shutil.which("ffmpeg") or "ffmpeg"
 FFPROBE = os.environ.get("FFPROBE_BIN") or shutil.which("ffprobe") or "ffprobe"
-PYTHON = os.environ.get("PYTHON_BIN") or shutil.which("python") or "python"
-
-
-# ---------- helpers ----------
-def _sha256_bytes(s: str) -> bytes:
-    import hashlib
-    return hashlib.sha256(s.encode("utf-8")).digest()
-
-def _build_payload(text: str, use_ecc: bool, parity: int) -> bytes:
-    raw32 = _sha256_bytes(text)
-    return ecc_encode_sha256(raw32, parity_bytes=int(parity)) if use_ecc else raw32
 
 
 # ---------- routes ----------
@@ -81,58 +81,160 @@ async def watermark_video(
     fps: Optional[int] = Form(None),
     crf: Optional[int] = Form(None),
     lossless: bool = Form(False, description="encode output losslessly for local tests (libx264 crf=0 yuv444p)"),
+    segments: int = Form(1, description="split at keyframes and mark N segments in parallel processes"),
+    embed_mode: str = Form("frame_step", description="frame_step | keyframes (mark forced IDR frames only)"),
+    keyframe_interval: Optional[int] = Form(None, description="frames between forced IDRs (default: fps)"),
+    output_mode: str = Form("file", description="file | fragmented (stream an fMP4 while encoding)"),
+    deadline_s: Optional[float] = Form(None, description="wall-clock budget; planner picks frame_step/preset/segments"),
+    target_speed: Optional[float] = Form(None, description="throughput target in x real time (alternative to deadline_s)"),
 ):
     """
     Embed a robust invisible watermark into MP4 and return the watermarked file.
+    With output_mode=fragmented the MP4 is streamed while it is being encoded.
+    """
+    embed_mode, output_mode = _check_embed_modes(embed_mode, output_mode, segments, deadline_s, target_speed)
+    # persist upload (streamed to disk in chunks)
+    upload = await ingest_upload(file, max_bytes=settings.upload_max_video_bytes, default_suffix=".mp4")
+    return await _watermark_video(
+        upload, text=text, preset=preset, qim_step=qim_step, repetition=repetition,
+        use_y_channel=use_y_channel, use_ecc=use_ecc, ecc_parity_bytes=ecc_parity_bytes, frame_step=frame_step,
+        long_edge=long_edge, fps=fps, crf=crf, lossless=lossless, segments=segments, embed_mode=embed_mode,
+        keyframe_interval=keyframe_interval, output_mode=output_mode, deadline_s=deadline_s,
+        target_speed=target_speed,
+    )
+
+
+@router.post("/raw", openapi_extra=RAW_BODY_OPENAPI)
+async def watermark_video_raw(
+    request: Request,
+    text: str = Query(...),
+    preset: str = Query("facebook"),
+    qim_step: Optional[float] = Query(None),
+    repetition: Optional[int] = Query(None),
+    use_y_channel: Optional[bool] = Query(None),
+    use_ecc: bool = Query(True),
+    ecc_parity_bytes: Optional[int] = Query(None),
+    frame_step: Optional[int] = Query(None),
+    long_edge: Optional[int] = Query(None),
+    fps: Optional[int] = Query(None),
+    crf: Optional[int] = Query(None),
+    lossless: bool = Query(False),
+    segments: int = Query(1),
+    embed_mode: str = Query("frame_step"),
+    keyframe_interval: Optional[int] = Query(None),
+    output_mode: str = Query("file"),
+    deadline_s: Optional[float] = Query(None),
+    target_speed: Optional[float] = Query(None),
+):
+    """
+    Same as POST /watermark/video for internal callers: the body is the MP4
+    itself (application/octet-stream, optional X-Filename header) and the
+    parameters are query-string fields, so no multipart parsing happens.
     """
+    embed_mode, output_mode = _check_embed_modes(embed_mode, output_mode, segments, deadline_s, target_speed)
+    upload = await ingest_request(request, max_bytes=settings.upload_max_video_bytes, default_suffix=".mp4")
+    return await _watermark_video(
+        upload, text=text, preset=preset, qim_step=qim_step, repetition=repetition,
+        use_y_channel=use_y_channel, use_ecc=use_ecc, ecc_parity_bytes=ecc_parity_bytes, frame_step=frame_step,
+        long_edge=long_edge, fps=fps, crf=crf, lossless=lossless, segments=segments, embed_mode=embed_mode,
+        keyframe_interval=keyframe_interval, output_mode=output_mode, deadline_s=deadline_s,
+        target_speed=target_speed,
+    )
+
+
+def _check_embed_modes(embed_mode: str, output_mode: str, segments: int,
+                       deadline_s: Optional[float], target_speed: Optional[float]) -> tuple[str, str]:
+    """Validate the mode knobs before the body is read; returns normalised (embed_mode, output_mode)."""
+    embed_mode = (embed_mode or "frame_step").strip().lower()
+    if embed_mode not in EMBED_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown embed_mode '{embed_mode}'")
+    output_mode = (output_mode or "file").strip().lower()
+    if output_mode not in OUTPUT_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown output_mode '{output_mode}'")
+    if output_mode == "fragmented" and int(segments) > 1:
+        raise HTTPException(status_code=400, detail="segments > 1 is not supported with output_mode=fragmented")
+    if (deadline_s is not None and deadline_s <= 0) or (target_speed is not None and target_speed <= 0):
+        raise HTTPException(status_code=400, detail="deadline_s and target_speed must be positive")
+    return embed_mode, output_mode
+
+
+async def _watermark_video(
+    upload: IngestedUpload,
+    *,
+    text: str,
+    preset: str,
+    qim_step: Optional[float],
+    repetition: Optional[int],
+    use_y_channel: Optional[bool],
+    use_ecc: bool,
+    ecc_parity_bytes: Optional[int],
+    frame_step: Optional[int],
+    long_edge: Optional[int],
+    fps: Optional[int],
+    crf: Optional[int],
+    lossless: bool,
+    segments: int,
+    embed_mode: str,
+    keyframe_interval: Optional[int],
+    output_mode: str,
+    deadline_s: Optional[float],
+    target_speed: Optional[float],
+):
+    """Shared body of POST /watermark/video and /watermark/video/raw once the upload is on disk."""
     try:
-        # persist upload
-        suffix = Path(file.filename or "upload.mp4").suffix or ".mp4"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_in:
-            tmp_in.write(await file.read())
-            tmp_in_path = Path(tmp_in.name)
+        tmp_in_path = upload.path
 
         # build payload (ECC(SHA256(text)))
         ecc_par = int(ecc_parity_bytes) if ecc_parity_bytes is not None else 64
-        payload = _build_payload(text, use_ecc, ecc_par)
+        payload = build_video_payload(text, use_ecc, ecc_par)
 
         # init config from preset + overrides (stays consistent w/ your CLI)
-        vcfg = DCTVideoConfig(
-            preset=preset,
-            qim_step=(qim_step if qim_step is not None else (28.0 if preset == "whatsapp" else 24.0)),
-            repetition=(repetition if repetition is not None else (240 if preset == "whatsapp" else 160)),
-            use_y_channel=(use_y_channel if use_y_channel is not None else True),
-            use_ecc=use_ecc,
-            ecc_parity_bytes=ecc_par,
-            frame_step=(frame_step if frame_step is not None else (1 if preset == "whatsapp" else 2)),
-            long_edge=long_edge,
-            target_fps=fps,
-            crf=(crf if crf is not None else (23 if preset != "facebook" else 22)),
-            x264_preset="faster",
+        vcfg = build_video_embed_config(
+            preset=preset, qim_step=qim_step, repetition=repetition,
+            use_y_channel=use_y_channel, use_ecc=use_ecc, ecc_parity_bytes=ecc_par,
+            frame_step=frame_step, long_edge=long_edge, fps=fps, crf=crf,
+            segments=segments, embed_mode=embed_mode, keyframe_interval=keyframe_interval,
         )
+        # ffprobe (and a one-off host benchmark) block, so keep them off the event loop
+        # a fragmented stream is encoded in one pass, so plan for a single segment
+        plan_headers = await run_in_threadpool(plan_video_config, str(tmp_in_path), vcfg,
+                                               deadline_s=deadline_s, target_speed=target_speed,
+                                               max_segments=1 if output_mode == "fragmented" else None)
+
+        if output_mode == "fragmented":
+            # marked on the compute pool; the fMP4 is relayed back as it is encoded
+            chunks = await open_video_embed_stream(str(tmp_in_path), payload, vcfg, lossless=bool(lossless))
+
+            async def body():
+                try:
+                    async for chunk in chunks:
+                        yield chunk
+                finally:
+                    await chunks.aclose()
+                    tmp_in_path.unlink(missing_ok=True)
+
+            return StreamingResponse(
+                body(),
+                media_type="video/mp4",
+                headers={
+                    **video_embed_headers(preset, vcfg, None),
+                    **plan_headers,
+                    "X-Output-Mode": "fragmented",
+                    "Content-Disposition": f'attachment; filename="wm_{tmp_in_path.stem}.mp4"',
+                },
+            )
 
         # output path
         out_path = Path(tempfile.gettempdir()) / f"wm_{tmp_in_path.stem}.mp4"
 
-        # run
-        embed_dct_video(str(tmp_in_path), str(out_path), payload, vcfg, lossless=bool(lossless))
-
-        # cleanup upload asap
-        tmp_in_path.unlink(missing_ok=True)
+        # run on the compute pool; cleanup upload asap
+        try:
+            stats = await run_video_embed(str(tmp_in_path), str(out_path), payload, vcfg, lossless=bool(lossless))
+        finally:
+            tmp_in_path.unlink(missing_ok=True)
 
         # headers: echo back params so FE can store them for later verify
-        headers = {
-            "X-Preset": preset,
-            "X-Params-QIM": str(vcfg.qim_step),
-            "X-Params-Repetition": str(vcfg.repetition),
-            "X-Params-FrameStep": str(vcfg.frame_step),
-            "X-Params-UseY": str(bool(vcfg.use_y_channel)).lower(),
-            "X-Params-UseECC": str(bool(vcfg.use_ecc)).lower(),
-            "X-Params-ECC-Parity": str(vcfg.ecc_parity_bytes),
-            "X-Pre-Long-Edge": str(vcfg.long_edge or ""),
-            "X-Pre-FPS": str(vcfg.target_fps or ""),
-            "X-CRF": str(vcfg.crf),
-        }
+        headers = {**video_embed_headers(preset, vcfg, stats), **plan_headers}
 
         return FileResponse(
             str(out_path),
@@ -140,6 +242,8 @@ async def watermark_video(
             filename=out_path.name,
             headers=headers,
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Video watermark failed: {e}")
 
@@ -154,43 +258,82 @@ async def extract_video(
     use_ecc: bool = Form(True),
     ecc_parity_bytes: int = Form(64),
     check_text: str = Form(..., description="the claim originally embedded (e.g. owner:<email_sha>)"),
+    sampling: str = Form("dense", description="dense | keyframes (I-frames only, dense fallback on ECC failure)"),
 ):
     """
-    Verify watermark in a video. Uses your tested CLI extractor under the hood to
-    remain consistent with your terminal runs.
+    Verify watermark in a video. Runs the same extractor as the CLI on the shared
+    compute pool (see services/compute.py), so results stay consistent with your
+    terminal runs without spawning a Python per request.
     """
+    sampling = (sampling or "dense").strip().lower()
+    if sampling not in SAMPLING_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown sampling '{sampling}'")
     try:
-        # persist upload
-        suffix = Path(file.filename or "video.mp4").suffix or ".mp4"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_in:
-            tmp_in.write(await file.read())
-            tmp_in_path = Path(tmp_in.name)
-
-        # build CLI
-        # python -m app.services.watermarking.video_extract --in foo.mp4 --qim 28 --rep 240 --frame-step 1 --use-ecc --ecc 64 --check-text "..."
-        mod = "app.services.watermarking.video_extract"
-        cmd = [
-            PYTHON, "-m", mod,
-            "--in", str(tmp_in_path),
-            "--qim", str(qim_step),
-            "--rep", str(repetition),
-            "--frame-step", str(frame_step),
-            "--ecc", str(ecc_parity_bytes),
-            "--check-text", check_text,
-        ]
-        if use_ecc:
-            cmd.append("--use-ecc")
-        else:
-            cmd.append("--no-ecc")
-
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        tmp_in_path.unlink(missing_ok=True)
-
-        if proc.returncode != 0:
-            raise RuntimeError(proc.stderr or "Extractor failed")
-
-        # stdout is JSON (as per your CLI). Return it directly.
-        data = json.loads(proc.stdout.strip())
+        # persist upload (streamed to disk in chunks)
+        upload = await ingest_upload(file, max_bytes=settings.upload_max_video_bytes, default_suffix=".mp4")
+        tmp_in_path = upload.path
+
+        try:
+            data = await run_video_extract(
+                str(tmp_in_path),
+                qim_step=qim_step,
+                repetition=repetition,
+                frame_step=frame_step,
+                use_ecc=use_ecc,
+                ecc_parity_bytes=ecc_parity_bytes,
+                check_text=check_text,
+                sampling=sampling,
+            )
+        finally:
+            tmp_in_path.unlink(missing_ok=True)
+
         return JSONResponse(content=data)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Video extract failed: {e}")
+
+
+@router.post("/localize")
+async def localize_video(
+    file: UploadFile = File(...),
+    qim_step: float = Form(24.0),
+    repetition: int = Form(160),
+    use_ecc: bool = Form(True),
+    ecc_parity_bytes: int = Form(64),
+    check_text: Optional[str] = Form(None, description="optional claim to compare each range against"),
+    window_s: float = Form(4.0, description="window length in seconds"),
+    hop_s: Optional[float] = Form(None, description="window hop in seconds (default window_s / 2)"),
+    presence_threshold: float = Form(0.5, description="per-frame presence score needed to vote"),
+):
+    """
+    Report which time ranges of a video carry a mark, and what each range decodes
+    to (payload_hex = recovered claim hash, with per-range confidence). Windows
+    with no marked frames are skipped after a few frames.
+    """
+    if window_s <= 0 or (hop_s is not None and hop_s <= 0):
+        raise HTTPException(status_code=400, detail="window_s and hop_s must be positive")
+    try:
+        upload = await ingest_upload(file, max_bytes=settings.upload_max_video_bytes, default_suffix=".mp4")
+        tmp_in_path = upload.path
+
+        try:
+            data = await run_video_localize(
+                str(tmp_in_path),
+                qim_step=qim_step,
+                repetition=repetition,
+                use_ecc=use_ecc,
+                ecc_parity_bytes=ecc_parity_bytes,
+                check_text=check_text,
+                window_s=window_s,
+                hop_s=hop_s,
+                presence_threshold=presence_threshold,
+            )
+        finally:
+            tmp_in_path.unlink(missing_ok=True)
+
+        return JSONResponse(content=data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Video localize failed: {e}")
@@ -0,0 +1,194 @@
+# apps/api/src/app/api/routes/video_jobs.py
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+from typing import Optional
+
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from ...services.watermarking.video_embed import EMBED_MODES
+from ...services.watermarking.video_extract import SAMPLING_MODES
+from ...services.watermarking.video_jobs import TERMINAL_STATES, VideoJobQueueFull, get_video_job_runner
+from ...services.uploads import IngestedUpload, ingest_upload
+from app.core.config import settings
+
+router = APIRouter(prefix="/watermark/video/jobs", tags=["watermark-video-jobs"])
+
+# rough hint for clients backing off a full queue
+_RETRY_AFTER_S = 30
+# SSE poll interval and keep-alive comment period (proxies drop idle streams)
+_EVENTS_POLL_S = 0.5
+_EVENTS_KEEPALIVE_S = 15.0
+
+
+async def _ingest(file: UploadFile) -> IngestedUpload:
+    # spool straight into the job dir so submit only has to rename the file
+    Path(settings.video_job_dir).mkdir(parents=True, exist_ok=True)
+    return await ingest_upload(file, max_bytes=settings.upload_max_video_bytes, default_suffix=".mp4",
+                               dest_dir=settings.video_job_dir)
+
+
+def _submit(request: Request, kind: str, upload: IngestedUpload, params: dict) -> JSONResponse:
+    try:
+        job = get_video_job_runner().submit(kind, upload, params)
+    except VideoJobQueueFull as e:
+        upload.unlink()
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(_RETRY_AFTER_S)})
+    location = str(request.url_for("get_job", job_id=job["job_id"]))
+    return JSONResponse(status_code=202, content=job, headers={"Location": location})
+
+
+@router.post("")
+async def submit_embed_job(
+    request: Request,
+    file: UploadFile = File(...),
+    text: str = Form(...),
+    preset: str = Form("facebook"),
+    qim_step: Optional[float] = Form(None),
+    repetition: Optional[int] = Form(None),
+    use_y_channel: Optional[bool] = Form(None),
+    use_ecc: bool = Form(True),
+    ecc_parity_bytes: Optional[int] = Form(None),
+    frame_step: Optional[int] = Form(None),
+    long_edge: Optional[int] = Form(None),
+    fps: Optional[int] = Form(None),
+    crf: Optional[int] = Form(None),
+    lossless: bool = Form(False),
+    segments: int = Form(1),
+    embed_mode: str = Form("frame_step"),
+    keyframe_interval: Optional[int] = Form(None),
+    deadline_s: Optional[float] = Form(None),
+    target_speed: Optional[float] = Form(None),
+):
+    """
+    Queue a video embed (same fields as POST /watermark/video) and return 202
+    with a job id right away. Poll GET /jobs/{id}, then download /jobs/{id}/result.
+    """
+    embed_mode = (embed_mode or "frame_step").strip().lower()
+    if embed_mode not in EMBED_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown embed_mode '{embed_mode}'")
+    params = {
+        "text": text, "preset": preset, "qim_step": qim_step, "repetition": repetition,
+        "use_y_channel": use_y_channel, "use_ecc": use_ecc, "ecc_parity_bytes": ecc_parity_bytes,
+        "frame_step": frame_step, "long_edge": long_edge, "fps": fps, "crf": crf,
+        "lossless": lossless, "segments": max(1, int(segments)),
+        "embed_mode": embed_mode, "keyframe_interval": keyframe_interval,
+        "deadline_s": deadline_s, "target_speed": target_speed,
+    }
+    return _submit(request, "embed", await _ingest(file), params)
+
+
+@router.post("/extract")
+async def submit_extract_job(
+    request: Request,
+    file: UploadFile = File(...),
+    qim_step: float = Form(24.0),
+    repetition: int = Form(160),
+    frame_step: int = Form(2),
+    use_ecc: bool = Form(True),
+    ecc_parity_bytes: int = Form(64),
+    check_text: str = Form(...),
+    sampling: str = Form("dense"),
+):
+    """Queue a video extract (same fields as POST /watermark/video/extract)."""
+    sampling = (sampling or "dense").strip().lower()
+    if sampling not in SAMPLING_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown sampling '{sampling}'")
+    params = {
+        "qim_step": qim_step, "repetition": repetition, "frame_step": frame_step,
+        "use_ecc": use_ecc, "ecc_parity_bytes": ecc_parity_bytes,
+        "check_text": check_text, "sampling": sampling,
+    }
+    return _submit(request, "extract", await _ingest(file), params)
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    job = get_video_job_runner().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-Sent Events: `status` on every state change, `progress` with the
+    latest ffmpeg / mark-stage figures while running, and a final event named
+    after the terminal state (done | failed | cancelled) carrying the job,
+    including per-stage timings. The stream closes after the final event.
+    """
+    runner = get_video_job_runner()
+    # runner.get() reads the job table: keep it off the event loop
+    if await run_in_threadpool(runner.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        last_status, last_seq = None, None
+        idle = 0.0
+        while True:
+            job = await run_in_threadpool(runner.get, job_id)
+            if job is None:
+                return
+            sent = False
+            if job["status"] != last_status:
+                last_status = job["status"]
+                if last_status in TERMINAL_STATES:
+                    yield _sse(last_status, job)
+                    return
+                yield _sse("status", {"job_id": job_id, "status": last_status,
+                                      "queue_position": job.get("queue_position")})
+                sent = True
+            ev = job.get("progress")
+            if ev and ev.get("seq") != last_seq:
+                last_seq = ev.get("seq")
+                yield _sse("progress", ev)
+                sent = True
+            idle = 0.0 if sent else idle + _EVENTS_POLL_S
+            if idle >= _EVENTS_KEEPALIVE_S:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(_EVENTS_POLL_S)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: str):
+    """Embed jobs: the marked MP4 (with the usual X-* param headers). Extract jobs: the JSON result."""
+    runner = get_video_job_runner()
+    job = runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    if job["kind"] == "extract":
+        return JSONResponse(content=job["result"])
+
+    output = runner.output(job_id)
+    if output is None or not Path(output[0]).exists():
+        raise HTTPException(status_code=410, detail="Job output is no longer available")
+    out_path, result = output
+    return FileResponse(
+        out_path,
+        media_type="video/mp4",
+        filename=f"wm_{Path(job['original_filename'] or 'video.mp4').stem}.mp4",
+        headers=result.get("headers", {}),
+    )
+
+
+@router.delete("/{job_id}")
+def cancel_job(job_id: str):
+    job = get_video_job_runner().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
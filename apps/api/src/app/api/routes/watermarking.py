@@ -1,9 +1,9 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request, Response
 from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from pathlib import Path
-from typing import Optional, Dict, Any
-import tempfile
+from typing import Optional, Dict, Any, List
 import hashlib
 import numpy as np
 import re  # <<< for claim parsing
@@ -15,27 +15,17 @@ from ...db.session import get_db
 from ...services.db import crud
 from ...services.db.crud import register_media_id  # <<< auto-save media id
 
-from ...services.watermarking.schemas import DCTConfig
-from ...services.watermarking.image_embed import (
-    embed_dct_image,
-    embed_dct_image_ychannel,
-    build_payload_from_text,
-)
-from ...services.watermarking.image_extract import (
-    extract_dct_image,
-    extract_dct_image_ychannel,
-)
-from ...services.watermarking.helpers import (
-    bits_to_bytes,
-    load_color_bgr_float32,
-    save_color_bgr_uint8,
-    bgr_to_ycbcr,
-    psnr,
-    ssim_y,
-    preprocess_for_preset,   # platform-aware preproc
-)
+from ...services.watermarking.image_embed import build_payload_from_text
+from ...services.watermarking.image_extract import soft_to_bits, soft_confidence
+from ...services.watermarking.image_service import embed_image_file, extract_image_soft_file
+from ...services.watermarking.helpers import bits_to_bytes
 from ...services.watermarking.ecc import ecc_encode_sha256, ecc_decode_to_sha256
 from ...services.crypto.pgp_utils import key_fingerprint, verify_detached_signature
+from app.services.compute import image_cost, run_compute
+from app.services.result_cache import cached_result
+from app.services.codeword_index import nearest_codeword
+from ...services.uploads import IngestedUpload, RAW_BODY_OPENAPI, ingest_request, ingest_upload, sha256_file
+from app.core.config import settings
 
 router = APIRouter(prefix="/watermark", tags=["watermark"])
 
@@ -54,6 +44,16 @@ def _hex64(s: str) -> str:
     except Exception:
         raise HTTPException(400, "Value error, must be hex")
     return v
+
+def claim_owner_media(text: str, override_owner_email_sha: Optional[str] = None,
+                      override_media_id: Optional[str] = None) -> tuple[Optional[str], Optional[str]]:
+    """(owner_sha, media_id) from an owner|media claim, else from the explicit overrides."""
+    m = _CLAIM_RE.fullmatch(text.strip())
+    if m:
+        return m.group(1), m.group(2)
+    owner_sha = _hex64(override_owner_email_sha) if override_owner_email_sha else None
+    media_id = _hex64(override_media_id) if override_media_id else None
+    return owner_sha, media_id
 # ------------------------------------------
 
 # Legacy profiles (used only when no preset is given)
@@ -92,6 +92,88 @@ PRESETS: Dict[str, Dict[str, Any]] = {
     },
 }
 
+def resolve_embed_params(
+    *,
+    preset: Optional[str] = None,
+    profile: Optional[str] = None,
+    qim_step: Optional[float] = None,
+    repetition: Optional[int] = None,
+    ecc_parity_bytes: Optional[int] = None,
+    use_y_channel: Optional[bool] = None,
+    pre_generic: bool = False,
+    pre_generic_long_edge: Optional[int] = None,
+    pre_generic_jpeg_q: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Embed params for /image and /image/batch: explicit value → preset → profile → baseline."""
+    # --- Resolve preset (strict)
+    preset_name = (preset or "").lower().strip()
+    preset_cfg = {}
+    if preset_name:
+        if preset_name not in PRESETS:
+            raise HTTPException(status_code=400, detail=f"Unknown preset '{preset_name}'")
+        preset_cfg = PRESETS[preset_name]
+
+    # --- Param defaults: preset → profile → baseline
+    qim_default = 18.0
+    rep_default = 120
+    par_default = 32
+    usey_default = True
+
+    if preset_cfg:
+        qim_default = preset_cfg.get("qim_step", qim_default)
+        rep_default = preset_cfg.get("repetition", rep_default)
+        par_default = preset_cfg.get("ecc_parity_bytes", par_default)
+        usey_default = preset_cfg.get("use_y_channel", usey_default)
+    elif profile:
+        prof = PROFILES.get(profile, {})
+        qim_default = prof.get("qim_step", qim_default)
+        rep_default = prof.get("repetition", rep_default)
+        par_default = prof.get("ecc_parity_bytes", par_default)
+        usey_default = prof.get("use_y_channel", usey_default)
+
+    # --- Preprocess (preset or explicit overrides)
+    return {
+        "preset_name": preset_name,
+        "qim_step": float(qim_step if qim_step is not None else qim_default),
+        "repetition": int(repetition if repetition is not None else rep_default),
+        "ecc_parity_bytes": int(ecc_parity_bytes if ecc_parity_bytes is not None else par_default),
+        "use_y_channel": bool(use_y_channel if use_y_channel is not None else usey_default),
+        "long_edge": pre_generic_long_edge if pre_generic else preset_cfg.get("long_edge") if preset_cfg else None,
+        "jpeg_quality": pre_generic_jpeg_q if pre_generic else preset_cfg.get("jpeg_quality") if preset_cfg else None,
+    }
+
+def build_image_payload_bits(text: str, use_ecc: bool, ecc_parity_bytes: int) -> np.ndarray:
+    """ECC(SHA256(text)) (or the bare hash) as the bit vector the image embedder takes."""
+    sha32 = hashlib.sha256(text.encode("utf-8")).digest()
+    payload_bytes = ecc_encode_sha256(sha32, parity_bytes=ecc_parity_bytes) if use_ecc else sha32
+    return np.unpackbits(np.frombuffer(payload_bytes, dtype=np.uint8)).astype(np.uint8)
+
+def asset_params(ep: Dict[str, Any], *, text: str, profile: Optional[str], pre_generic: bool, use_ecc: bool,
+                 psnr_y: float, ssim_y: float) -> Dict[str, Any]:
+    """
+    MediaAsset.params for an embedded image. Besides the embed params it keeps
+    the claim linkage (SHA256 of the embedded text and, for an owner|media
+    claim, both ids) so a byte-identical copy can be answered without decoding.
+    """
+    m = _CLAIM_RE.fullmatch(text.strip())
+    return {
+        "claim_sha256": hashlib.sha256(text.encode("utf-8")).hexdigest(),
+        "owner_email_sha": m.group(1).lower() if m else None,
+        "media_id": m.group(2).lower() if m and m.group(2) else None,
+        "profile": profile or "custom",
+        "preset": ep["preset_name"] or "custom",
+        "pre_generic": bool(pre_generic),
+        "pre_long_edge": ep["long_edge"],
+        "pre_jpeg_q": ep["jpeg_quality"],
+        "qim_step": float(ep["qim_step"]),
+        "repetition": int(ep["repetition"]),
+        "use_ecc": bool(use_ecc),
+        "ecc_parity_bytes": int(ep["ecc_parity_bytes"] if use_ecc else 0),
+        "use_y_channel": bool(ep["use_y_channel"]),
+        "psnr_y": float(psnr_y),
+        "ssim_y": float(ssim_y),
+    }
+
 class ExtractResponse(BaseModel):
     payload_bitlen: int
     similarity: Optional[float] = None
@@ -99,6 +181,15 @@ class ExtractResponse(BaseModel):
     ecc_ok: Optional[bool] = None
     match_text_hash: Optional[bool] = None
     used_repetition: Optional[int] = None
+    # per-bit |sum(r0 - r1)| normalised to [0, 1]; see image_extract.soft_confidence
+    mean_confidence: Optional[float] = None
+    bit_confidence: Optional[List[float]] = None
+    # set when the upload is byte-identical to one of our outputs (no decoding was done)
+    exact_match: bool = False
+    asset_id: Optional[int] = None
+    asset_params: Optional[Dict[str, Any]] = None
+    # RS decoding failed: the registered claim whose codeword is nearest, with its false-positive estimate
+    nearest_claim: Optional[Dict[str, Any]] = None
 
 @router.get("/presets")
 def list_presets():
@@ -154,49 +245,91 @@ async def watermark_image(
 
     db: Session = Depends(get_db),
 ):
+    upload = await ingest_upload(file, max_bytes=settings.upload_max_image_bytes, default_suffix=".png")
+    return await _watermark_image(
+        upload, db, text=text, qim_step=qim_step, repetition=repetition, use_y_channel=use_y_channel,
+        use_ecc=use_ecc, ecc_parity_bytes=ecc_parity_bytes, profile=profile, pre_whatsapp=pre_whatsapp,
+        preset=preset, pre_generic=pre_generic, pre_generic_long_edge=pre_generic_long_edge,
+        pre_generic_jpeg_q=pre_generic_jpeg_q, pgp_public_key=pgp_public_key, pgp_signature=pgp_signature,
+        auto_register_media=auto_register_media, override_owner_email_sha=override_owner_email_sha,
+        override_media_id=override_media_id, media_label=media_label, user_uuid=user_uuid,
+    )
+
+@router.post("/image/raw", openapi_extra=RAW_BODY_OPENAPI)
+async def watermark_image_raw(
+    request: Request,
+    text: str = Query(...),
+    qim_step: Optional[float] = Query(None),
+    repetition: Optional[int] = Query(None),
+    use_y_channel: Optional[bool] = Query(None),
+    use_ecc: bool = Query(True),
+    ecc_parity_bytes: Optional[int] = Query(None),
+    profile: Optional[str] = Query(None, description="light | medium | robust_whatsapp"),
+    pre_whatsapp: bool = Query(False),
+    preset: Optional[str] = Query(None, description="original|facebook|whatsapp|instagram|x_twitter"),
+    pre_generic: bool = Query(False),
+    pre_generic_long_edge: Optional[int] = Query(None),
+    pre_generic_jpeg_q: Optional[int] = Query(None),
+    pgp_public_key: Optional[str] = Query(None),
+    pgp_signature: Optional[str] = Query(None),
+    auto_register_media: bool = Query(True),
+    override_owner_email_sha: Optional[str] = Query(None),
+    override_media_id: Optional[str] = Query(None),
+    media_label: Optional[str] = Query(None),
+    user_uuid: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+):
+    """
+    Same as POST /image for internal callers: the body is the image itself
+    (application/octet-stream, optional X-Filename header) and the parameters
+    are query-string fields, so no multipart parsing happens.
+    """
+    upload = await ingest_request(request, max_bytes=settings.upload_max_image_bytes, default_suffix=".png")
+    return await _watermark_image(
+        upload, db, text=text, qim_step=qim_step, repetition=repetition, use_y_channel=use_y_channel,
+        use_ecc=use_ecc, ecc_parity_bytes=ecc_parity_bytes, profile=profile, pre_whatsapp=pre_whatsapp,
+        preset=preset, pre_generic=pre_generic, pre_generic_long_edge=pre_generic_long_edge,
+        pre_generic_jpeg_q=pre_generic_jpeg_q, pgp_public_key=pgp_public_key, pgp_signature=pgp_signature,
+        auto_register_media=auto_register_media, override_owner_email_sha=override_owner_email_sha,
+        override_media_id=override_media_id, media_label=media_label, user_uuid=user_uuid,
+    )
+
+async def _watermark_image(
+    upload: IngestedUpload,
+    db: Session,
+    *,
+    text: str,
+    qim_step: Optional[float],
+    repetition: Optional[int],
+    use_y_channel: Optional[bool],
+    use_ecc: bool,
+    ecc_parity_bytes: Optional[int],
+    profile: Optional[str],
+    pre_whatsapp: bool,
+    preset: Optional[str],
+    pre_generic: bool,
+    pre_generic_long_edge: Optional[int],
+    pre_generic_jpeg_q: Optional[int],
+    pgp_public_key: Optional[str],
+    pgp_signature: Optional[str],
+    auto_register_media: bool,
+    override_owner_email_sha: Optional[str],
+    override_media_id: Optional[str],
+    media_label: Optional[str],
+    user_uuid: Optional[str],
+):
+    """Shared body of POST /image and /image/raw once the upload is on disk."""
     try:
-        suffix = Path(file.filename).suffix or ".png"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_in:
-            tmp_in.write(await file.read())
-            tmp_in_path = Path(tmp_in.name)
-
-        # --- Resolve preset (strict)
-        preset_name = (preset or "").lower().strip()
-        preset_cfg = {}
-        if preset_name:
-            if preset_name not in PRESETS:
-                raise HTTPException(status_code=400, detail=f"Unknown preset '{preset_name}'")
-            preset_cfg = PRESETS[preset_name]
-
-        # --- Param defaults: preset → profile → baseline
-        qim_default = 18.0
-        rep_default = 120
-        par_default = 32
-        usey_default = True
-
-        if preset_cfg:
-            qim_default = preset_cfg.get("qim_step", qim_default)
-            rep_default = preset_cfg.get("repetition", rep_default)
-            par_default = preset_cfg.get("ecc_parity_bytes", par_default)
-            usey_default = preset_cfg.get("use_y_channel", usey_default)
-        elif profile:
-            prof = PROFILES.get(profile, {})
-            qim_default = prof.get("qim_step", qim_default)
-            rep_default = prof.get("repetition", rep_default)
-            par_default = prof.get("ecc_parity_bytes", par_default)
-            usey_default = prof.get("use_y_channel", usey_default)
-
-        qim_val = float(qim_step if qim_step is not None else qim_default)
-        rep_val = int(repetition if repetition is not None else rep_default)
-        ecc_par = int(ecc_parity_bytes if ecc_parity_bytes is not None else par_default)
-        use_y   = bool(use_y_channel if use_y_channel is not None else usey_default)
-
-        # --- Preprocess (preset or explicit overrides)
-        long_edge = pre_generic_long_edge if pre_generic else preset_cfg.get("long_edge") if preset_cfg else None
-        jpeg_q    = pre_generic_jpeg_q   if pre_generic else preset_cfg.get("jpeg_quality") if preset_cfg else None
-
-        orig_bgr = load_color_bgr_float32(str(tmp_in_path))
-        work_bgr = preprocess_for_preset(orig_bgr, long_edge=long_edge, jpeg_quality=jpeg_q) if (long_edge or jpeg_q) else orig_bgr
+        tmp_in_path = upload.path
+
+        ep = resolve_embed_params(
+            preset=preset, profile=profile, qim_step=qim_step, repetition=repetition,
+            ecc_parity_bytes=ecc_parity_bytes, use_y_channel=use_y_channel, pre_generic=pre_generic,
+            pre_generic_long_edge=pre_generic_long_edge, pre_generic_jpeg_q=pre_generic_jpeg_q,
+        )
+        preset_name, qim_val, rep_val, ecc_par, use_y = (
+            ep["preset_name"], ep["qim_step"], ep["repetition"], ep["ecc_parity_bytes"], ep["use_y_channel"])
+        long_edge, jpeg_q = ep["long_edge"], ep["jpeg_quality"]
 
         # --- Optional PGP verification (not embedded)
         pgp_fpr = None
@@ -206,29 +339,21 @@ async def watermark_image(
             pgp_fpr = key_fingerprint(pgp_public_key)
 
         # --- Payload = ECC(SHA256(text)) for robustness
-        sha32 = hashlib.sha256(text.encode("utf-8")).digest()
-        payload_bytes = ecc_encode_sha256(sha32, parity_bytes=ecc_par) if use_ecc else sha32
-        payload_bits = np.unpackbits(np.frombuffer(payload_bytes, dtype=np.uint8)).astype(np.uint8)
-
-        # --- Embed
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp_work:
-            save_color_bgr_uint8(tmp_work.name, work_bgr)
-            work_in_path = Path(tmp_work.name)
+        payload_bits = build_image_payload_bits(text, use_ecc, ecc_par)
 
+        # --- Preprocess + embed + metrics on the compute pool (load, preprocess, embed, reload)
         out_path = DATA_DIR / f"wm_{tmp_in_path.stem}.png"
-        cfg = DCTConfig(qim_step=float(qim_val), repetition=int(rep_val))
-        if use_y:
-            embed_dct_image_ychannel(str(work_in_path), str(out_path), payload_bits, cfg)
-        else:
-            embed_dct_image(str(work_in_path), str(out_path), payload_bits, cfg)
-
-        out_bgr = load_color_bgr_float32(str(out_path))
-        psnr_y = psnr(bgr_to_ycbcr(work_bgr)[0], bgr_to_ycbcr(out_bgr)[0])
-        ssim_y_val = ssim_y(work_bgr, out_bgr)
-
-        # Cleanup temps
-        tmp_in_path.unlink(missing_ok=True)
-        work_in_path.unlink(missing_ok=True)
+        try:
+            metrics = await run_compute(
+                embed_image_file, str(tmp_in_path), str(out_path), payload_bits,
+                qim_step=float(qim_val), repetition=int(rep_val), use_y_channel=use_y,
+                long_edge=long_edge, jpeg_quality=jpeg_q,
+                cost=image_cost(str(tmp_in_path), passes=4),
+            )
+        finally:
+            tmp_in_path.unlink(missing_ok=True)
+        psnr_y = metrics["psnr_y"]
+        ssim_y_val = metrics["ssim_y"]
 
         headers = {
             "X-PSNR-Y": f"{psnr_y:.3f}",
@@ -247,50 +372,26 @@ async def watermark_image(
             "X-Payload-Bits": str((32 + int(ecc_par if use_ecc else 0)) * 8),
         }
 
-        filehash = hashlib.sha256(open(str(out_path), "rb").read()).hexdigest()
-
-        params_dict = {
-            "profile": profile or "custom",
-            "preset": preset_name or "custom",
-            "pre_generic": bool(pre_generic),
-            "pre_long_edge": long_edge,
-            "pre_jpeg_q": jpeg_q,
-            "qim_step": float(qim_val),
-            "repetition": int(rep_val),
-            "use_ecc": bool(use_ecc),
-            "ecc_parity_bytes": int(ecc_par if use_ecc else 0),
-            "use_y_channel": bool(use_y),
-            "psnr_y": float(psnr_y),
-            "ssim_y": float(ssim_y_val),
-        }
+        filehash = await run_in_threadpool(sha256_file, str(out_path))
 
-        crud.create_media_asset(
+        params_dict = asset_params(ep, text=text, profile=profile, pre_generic=pre_generic, use_ecc=use_ecc,
+                                   psnr_y=psnr_y, ssim_y=ssim_y_val)
+
+        asset = crud.create_media_asset(
             db=db,
             user_id=None,
-            original_filename=Path(file.filename or "upload").name,
+            original_filename=Path(upload.filename or "upload").name,
             stored_path=str(out_path),
             sha256_hex=filehash,
             pgp_fingerprint=pgp_fpr,
             pgp_signature_armored=pgp_signature if (pgp_public_key and pgp_signature) else None,
             params=params_dict
         )
+        crud.create_asset_fingerprint(db, asset.id, metrics["phash"], metrics["dhash"])
 
         # -------- Auto-register owner/media id (idempotent) --------
         if auto_register_media:
-            owner_sha = None
-            media_id = None
-
-            m = _CLAIM_RE.fullmatch(text.strip())
-            if m:
-                owner_sha = m.group(1)
-                media_id = m.group(2)
-            else:
-                # fall back to explicit overrides
-                if override_owner_email_sha:
-                    owner_sha = _hex64(override_owner_email_sha)
-                if override_media_id:
-                    media_id = _hex64(override_media_id)
-
+            owner_sha, media_id = claim_owner_media(text, override_owner_email_sha, override_media_id)
             if owner_sha and media_id:
                 register_media_id(
                     db,
@@ -317,27 +418,125 @@ async def extract_image(
     use_y_channel: bool = Form(False),
     use_ecc: bool = Form(True),
     ecc_parity_bytes: int = Form(24),
+    response: Response = None,
+    db: Session = Depends(get_db),
 ):
+    upload = await ingest_upload(file, max_bytes=settings.upload_max_image_bytes, default_suffix=".png")
+    return await _extract_image(
+        upload, payload_bitlen=payload_bitlen, qim_step=qim_step, repetition=repetition,
+        check_text=check_text, use_y_channel=use_y_channel, use_ecc=use_ecc, ecc_parity_bytes=ecc_parity_bytes,
+        db=db, response=response,
+    )
+
+@router.post("/image/extract/raw", response_model=ExtractResponse, openapi_extra=RAW_BODY_OPENAPI)
+async def extract_image_raw(
+    request: Request,
+    payload_bitlen: Optional[int] = Query(None),
+    qim_step: float = Query(8.0),
+    repetition: int = Query(20),
+    check_text: Optional[str] = Query(None),
+    use_y_channel: bool = Query(False),
+    use_ecc: bool = Query(True),
+    ecc_parity_bytes: int = Query(24),
+    response: Response = None,
+    db: Session = Depends(get_db),
+):
+    """Raw-body (application/octet-stream) variant of POST /image/extract; parameters in the query string."""
+    upload = await ingest_request(request, max_bytes=settings.upload_max_image_bytes, default_suffix=".png")
+    return await _extract_image(
+        upload, payload_bitlen=payload_bitlen, qim_step=qim_step, repetition=repetition,
+        check_text=check_text, use_y_channel=use_y_channel, use_ecc=use_ecc, ecc_parity_bytes=ecc_parity_bytes,
+        db=db, response=response,
+    )
+
+async def _extract_image(
+    upload: IngestedUpload,
+    *,
+    payload_bitlen: Optional[int],
+    qim_step: float,
+    repetition: int,
+    check_text: Optional[str],
+    use_y_channel: bool,
+    use_ecc: bool,
+    ecc_parity_bytes: int,
+    db: Session,
+    response: Optional[Response] = None,
+) -> ExtractResponse:
+    params = {"payload_bitlen": payload_bitlen, "qim_step": qim_step, "repetition": repetition,
+              "check_text": check_text, "use_y_channel": use_y_channel, "use_ecc": use_ecc,
+              "ecc_parity_bytes": ecc_parity_bytes}
+    try:
+        # nearest_claim (ECC failures) depends on every registered media_id: key on the registry version
+        return await cached_result(
+            response, ExtractResponse, "image-extract", upload.sha256_hex, params,
+            lambda: _extract_image_uncached(upload, db, **params),
+            catalog_version=crud.registry_catalog_version(db) if use_ecc else None,
+        )
+    finally:
+        upload.unlink()
+
+
+def _same_decode(stored: Dict[str, Any], *, payload_bitlen: int, qim_step: float, repetition: int,
+                 use_y_channel: bool, use_ecc: bool, ecc_parity_bytes: int) -> bool:
+    """Whether an extract with these params reads back exactly the payload stored for an asset."""
+    stored_ecc = bool(stored.get("use_ecc"))
+    stored_bits = (32 + int(stored.get("ecc_parity_bytes") or 0)) * 8 if stored_ecc else 256
+    return (stored_ecc == bool(use_ecc)
+            and (not use_ecc or int(stored.get("ecc_parity_bytes") or 0) == int(ecc_parity_bytes))
+            and stored_bits == int(payload_bitlen)
+            and int(stored.get("repetition") or 0) == int(repetition)
+            and float(stored.get("qim_step") or 0.0) == float(qim_step)
+            and bool(stored.get("use_y_channel")) == bool(use_y_channel))
+
+
+async def _extract_image_uncached(
+    upload: IngestedUpload,
+    db: Session,
+    *,
+    payload_bitlen: Optional[int],
+    qim_step: float,
+    repetition: int,
+    check_text: Optional[str],
+    use_y_channel: bool,
+    use_ecc: bool,
+    ecc_parity_bytes: int,
+) -> ExtractResponse:
     try:
-        suffix = Path(file.filename).suffix or ".png"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_in:
-            tmp_in.write(await file.read())
-            tmp_in_path = Path(tmp_in.name)
+        tmp_in_path = upload.path
+        asset = crud.get_media_asset_by_sha256(db, upload.sha256_hex)
+        stored = (asset.params or {}) if asset is not None else {}
+        if asset is not None and not stored.get("claim_sha256"):
+            asset, stored = None, {}
 
         if use_ecc and (payload_bitlen is None):
             payload_bitlen = (32 + ecc_parity_bytes) * 8
         elif payload_bitlen is None:
             payload_bitlen = 256
 
-        cfg = DCTConfig(qim_step=qim_step, repetition=repetition)
-        if use_y_channel:
-            recovered_bits = extract_dct_image_ychannel(str(tmp_in_path), payload_bitlen, cfg)
+        if stored and _same_decode(stored, payload_bitlen=payload_bitlen, qim_step=qim_step,
+                                   repetition=repetition, use_y_channel=use_y_channel,
+                                   use_ecc=use_ecc, ecc_parity_bytes=ecc_parity_bytes):
+            # byte-identical to one of our outputs, read back with its own params:
+            # the payload is the stored claim, no decoding
+            claim32 = bytes.fromhex(stored["claim_sha256"])
+            payload = ecc_encode_sha256(claim32, parity_bytes=ecc_parity_bytes) if use_ecc else claim32
+            recovered_bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8)).astype(np.uint8)
+            confidence = None
+            used_repetition = repetition
+            tmp_in_path.unlink(missing_ok=True)
         else:
-            recovered_bits = extract_dct_image(str(tmp_in_path), payload_bitlen, cfg)
-
-        tmp_in_path.unlink(missing_ok=True)
+            try:
+                scores, counts = await run_compute(
+                    extract_image_soft_file, str(tmp_in_path), payload_bitlen,
+                    qim_step=qim_step, repetition=repetition, use_y_channel=use_y_channel,
+                    cost=image_cost(str(tmp_in_path)),
+                )
+            finally:
+                tmp_in_path.unlink(missing_ok=True)
+            recovered_bits = soft_to_bits(scores)
+            confidence = soft_confidence(scores, counts, qim_step)
 
-        used_repetition = repetition
+            used_repetition = repetition
         recovered_bytes = bits_to_bytes(recovered_bits)
         recovered_hex = hashlib.sha256(recovered_bytes).hexdigest()
 
@@ -345,9 +544,14 @@ async def extract_image(
         match_text_hash = None
         ecc_ok = None
 
+        nearest = None
         if use_ecc:
             orig32, ok = ecc_decode_to_sha256(recovered_bytes, parity_bytes=ecc_parity_bytes)
             ecc_ok = bool(ok)
+            if not ok:
+                # RS gave up: report the nearest registered claim, unless that is likely chance
+                nearest = await run_in_threadpool(nearest_codeword, recovered_bits, ecc_parity_bytes,
+                                                  None, settings.codeword_fallback_max_fp)
 
             if check_text:
                 want32 = hashlib.sha256(check_text.encode("utf-8")).digest()
@@ -370,6 +574,12 @@ async def extract_image(
             ecc_ok=ecc_ok,
             match_text_hash=match_text_hash,
             used_repetition=used_repetition,
+            mean_confidence=float(confidence.mean()) if confidence is not None and len(confidence) else None,
+            bit_confidence=[round(float(c), 4) for c in confidence] if confidence is not None else None,
+            exact_match=asset is not None,
+            asset_id=asset.id if asset is not None else None,
+            asset_params=stored or None,
+            nearest_claim=nearest,
         )
     except HTTPException:
         raise
@@ -55,6 +55,78 @@ class Settings(BaseSettings):
     proof_contract_v2_abi_path: str | None = None
     proof_contract_address: str | None = None  # legacy v1
 
+    # --- Compute pool (CPU-bound work behind the async routes) ---
+    compute_workers: int = Field(
+        default=0, description="Worker processes (0 = one per CPU)"
+    )
+    compute_threads_per_worker: int = Field(
+        default=1, description="cv2 / BLAS threads inside each worker"
+    )
+    compute_queue_max: int = Field(
+        default=16, description="Jobs waiting beyond the running ones before 429"
+    )
+    compute_max_pending_mpx: float = Field(
+        default=20000.0, description="Admitted work (megapixel passes) before 503"
+    )
+    compute_mpx_per_s: float = Field(
+        default=40.0, description="Initial per-worker throughput guess for Retry-After"
+    )
+
+    # --- Result cache (verify / extract responses by upload hash) ---
+    result_cache_enabled: bool = Field(
+        default=True, description="Serve repeated verify/extract requests from the result cache"
+    )
+    result_cache_ttl_s: float = Field(
+        default=7 * 24 * 3600, description="Lifetime of a cached result (both tiers)"
+    )
+    result_cache_memory_items: int = Field(
+        default=4096, description="Entries kept in the in-process LRU tier"
+    )
+
+    # --- Near-duplicate index (perceptual hashes of image assets) ---
+    fingerprint_max_distance: int = Field(
+        default=10, description="pHash/dHash bits a copy may differ from its asset (-1 disables the lookup)"
+    )
+
+    # --- Nearest-codeword fallback (RS decoding failed) ---
+    codeword_fallback_max_fp: float = Field(
+        default=1e-6, description="Accept the nearest registered codeword up to this false-positive probability (0 disables)"
+    )
+
+    # --- Video processing ---
+    video_job_workers: int = Field(
+        default=1, description="Background threads draining the async video job queue"
+    )
+    video_job_queue_max: int = Field(
+        default=16, description="Queued + running video jobs before submit returns 429"
+    )
+    video_job_dir: str = Field(
+        default="uploads/video_jobs", description="Where job inputs/outputs are kept"
+    )
+    video_job_lease_s: float = Field(
+        default=60.0, description="A running job whose runner stopped renewing its lease this long ago is re-queued"
+    )
+    video_job_retention_s: float = Field(
+        default=86400.0, description="Directories of finished jobs are removed this long after they finish (0 keeps them)"
+    )
+
+    # --- Uploads ---
+    upload_chunk_bytes: int = Field(
+        default=1 << 20, description="Chunk size when streaming uploads to disk"
+    )
+    upload_max_image_bytes: int = Field(
+        default=50 << 20, description="Largest accepted image upload (413 above)"
+    )
+    upload_max_video_bytes: int = Field(
+        default=2 << 30, description="Largest accepted video upload (413 above)"
+    )
+    upload_max_batch_bytes: int = Field(
+        default=1 << 30, description="Largest accepted batch upload, all files or the ZIP (413 above)"
+    )
+    batch_max_items: int = Field(
+        default=1000, description="Most manifest items one /watermark/image/batch call may embed"
+    )
+
     # Optional: convenience to resolve paths
     def resolve_path(self, p: str | None) -> str | None:
         if not p:
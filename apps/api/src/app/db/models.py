@@ -93,6 +93,23 @@ class MediaAsset(Base):
     user: Mapped["User"] = relationship("User", back_populates="assets")
 
 
+class AssetFingerprint(Base):
+    """
+    Perceptual hashes (64-bit, hex) of an image asset's preprocessed luma,
+    written at embed time. Loaded incrementally (by id) into the in-memory
+    near-duplicate index of services/fingerprint_index.py.
+    """
+    __tablename__ = "asset_fingerprints"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    asset_id: Mapped[int] = mapped_column(
+        ForeignKey("media_assets.id", ondelete="CASCADE"), nullable=False, unique=True, index=True
+    )
+    phash: Mapped[str] = mapped_column(String(16), nullable=False)
+    dhash: Mapped[str] = mapped_column(String(16), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
 # ------------------------
 # Media IDs (owner + media)
 # ------------------------
@@ -115,3 +132,65 @@ class MediaId(Base):
         Index("ix_media_ids_user", "user_uuid"),
     )
 
+
+
+# ------------------------------
+# Verification result cache
+# ------------------------------
+class OwnerCatalog(Base):
+    """Per-owner version, bumped whenever the owner's media_ids change; part of every cache key."""
+    __tablename__ = "owner_catalogs"
+
+    owner_email_sha: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ResultCacheEntry(Base):
+    """Persistent tier of services/result_cache.py: a route response keyed by upload hash + params."""
+    __tablename__ = "result_cache"
+
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)       # sha256 of the key parts
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)         # verify-auto | image-extract
+    owner_email_sha: Mapped[str | None] = mapped_column(String(64), nullable=True, index=True)
+    value: Mapped[dict] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+
+
+# ------------------------------
+# Async video jobs (persistent queue)
+# ------------------------------
+class VideoJob(Base):
+    __tablename__ = "video_jobs"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)            # embed | extract
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="queued", index=True)
+    # queued -> running -> done | failed | cancelled
+
+    original_filename: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    input_path: Mapped[str] = mapped_column(String(1024), nullable=False)
+    output_path: Mapped[str | None] = mapped_column(String(1024), nullable=True)
+
+    params: Mapped[dict | None] = mapped_column(JSON, nullable=True)         # form fields as submitted
+    result: Mapped[dict | None] = mapped_column(JSON, nullable=True)         # extract JSON / embed headers
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class VideoJobLease(Base):
+    """
+    Which runner process holds a running video job. The holder renews
+    heartbeat_at while the job runs; a lease that stops being renewed lets any
+    runner re-queue the job (services/watermarking/video_jobs.py).
+    """
+    __tablename__ = "video_job_leases"
+
+    job_id: Mapped[str] = mapped_column(ForeignKey("video_jobs.id", ondelete="CASCADE"), primary_key=True)
+    owner: Mapped[str] = mapped_column(String(255), nullable=False)           # host:pid
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
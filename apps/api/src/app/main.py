@@ -35,6 +35,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 413 for oversized uploads before the multipart parser spools them
+from app.services.uploads import UploadLimitMiddleware
+app.add_middleware(UploadLimitMiddleware)
+
 # mount routers under your configured API prefix
 app.include_router(root_router, prefix=settings.api_prefix)
 app.include_router(upload_router, prefix=settings.api_prefix)
@@ -107,6 +111,19 @@ app.include_router(video_router, prefix="/api")
 
 app.include_router(video_router, prefix=settings.api_prefix)
 
+from app.api.routes.image_batch import router as image_batch_router
+app.include_router(image_batch_router, prefix=settings.api_prefix)
+
+from app.api.routes.video_jobs import router as video_jobs_router
+from app.services.watermarking.video_jobs import get_video_job_runner
+app.include_router(video_jobs_router, prefix=settings.api_prefix)
+
+
+@app.on_event("startup")
+def _start_video_jobs() -> None:
+    # re-queue jobs persisted by a previous process
+    get_video_job_runner().start()
+
 from app.api.routes.registry import router as registry_router
 app.include_router(registry_router, prefix="/api")
 
@@ -0,0 +1,280 @@
+# apps/api/src/app/services/codeword_index.py
+from __future__ import annotations
+
+import hashlib
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.session import SessionLocal
+from app.services.db import crud
+from app.services.fingerprint_index import popcount
+from src.app.services.watermarking.ecc import ecc_encode_sha256_many
+
+# Row sets up to this size are scanned in full; bigger ones are pruned first.
+_BRUTE_MAX_ROWS = 1 << 18
+# Codeword bytes covered by the inverted index (the 32 SHA-256 bytes).
+_INDEX_BYTES = 32
+# Rows per XOR + popcount block while scanning (bounds the temporaries).
+_SCAN_ROWS = 1 << 15
+
+
+def false_positive_probability(distance: int, nbits: int, population: int) -> float:
+    """
+    Chance that bits unrelated to any claim (each bit a fair coin) land
+    within `distance` of at least one of `population` codewords of `nbits`:
+    1 - (1 - P[Binomial(nbits, 1/2) <= distance]) ** population.
+    """
+    if nbits <= 0 or population <= 0:
+        return 1.0
+    tail = sum(math.comb(nbits, k) for k in range(max(0, distance) + 1)) / (1 << nbits)
+    if tail >= 1.0:
+        return 1.0
+    return float(-math.expm1(population * math.log1p(-tail)))
+
+
+def _claim_digests(owner: str, media_hex: str) -> List[bytes]:
+    """SHA256 of both claim spellings, as the image embedder hashes them."""
+    return [hashlib.sha256(f"owner:{owner}|media:{m}".encode("utf-8")).digest()
+            for m in (media_hex, f"0x{media_hex}")]
+
+
+class CodewordIndex:
+    """
+    Expected ECC codeword (SHA256(claim) + RS parity) of every registered
+    claim for one parity size, as a packed bit matrix (one uint8 row per claim
+    spelling), for a nearest-codeword search when RS decoding gives up.
+
+    A search scans its rows with a vectorized XOR + popcount. Above
+    _BRUTE_MAX_ROWS it first prunes with an inverted index over the codeword's
+    first 32 bytes: only rows sharing at least one byte (same value, same
+    position) with the query are scanned. At a 20% bit error rate a byte
+    survives with p = 0.8^8 = 0.17, so the right row is missed with p =
+    0.83^32 = 0.3%; an unrelated row is kept with p = 1 - (255/256)^32 = 12%.
+
+    sync() follows the registry's catalog version: when it moves, rows whose
+    media_id was revoked or deleted are dropped and reactivated ones reloaded.
+    """
+
+    def __init__(self, parity_bytes: int):
+        self.parity_bytes = int(parity_bytes)
+        self.nbytes = 32 + self.parity_bytes
+        self._rows = np.empty((0, self.nbytes), dtype=np.uint8)
+        self._row_owner = np.empty(0, dtype=np.int32)
+        self._row_media = np.empty((0, 32), dtype=np.uint8)
+        self._row_dbid = np.empty(0, dtype=np.int64)   # MediaId.id per row (-1 when added directly)
+        self._owners: List[str] = []
+        self._owner_ix: Dict[str, int] = {}
+        self._owner_rows: Dict[int, np.ndarray] = {}   # owner index -> its row numbers
+        # inverted index over the merged rows: per byte position, rows grouped by byte value
+        self._postings: List[np.ndarray] = []      # row numbers, sorted by byte value
+        self._offsets: List[np.ndarray] = []       # 257 offsets into the matching postings
+        self._indexed = 0                          # rows [0, _indexed) are in the postings
+        self._last_id = 0
+        self._version: Optional[int] = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ---------- build ----------
+    def add(self, claims: Iterable[tuple[str, str]], row_ids: Optional[Sequence[int]] = None) -> int:
+        """
+        Append (owner_email_sha, 64-hex media_id) claims, optionally with their
+        MediaId.id (so sync() can drop them later); returns rows added.
+        """
+        owners, medias, digests, dbids = [], [], [], []
+        for k, (owner, media_hex) in enumerate(claims):
+            for digest in _claim_digests(owner, media_hex):
+                owners.append(owner)
+                medias.append(bytes.fromhex(media_hex))
+                digests.append(digest)
+                dbids.append(row_ids[k] if row_ids is not None else -1)
+        if not digests:
+            return 0
+        codewords = ecc_encode_sha256_many(
+            np.frombuffer(b"".join(digests), dtype=np.uint8).reshape(-1, 32), self.parity_bytes)
+        with self._lock:
+            owner_ix = np.empty(len(owners), dtype=np.int32)
+            for k, owner in enumerate(owners):
+                ix = self._owner_ix.get(owner)
+                if ix is None:
+                    ix = self._owner_ix[owner] = len(self._owners)
+                    self._owners.append(owner)
+                owner_ix[k] = ix
+            start = len(self._rows)
+            self._rows = np.concatenate([self._rows, codewords])
+            self._row_owner = np.concatenate([self._row_owner, owner_ix])
+            self._row_media = np.concatenate(
+                [self._row_media, np.frombuffer(b"".join(medias), dtype=np.uint8).reshape(-1, 32)])
+            self._row_dbid = np.concatenate([self._row_dbid, np.array(dbids, dtype=np.int64)])
+            for ix, rows in _group_rows(owner_ix, start).items():
+                have = self._owner_rows.get(ix)
+                self._owner_rows[ix] = rows if have is None else np.concatenate([have, rows])
+            if len(self._rows) - self._indexed > max(4096, self._indexed // 8):
+                self._reindex()
+        return len(digests)
+
+    def _keep(self, mask: np.ndarray) -> None:
+        """Drop the rows where `mask` is False (under _lock)."""
+        self._rows = self._rows[mask]
+        self._row_owner = self._row_owner[mask]
+        self._row_media = self._row_media[mask]
+        self._row_dbid = self._row_dbid[mask]
+        self._owner_rows = _group_rows(self._row_owner, 0)
+        self._reindex()
+
+    def _reindex(self) -> None:
+        self._postings, self._offsets = [], []
+        for j in range(_INDEX_BYTES):
+            col = self._rows[:, j]
+            self._postings.append(np.argsort(col, kind="stable").astype(np.int32))
+            self._offsets.append(np.concatenate([[0], np.cumsum(np.bincount(col, minlength=256))]))
+        self._indexed = len(self._rows)
+
+    def sync(self, db: Session) -> int:
+        """
+        Load active MediaId rows added since the last sync. When the registry
+        catalog version moved, also drop rows that are no longer active and
+        reload active ones not held (reactivated). Returns rows added.
+        """
+        with self._sync_lock:
+            return self._sync(db)
+
+    def _sync(self, db: Session) -> int:
+        version = crud.registry_catalog_version(db)
+        q = db.query(models.MediaId.id, models.MediaId.owner_email_sha, models.MediaId.media_id).filter(
+            models.MediaId.active.is_(True))
+        if version != self._version and self._version is not None:
+            active = np.array([i for (i,) in db.query(models.MediaId.id).filter(
+                models.MediaId.active.is_(True))], dtype=np.int64)
+            with self._lock:
+                held = self._row_dbid
+                alive = (held < 0) | np.isin(held, active)
+                if not alive.all():
+                    self._keep(alive)
+                missing = np.setdiff1d(active[active <= self._last_id], self._row_dbid)
+            rows = q.filter(models.MediaId.id > self._last_id).order_by(models.MediaId.id).all()
+            for i in range(0, len(missing), 500):
+                rows += q.filter(models.MediaId.id.in_(missing[i:i + 500].tolist())).all()
+        else:
+            rows = q.filter(models.MediaId.id > self._last_id).order_by(models.MediaId.id).all()
+        self._version = version
+        claims, ids = [], []
+        for row_id, owner, media_id in rows:
+            m = (media_id or "").strip().lower().removeprefix("0x")
+            if len(m) == 64:
+                try:
+                    bytes.fromhex(m)
+                except ValueError:
+                    continue
+                claims.append(((owner or "").strip().lower(), m))
+                ids.append(row_id)
+        added = self.add(claims, ids)
+        if rows:
+            self._last_id = max(self._last_id, max(r[0] for r in rows))
+        return added
+
+    # ---------- search ----------
+    def _candidates(self, query: np.ndarray) -> np.ndarray:
+        """Rows sharing at least one indexed byte with `query`, plus every row not yet indexed."""
+        hits = []
+        for j in range(min(_INDEX_BYTES, len(query))):
+            v = int(query[j])
+            off = self._offsets[j]
+            hits.append(self._postings[j][off[v]:off[v + 1]])
+        cand = np.unique(np.concatenate(hits)) if hits else np.empty(0, dtype=np.int32)
+        return np.concatenate([cand, np.arange(self._indexed, len(self._rows), dtype=np.int32)])
+
+    def nearest(self, bits: np.ndarray, owner_email_sha: Optional[str] = None,
+                limit: int = 1) -> List[Dict[str, Any]]:
+        """
+        Closest codewords to recovered `bits` (over the first min(len(bits),
+        codeword length) bits), optionally among one owner's claims only. Each
+        hit: {owner_email_sha, media_id, distance, similarity, compared_bits,
+        false_positive_p}, where false_positive_p accounts for every row the
+        owner scope could have matched.
+        """
+        nbits = min(len(bits), self.nbytes * 8) // 8 * 8
+        if nbits == 0:
+            return []
+        query = np.packbits(np.asarray(bits[:nbits], dtype=np.uint8))
+        with self._lock:
+            if owner_email_sha is not None:
+                ix = self._owner_ix.get(owner_email_sha.strip().lower(), -1)
+                scope = self._owner_rows.get(ix, np.empty(0, dtype=np.int64))
+                cand = scope
+            else:
+                scope = None
+                cand = (np.arange(len(self._rows)) if len(self._rows) <= _BRUTE_MAX_ROWS or not self._indexed
+                        else self._candidates(query))
+            population = len(self._rows) if scope is None else len(scope)
+            rows, row_owner, row_media = self._rows, self._row_owner, self._row_media   # replaced, never mutated
+        if not len(cand):
+            return []
+        dist = np.concatenate([
+            popcount(rows[cand[i:i + _SCAN_ROWS], :len(query)] ^ query).sum(axis=1)
+            for i in range(0, len(cand), _SCAN_ROWS)
+        ])
+        order = np.argsort(dist, kind="stable")
+        out, seen = [], set()
+        for k in order:
+            row = cand[k]
+            key = (int(row_owner[row]), row_media[row].tobytes())
+            if key in seen:      # the other spelling of a claim already listed
+                continue
+            seen.add(key)
+            d = int(dist[k])
+            out.append({
+                "owner_email_sha": self._owners[key[0]],
+                "media_id": key[1].hex(),
+                "distance": d,
+                "similarity": 1.0 - d / nbits,
+                "compared_bits": nbits,
+                "false_positive_p": false_positive_probability(d, nbits, population),
+            })
+            if len(out) >= limit:
+                break
+        return out
+
+
+def _group_rows(row_owner: np.ndarray, start: int) -> Dict[int, np.ndarray]:
+    """Row numbers (offset by `start`) per owner index in `row_owner`."""
+    order = np.argsort(row_owner, kind="stable")
+    owners, first = np.unique(row_owner[order], return_index=True)
+    return {int(ix): rows + start for ix, rows in zip(owners, np.split(order, first[1:]))}
+
+
+_indexes: Dict[int, CodewordIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_codeword_index(parity_bytes: int) -> CodewordIndex:
+    with _indexes_lock:
+        index = _indexes.get(int(parity_bytes))
+        if index is None:
+            index = _indexes[int(parity_bytes)] = CodewordIndex(parity_bytes)
+        return index
+
+
+def nearest_codeword(bits: np.ndarray, parity_bytes: int, owner_email_sha: Optional[str] = None,
+                     max_false_positive: float = 1e-6) -> Optional[Dict[str, Any]]:
+    """
+    The registered claim whose codeword is nearest to `bits`, if its
+    false_positive_p is at most max_false_positive; else None. Syncs the
+    index with media_ids first (sync DB work: call from a thread).
+    """
+    if max_false_positive <= 0 or not 2 <= parity_bytes <= 64:
+        return None
+    index = get_codeword_index(parity_bytes)
+    with SessionLocal() as db:
+        index.sync(db)
+    hits = index.nearest(bits, owner_email_sha)
+    if hits and hits[0]["false_positive_p"] <= max_false_positive:
+        return hits[0]
+    return None
@@ -0,0 +1,392 @@
+# apps/api/src/app/services/compute.py
+from __future__ import annotations
+
+import asyncio
+import functools
+import importlib
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+# Thread-count knobs of the BLAS / OpenMP runtimes numpy and OpenCV may link.
+_THREAD_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+               "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+# Imported once per worker at start-up so the first job doesn't pay for them.
+_WARM_MODULES = (
+    "numpy", "cv2", "reedsolo",
+    "src.app.services.watermarking.image_service",
+    "src.app.services.watermarking.video_service",
+)
+
+
+class ComputeOverloaded(HTTPException):
+    """
+    Admission refused: 429 when the queue is full, 503 when the work already
+    admitted would take too long to drain. Retry-After is the estimated drain time.
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+
+class ComputeCancelled(Exception):
+    """Raised inside a job by its ProgressRelay once the caller cancelled it."""
+
+
+class ProgressRelay:
+    """
+    Picklable progress callback for a compute job. Events the job reports in
+    its worker process are queued back to the caller (drain()); once the
+    caller calls cancel(), the job's next report raises ComputeCancelled.
+    """
+
+    def __init__(self, events: Any, cancelled: Any):
+        self._events = events          # manager Queue / Event proxies
+        self._cancelled = cancelled
+
+    def __call__(self, event: Dict[str, Any]) -> None:
+        self._events.put(event)
+        if self._cancelled.is_set():
+            raise ComputeCancelled()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def drain(self, timeout: float) -> List[Dict[str, Any]]:
+        """Events reported so far, waiting up to `timeout` seconds for the first one."""
+        out: List[Dict[str, Any]] = []
+        try:
+            out.append(self._events.get(timeout=timeout) if timeout > 0 else self._events.get_nowait())
+            while True:
+                out.append(self._events.get_nowait())
+        except queue.Empty:
+            pass
+        return out
+
+
+def _init_worker(threads: int) -> None:
+    """
+    Pool initializer: pin library threading, then warm the heavy imports.
+    Workers are spawned, not forked, and this module doesn't import numpy, so
+    the env vars are in place before any BLAS / OpenMP runtime loads.
+    """
+    for var in _THREAD_ENV:
+        os.environ[var] = str(threads)
+    try:   # optional; also caps runtimes a job's imports loaded some other way
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+    import cv2
+    cv2.setNumThreads(threads)
+    for name in _WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+class ComputeExecutor:
+    """
+    Process pool for the CPU-bound work behind the async routes, so the event
+    loop only ever awaits it. Each job carries an estimated cost in megapixel
+    passes (pixels x operations / 1e6). Admission is bounded twice: by the
+    number of jobs in flight (workers + queue_max, else 429) and by the cost
+    they add up to (max_cost, else 503). A job is always admitted when the
+    pool is idle, whatever its cost.
+    """
+
+    def __init__(self, workers: int, threads_per_worker: int, queue_max: int,
+                 max_cost: float, mpix_per_s: float):
+        self.workers = max(1, int(workers))
+        self.threads_per_worker = max(1, int(threads_per_worker))
+        self.queue_max = max(0, int(queue_max))
+        self.max_cost = float(max_cost)
+        self._rate = float(mpix_per_s)      # per worker; EWMA of completed jobs
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager: Any = None           # serves ProgressRelay queues, started on first use
+        self._inflight = 0
+        self._cost = 0.0
+
+    # ---------- pool ----------
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(self.threads_per_worker,),
+                )
+            return self._pool
+
+    def _reset_pool(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+            manager, self._manager = self._manager, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
+    def relay(self) -> ProgressRelay:
+        """A fresh ProgressRelay to pass to a job as its progress callback."""
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.get_context("spawn").Manager()
+            manager = self._manager
+        return ProgressRelay(manager.Queue(), manager.Event())
+
+    # ---------- admission ----------
+    def retry_after(self, extra_cost: float = 0.0) -> int:
+        """Seconds until the admitted work (plus extra_cost) should have drained."""
+        with self._lock:
+            pending = self._cost + extra_cost
+        return int(min(300, max(1, math.ceil(pending / (self._rate * self.workers)))))
+
+    def _admit(self, cost: float) -> None:
+        with self._lock:
+            inflight, pending = self._inflight, self._cost
+            if inflight >= self.workers + self.queue_max:
+                status, detail = 429, f"Compute queue full ({inflight} jobs in flight)"
+            elif inflight and pending + cost > self.max_cost:
+                status, detail = 503, f"Compute pool saturated ({pending:.0f} + {cost:.0f} > {self.max_cost:.0f} Mpx)"
+            else:
+                self._inflight += 1
+                self._cost += cost
+                return
+        raise ComputeOverloaded(status, detail, self.retry_after(cost))
+
+    def _release(self, cost: float, started: float, fut: Future) -> None:
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._inflight -= 1
+            self._cost = max(0.0, self._cost - cost)
+            if cost > 0 and elapsed > 0 and not fut.cancelled() and fut.exception() is None:
+                # elapsed includes queueing, so this errs towards longer Retry-After
+                self._rate = 0.8 * self._rate + 0.2 * (cost / elapsed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "inflight": self._inflight, "queue_max": self.queue_max,
+                    "pending_mpx": round(self._cost, 1), "max_mpx": self.max_cost,
+                    "mpx_per_s": round(self._rate, 2)}
+
+    # ---------- submit ----------
+    def submit(self, fn: Callable[..., Any], *args: Any, cost: float = 1.0, **kwargs: Any) -> Future:
+        """
+        Admit fn(*args, **kwargs) and queue it on the pool; returns its Future.
+        fn and its arguments must be picklable (module-level functions, paths,
+        plain values). Raises ComputeOverloaded if the job isn't admitted.
+        """
+        cost = max(0.0, float(cost))
+        self._admit(cost)
+        started = time.perf_counter()
+        try:
+            fut = self._get_pool().submit(functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            with self._lock:
+                self._inflight -= 1
+                self._cost = max(0.0, self._cost - cost)
+            raise
+        # released when the worker finishes, even if the caller goes away first
+        fut.add_done_callback(functools.partial(self._release, cost, started))
+        return fut
+
+    def _worker_died(self) -> HTTPException:
+        self._reset_pool()
+        return HTTPException(status_code=503, detail="Compute worker died; retry", headers={"Retry-After": "1"})
+
+    async def wait(self, fut: Future) -> Any:
+        """Await a Future from submit() without blocking the event loop."""
+        try:
+            return await asyncio.wrap_future(fut)
+        except BrokenProcessPool:
+            raise self._worker_died()
+
+    async def run(self, fn: Callable[..., Any], *args: Any, cost: float = 1.0, **kwargs: Any) -> Any:
+        """submit() and await the result."""
+        return await self.wait(self.submit(fn, *args, cost=cost, **kwargs))
+
+    def call(self, fn: Callable[..., Any], *args: Any, cost: float = 1.0,
+             progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+             wait: bool = False, **kwargs: Any) -> Any:
+        """
+        Blocking run() for code on worker threads (the video job runner,
+        run_in_threadpool bodies). With wait=True a job turned away by
+        admission waits out its Retry-After and tries again. With `progress`,
+        fn gets a ProgressRelay as its progress= argument and every event it
+        reports is passed to `progress` here (also a {"stage": "queued"} one
+        per admission retry); if `progress` raises, the job is cancelled at its
+        next report and the exception is re-raised once the job has ended.
+        """
+        relay = self.relay() if progress is not None else None
+        if relay is not None:
+            kwargs["progress"] = relay
+        while True:
+            try:
+                fut = self.submit(fn, *args, cost=cost, **kwargs)
+                break
+            except ComputeOverloaded as e:
+                if not wait:
+                    raise
+                if progress is not None:
+                    progress({"stage": "queued", "retry_after_s": e.retry_after})
+                time.sleep(e.retry_after)
+
+        error: Optional[BaseException] = None
+        while relay is not None:
+            done = fut.done()   # checked first, so nothing reported before the end is lost
+            for event in relay.drain(0 if done else 0.25):
+                if error is None:
+                    try:
+                        progress(event)
+                    except BaseException as e:
+                        error = e
+                        relay.cancel()
+            if done:
+                break
+        try:
+            result = fut.result()
+        except BrokenProcessPool:
+            raise self._worker_died()
+        except Exception:
+            if error is not None:
+                raise error
+            raise
+        if error is not None:
+            raise error
+        return result
+
+    def call_all(self, fn: Callable[..., Any], jobs: List[Tuple[Tuple[Any, ...], float]], *,
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 wait: bool = True) -> List[Any]:
+        """
+        Blocking: fn(*args) for every (args, cost) in `jobs`, each as its own
+        admitted job, results in order. A job turned away by admission is
+        submitted again once an earlier one finishes (or after Retry-After if
+        none is in flight), so the fan-out never goes past what admission
+        allows; with wait=False the first job being turned away raises
+        ComputeOverloaded instead. `progress` gets {"event": "progress",
+        "done", "total"} as jobs finish; if it or a job raises, jobs not
+        started yet are dropped and the exception is re-raised once the
+        running ones have ended.
+        """
+        results: List[Any] = [None] * len(jobs)
+        todo = list(range(len(jobs)))
+        running: Dict[Future, int] = {}
+        error: Optional[BaseException] = None
+        while (todo and error is None) or running:
+            while todo and error is None:
+                args, cost = jobs[todo[0]]
+                try:
+                    running[self.submit(fn, *args, cost=cost)] = todo.pop(0)
+                except ComputeOverloaded as e:
+                    if running:
+                        break
+                    if not wait and len(todo) == len(jobs):
+                        raise
+                    time.sleep(e.retry_after)
+            if not running:
+                continue
+            done, _ = futures_wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = running.pop(fut)
+                try:
+                    results[i] = fut.result()
+                    if progress is not None and error is None:
+                        progress({"event": "progress", "done": len(jobs) - len(todo) - len(running),
+                                  "total": len(jobs)})
+                except BrokenProcessPool:
+                    error = error or self._worker_died()
+                except BaseException as e:
+                    error = error or e
+        if error is not None:
+            raise error
+        return results
+
+
+_executor: Optional[ComputeExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_compute_executor() -> ComputeExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = int(settings.compute_workers) or (os.cpu_count() or 1)
+            _executor = ComputeExecutor(
+                workers=workers,
+                threads_per_worker=settings.compute_threads_per_worker,
+                queue_max=settings.compute_queue_max,
+                max_cost=settings.compute_max_pending_mpx,
+                mpix_per_s=settings.compute_mpx_per_s,
+            )
+        return _executor
+
+
+async def run_compute(fn: Callable[..., Any], *args: Any, cost: float = 1.0, **kwargs: Any) -> Any:
+    """Shortcut for get_compute_executor().run(...)."""
+    return await get_compute_executor().run(fn, *args, cost=cost, **kwargs)
+
+
+def call_compute(fn: Callable[..., Any], *args: Any, cost: float = 1.0, **kwargs: Any) -> Any:
+    """Shortcut for get_compute_executor().call(...) (blocking; not for the event loop)."""
+    return get_compute_executor().call(fn, *args, cost=cost, **kwargs)
+
+
+async def run_compute_retrying(fn: Callable[..., Any], *args: Any, cost: float = 1.0,
+                               retries: int = 3, **kwargs: Any) -> Any:
+    """
+    run_compute for batch routes: a job turned away by admission waits out its
+    Retry-After and tries again (up to `retries` times) instead of failing the
+    whole batch.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return await run_compute(fn, *args, cost=cost, **kwargs)
+        except ComputeOverloaded as e:
+            if attempt == retries:
+                raise
+            await asyncio.sleep(e.retry_after)
+
+
+# ---------- cost estimates (megapixel passes) ----------
+def image_cost(path: str, passes: float = 1.0) -> float:
+    """Pixels of the image at `path` (header only) x passes, in Mpx."""
+    from PIL import Image
+    try:
+        with Image.open(path) as im:
+            w, h = im.size
+    except Exception:
+        return float(passes)   # let the worker produce the real decode error
+    return w * h / 1e6 * passes
+
+
+def video_cost(path: str, frames: Optional[int] = None, passes: float = 1.0) -> float:
+    """Frame pixels x frames decoded (all, or at most `frames`) x passes, in Mpx. Runs ffprobe."""
+    from src.app.services.watermarking.video_planner import probe_video
+    try:
+        info = probe_video(path)
+    except Exception:
+        return float(passes)
+    n = info["frames"] if frames is None else min(info["frames"], int(frames))
+    return info["width"] * info["height"] / 1e6 * max(1, n) * passes
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from app.db import models
+from app.services.result_cache import get_result_cache
 
 def get_or_create_user(db: Session, email: str | None, display_name: str | None = None) -> models.User:
     if email:
@@ -74,6 +75,7 @@ def get_user_by_app_uuid(db: Session, app_uuid: str) -> models.User | None:
 
 
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from app.db.models import MediaId
@@ -119,6 +121,7 @@ def register_media_id(
         active=True,
     )
     db.add(row)
+    bump_owner_catalog(db, row.owner_email_sha)
     try:
         db.commit()
     except IntegrityError:
@@ -143,3 +146,121 @@ def register_media_id(
 def list_media_ids_by_owner_sha(db, owner_email_sha: str) -> list[str]:
     return [row.media_id for row in db.query(MediaId).filter_by(owner_email_sha=owner_email_sha.strip().lower()).all()]
 
+
+def list_media_ids_by_owner_shas(db, owner_email_shas) -> dict[str, list[str]]:
+    """list_media_ids_by_owner_sha for many owners in one query; owners with none map to []."""
+    owners = {o.strip().lower() for o in owner_email_shas}
+    out: dict[str, list[str]] = {o: [] for o in owners}
+    if owners:
+        q = db.query(MediaId.owner_email_sha, MediaId.media_id).filter(MediaId.owner_email_sha.in_(owners))
+        for owner, media_id in q.all():
+            out[owner].append(media_id)
+    return out
+
+
+
+def create_asset_fingerprint(db: Session, asset_id: int, phash: str, dhash: str) -> models.AssetFingerprint:
+    obj = models.AssetFingerprint(asset_id=asset_id, phash=phash, dhash=dhash)
+    db.add(obj)
+    db.flush()
+    return obj
+
+
+def media_assets_by_sha256(db: Session, sha256_hexes) -> dict[str, models.MediaAsset]:
+    """Newest MediaAsset per output digest, for the exact-file fast path of verify/extract."""
+    shas = {h.lower() for h in sha256_hexes}
+    if not shas:
+        return {}
+    out: dict[str, models.MediaAsset] = {}
+    rows = (db.query(models.MediaAsset).filter(models.MediaAsset.sha256_hex.in_(shas))
+            .order_by(models.MediaAsset.id.desc()))
+    for row in rows:
+        out.setdefault(row.sha256_hex, row)
+    return out
+
+
+def get_media_asset_by_sha256(db: Session, sha256_hex: str) -> models.MediaAsset | None:
+    return media_assets_by_sha256(db, [sha256_hex]).get(sha256_hex.lower())
+
+
+def bulk_create_media_assets(db: Session, rows: list[dict]) -> list[models.MediaAsset]:
+    """Add many MediaAsset rows (create_media_asset kwargs minus db) with one flush; caller commits."""
+    objs = [models.MediaAsset(**row) for row in rows]
+    db.add_all(objs)
+    db.flush()
+    return objs
+
+
+def bulk_create_asset_fingerprints(db: Session, rows: list[dict]) -> None:
+    """Add many AssetFingerprint rows ({asset_id, phash, dhash}) with one flush; caller commits."""
+    db.add_all([models.AssetFingerprint(**row) for row in rows])
+    db.flush()
+
+
+def bulk_register_media_ids(db: Session, entries: list[dict]) -> int:
+    """
+    register_media_id for many {owner_email_sha, media_id, user_uuid?, label?}
+    entries without a commit per row: pairs already registered (in the DB or
+    earlier in `entries`) are skipped. One flush; the caller commits, so the
+    whole batch lands in a single transaction. Returns how many rows were added.
+    """
+    wanted: dict[tuple[str, str], dict] = {}
+    for e in entries:
+        key = (e["owner_email_sha"].lower(), e["media_id"].lower())
+        wanted.setdefault(key, e)
+    if not wanted:
+        return 0
+    owners = {o for o, _ in wanted}
+    existing = {
+        (o, m) for o, m in db.query(MediaId.owner_email_sha, MediaId.media_id)
+        .filter(MediaId.owner_email_sha.in_(owners)).all()
+    }
+    rows = [
+        MediaId(owner_email_sha=o, media_id=m, user_uuid=e.get("user_uuid"), label=e.get("label"), active=True)
+        for (o, m), e in wanted.items() if (o, m) not in existing
+    ]
+    db.add_all(rows)
+    for owner in {r.owner_email_sha for r in rows}:
+        bump_owner_catalog(db, owner)
+    db.flush()
+    return len(rows)
+
+
+def owner_catalog_versions(db: Session, owner_email_shas) -> dict[str, int]:
+    """Current catalog version per owner (0 for owners never registered)."""
+    owners = {o.strip().lower() for o in owner_email_shas}
+    out = {o: 0 for o in owners}
+    if owners:
+        for row in db.query(models.OwnerCatalog).filter(models.OwnerCatalog.owner_email_sha.in_(owners)):
+            out[row.owner_email_sha] = row.version
+    return out
+
+
+def registry_catalog_version(db: Session) -> int:
+    """
+    Version of the whole media_id registry: the sum of every owner's catalog
+    version, so it moves whenever any owner's media_ids change.
+    """
+    return int(db.query(func.coalesce(func.sum(models.OwnerCatalog.version), 0)).scalar() or 0)
+
+
+def bump_owner_catalog(db: Session, owner_email_sha: str) -> int:
+    """
+    Call when an owner's media_ids change: bumps the catalog version (which is
+    part of every result-cache key) and drops that owner's cached results,
+    leaving other owners' entries alone. No commit.
+    """
+    owner = owner_email_sha.strip().lower()
+    row = db.get(models.OwnerCatalog, owner)
+    if row is None:
+        row = models.OwnerCatalog(owner_email_sha=owner, version=1)
+        db.add(row)
+    else:
+        row.version += 1
+    db.query(models.ResultCacheEntry).filter(
+        models.ResultCacheEntry.owner_email_sha == owner
+    ).delete(synchronize_session=False)
+    cache = get_result_cache()
+    if cache is not None:
+        cache.forget_owner(owner)
+    return row.version
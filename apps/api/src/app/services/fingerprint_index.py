@@ -0,0 +1,166 @@
+# apps/api/src/app/services/fingerprint_index.py
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+# Bits set in every byte value; popcount() falls back to it on numpy < 2.0.
+_POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(a: np.ndarray) -> np.ndarray:
+    """Set bits in each element of an unsigned integer array, as int64."""
+    a = np.ascontiguousarray(a)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(a).astype(np.int64)
+    per_byte = _POP8[a.view(np.uint8)].reshape(a.shape + (a.dtype.itemsize,))
+    return per_byte.sum(axis=-1, dtype=np.int64)
+
+
+_CHUNKS = 4            # 64-bit codes as four 16-bit substrings
+_CHUNK_BITS = 16
+_CHUNK_MASK = (1 << _CHUNK_BITS) - 1
+_POP16 = popcount(np.arange(1 << _CHUNK_BITS, dtype=np.uint16))
+
+
+class HammingIndex:
+    """
+    Multi-index hashing over 64-bit codes (Norouzi et al.): each code is split
+    into 4 substrings of 16 bits, and each substring position keeps its values
+    sorted with the matching row numbers. Two codes within Hamming distance r
+    agree to within r // 4 bits on at least one substring, so a radius query
+    probes every 16-bit value within r // 4 of the query's substrings
+    (binary search each), then checks the full distance of the candidates only.
+    About 40 bytes per code; new codes go to an unsorted tail that is scanned
+    directly until it is big enough to merge.
+    """
+
+    def __init__(self):
+        self._ids = np.empty(0, dtype=np.int64)
+        self._codes = np.empty(0, dtype=np.uint64)
+        self._sorted: List[Tuple[np.ndarray, np.ndarray]] = []     # per chunk: (values, row order)
+        self._tail_ids: List[int] = []
+        self._tail_codes: List[int] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._tail_ids)
+
+    def add(self, item_id: int, code: int) -> None:
+        with self._lock:
+            self._tail_ids.append(int(item_id))
+            self._tail_codes.append(int(code) & 0xFFFFFFFFFFFFFFFF)
+            if len(self._tail_ids) > max(1024, len(self._ids) // 8):
+                self._merge()
+
+    def _merge(self) -> None:
+        self._ids = np.concatenate([self._ids, np.array(self._tail_ids, dtype=np.int64)])
+        self._codes = np.concatenate([self._codes, np.array(self._tail_codes, dtype=np.uint64)])
+        self._tail_ids, self._tail_codes = [], []
+        self._sorted = []
+        for j in range(_CHUNKS):
+            values = ((self._codes >> np.uint64(j * _CHUNK_BITS)) & np.uint64(_CHUNK_MASK)).astype(np.uint16)
+            order = np.argsort(values, kind="stable").astype(np.int32)
+            self._sorted.append((values[order], order))
+
+    def search(self, code: int, radius: int, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """[(item_id, distance)] within `radius` bits of `code`, nearest first."""
+        code = int(code) & 0xFFFFFFFFFFFFFFFF
+        radius = max(0, min(64, int(radius)))
+        q = np.uint64(code)
+        with self._lock:
+            ids, codes = [], []
+            if len(self._ids):
+                probes = np.nonzero(_POP16 <= radius // _CHUNKS)[0].astype(np.uint16)
+                rows = []
+                for j, (values, order) in enumerate(self._sorted):
+                    want = probes ^ np.uint16((code >> (j * _CHUNK_BITS)) & _CHUNK_MASK)
+                    lo = np.searchsorted(values, want, side="left")
+                    n = np.searchsorted(values, want, side="right") - lo
+                    if n.sum():
+                        starts = np.repeat(lo, n)
+                        offsets = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+                        rows.append(order[starts + offsets])
+                if rows:
+                    cand = np.unique(np.concatenate(rows))
+                    ids.append(self._ids[cand])
+                    codes.append(self._codes[cand])
+            if self._tail_ids:
+                ids.append(np.array(self._tail_ids, dtype=np.int64))
+                codes.append(np.array(self._tail_codes, dtype=np.uint64))
+        if not ids:
+            return []
+        ids_a, codes_a = np.concatenate(ids), np.concatenate(codes)
+        dist = popcount(codes_a ^ q)
+        keep = dist <= radius
+        ids_a, dist = ids_a[keep], dist[keep]
+        order = np.lexsort((ids_a, dist))[:limit]
+        return [(int(ids_a[i]), int(dist[i])) for i in order]
+
+
+class FingerprintIndex:
+    """
+    pHash index over every AssetFingerprint row, keyed by asset id. sync()
+    pulls rows newer than the last one seen, so assets recorded by other
+    processes show up on the next query.
+    """
+
+    def __init__(self):
+        self.phash = HammingIndex()
+        self._last_id = 0
+        self._sync_lock = threading.Lock()
+
+    def sync(self, db: Session) -> int:
+        with self._sync_lock:
+            rows = (db.query(models.AssetFingerprint.id, models.AssetFingerprint.asset_id,
+                             models.AssetFingerprint.phash)
+                    .filter(models.AssetFingerprint.id > self._last_id)
+                    .order_by(models.AssetFingerprint.id).all())
+            for row_id, asset_id, phash in rows:
+                self.phash.add(asset_id, int(phash, 16))
+                self._last_id = row_id
+            return len(rows)
+
+
+_index: Optional[FingerprintIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_fingerprint_index() -> FingerprintIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FingerprintIndex()
+        return _index
+
+
+def find_near_duplicates(db: Session, phash: str, dhash: str, max_distance: int,
+                         limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Our image assets a suspect file (given its fingerprints) likely derives
+    from: pHash within max_distance bits via the index, then dHash within
+    max_distance too as a second opinion. Nearest (pHash + dHash) first, each
+    {asset_id, phash_distance, dhash_distance, params}.
+    """
+    index = get_fingerprint_index()
+    index.sync(db)
+    hits = dict(index.phash.search(int(phash, 16), max_distance, limit=4 * limit))
+    if not hits:
+        return []
+    rows = (db.query(models.AssetFingerprint.asset_id, models.AssetFingerprint.dhash, models.MediaAsset.params)
+            .join(models.MediaAsset, models.MediaAsset.id == models.AssetFingerprint.asset_id)
+            .filter(models.AssetFingerprint.asset_id.in_(list(hits))).all())
+    want = int(dhash, 16)
+    out = []
+    for asset_id, d_hex, params in rows:
+        d = bin(int(d_hex, 16) ^ want).count("1")
+        if d <= max_distance:
+            out.append({"asset_id": asset_id, "phash_distance": hits[asset_id],
+                        "dhash_distance": d, "params": params or {}})
+    out.sort(key=lambda h: (h["phash_distance"] + h["dhash_distance"], h["asset_id"]))
+    return out[:limit]
@@ -0,0 +1,189 @@
+# apps/api/src/app/services/result_cache.py
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type, TypeVar
+
+from fastapi import Response
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.db import models
+from app.db.session import SessionLocal
+
+M = TypeVar("M", bound=BaseModel)
+
+# X-Cache header values
+HIT_MEMORY = "hit-memory"
+HIT_DB = "hit-db"
+MISS = "miss"
+BYPASS = "bypass"
+
+
+def cache_key(kind: str, content_sha256: str, params: Dict[str, Any],
+              owner_email_sha: Optional[str] = None, catalog_version: Optional[int] = None) -> str:
+    """
+    sha256 over (kind, upload SHA-256, resolved params, owner, owner catalog
+    version). A new catalog version makes every older key for that owner
+    unreachable, so stale entries can never be served.
+    """
+    raw = json.dumps([kind, content_sha256, params, owner_email_sha, catalog_version],
+                     sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of route responses (plain JSON dicts): an in-process LRU in
+    front of the result_cache table. Both tiers honour the TTL; expired rows
+    are deleted on read and in a sweep every `purge_every` writes.
+    """
+
+    def __init__(self, max_items: int, ttl_s: float, purge_every: int = 256):
+        self.max_items = max(0, int(max_items))
+        self.ttl_s = float(ttl_s)
+        self.purge_every = max(1, int(purge_every))
+        self._lru: "OrderedDict[str, Tuple[float, Optional[str], dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    # ---------- memory tier ----------
+    def _mem_get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            hit = self._lru.get(key)
+            if hit is None:
+                return None
+            if hit[0] < time.time():
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+            return hit[2]
+
+    def _mem_put(self, key: str, owner: Optional[str], value: dict, expires_ts: float) -> None:
+        if not self.max_items:
+            return
+        with self._lock:
+            self._lru[key] = (expires_ts, owner, value)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_items:
+                self._lru.popitem(last=False)
+
+    # ---------- db tier (sync; call from a thread) ----------
+    def _db_get(self, key: str) -> Optional[Tuple[Optional[str], dict, float]]:
+        with SessionLocal() as db:
+            row = db.get(models.ResultCacheEntry, key)
+            if row is None:
+                return None
+            if row.expires_at < datetime.utcnow():
+                db.delete(row)
+                db.commit()
+                return None
+            return row.owner_email_sha, row.value, row.expires_at.timestamp()
+
+    def _db_put(self, key: str, kind: str, owner: Optional[str], value: dict, expires_at: datetime) -> None:
+        with SessionLocal() as db:
+            row = db.get(models.ResultCacheEntry, key)
+            if row is None:
+                db.add(models.ResultCacheEntry(key=key, kind=kind, owner_email_sha=owner,
+                                               value=value, expires_at=expires_at))
+            else:
+                row.value, row.expires_at = value, expires_at
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                purge_expired(db)
+            try:
+                db.commit()
+            except IntegrityError:   # a concurrent request stored the same key first
+                db.rollback()
+
+    # ---------- public ----------
+    async def get(self, key: str) -> Tuple[Optional[dict], str]:
+        """(value, X-Cache state). Memory hits never leave the event loop."""
+        value = self._mem_get(key)
+        if value is not None:
+            return value, HIT_MEMORY
+        found = await run_in_threadpool(self._db_get, key)
+        if found is None:
+            return None, MISS
+        owner, value, expires_ts = found
+        self._mem_put(key, owner, value, min(expires_ts, time.time() + self.ttl_s))
+        return value, HIT_DB
+
+    async def put(self, key: str, kind: str, value: dict, owner_email_sha: Optional[str] = None) -> None:
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl_s)
+        self._mem_put(key, owner_email_sha, value, time.time() + self.ttl_s)
+        await run_in_threadpool(self._db_put, key, kind, owner_email_sha, value, expires_at)
+
+    def forget_owner(self, owner_email_sha: str) -> None:
+        """Drop this process's memory entries for one owner (the DB rows go in bump_owner_catalog)."""
+        with self._lock:
+            for k in [k for k, (_, o, _) in self._lru.items() if o == owner_email_sha]:
+                del self._lru[k]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+
+def purge_expired(db: Session) -> int:
+    """Delete result_cache rows past their TTL; no commit."""
+    return db.query(models.ResultCacheEntry).filter(
+        models.ResultCacheEntry.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """The process-wide cache, or None when settings.result_cache_enabled is off."""
+    global _cache
+    if not settings.result_cache_enabled:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(settings.result_cache_memory_items, settings.result_cache_ttl_s)
+        return _cache
+
+
+async def cached_result(
+    response: Optional[Response],
+    model: Type[M],
+    kind: str,
+    content_sha256: str,
+    params: Dict[str, Any],
+    compute: Callable[[], Awaitable[M]],
+    *,
+    owner_email_sha: Optional[str] = None,
+    catalog_version: Optional[int] = None,
+) -> M:
+    """
+    Return the cached `model` for this upload + params, or await compute() and
+    store its result. Sets X-Cache on `response` (hit-memory / hit-db / miss,
+    or bypass when the cache is disabled). Owner-scoped entries are dropped by
+    bump_owner_catalog; pass the owner's current catalog version with them.
+    """
+    cache = get_result_cache()
+    if cache is None:
+        state, result = BYPASS, await compute()
+    else:
+        key = cache_key(kind, content_sha256, params, owner_email_sha, catalog_version)
+        value, state = await cache.get(key)
+        if value is not None:
+            result = model.model_validate(value)
+        else:
+            result = await compute()
+            owner = owner_email_sha.strip().lower() if owner_email_sha else None
+            await cache.put(key, kind, result.model_dump(mode="json"), owner)
+    if response is not None:
+        response.headers["X-Cache"] = state
+    return result
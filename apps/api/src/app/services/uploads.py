@@ -0,0 +1,206 @@
+# apps/api/src/app/services/uploads.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, Request, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+
+class UploadTooLarge(HTTPException):
+    """413 raised while an upload is still streaming in, as soon as it passes the limit."""
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"Upload exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+@dataclass
+class IngestedUpload:
+    """An upload spooled to disk: where it is, its SHA-256 and size."""
+    path: Path
+    sha256_hex: str
+    size: int
+    filename: Optional[str] = None
+
+    def unlink(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+async def ingest_chunks(
+    chunks: AsyncIterator[bytes],
+    *,
+    max_bytes: int,
+    suffix: str = "",
+    dest_dir: Optional[str] = None,
+    filename: Optional[str] = None,
+) -> IngestedUpload:
+    """
+    Write `chunks` to a new temp file (in dest_dir, default the system temp dir),
+    hashing as they go. Raises UploadTooLarge once more than max_bytes have
+    arrived; the partial file is removed.
+    """
+    h = hashlib.sha256()
+    size = 0
+    fd, name = tempfile.mkstemp(suffix=suffix, dir=dest_dir)
+    path = Path(name)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                h.update(chunk)
+                await run_in_threadpool(out.write, chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return IngestedUpload(path=path, sha256_hex=h.hexdigest(), size=size, filename=filename)
+
+
+async def ingest_upload(
+    file: UploadFile,
+    *,
+    max_bytes: int,
+    default_suffix: str = "",
+    dest_dir: Optional[str] = None,
+) -> IngestedUpload:
+    """
+    Stream an UploadFile to disk in settings.upload_chunk_bytes pieces instead of
+    `await file.read()`, so memory stays flat whatever the upload size. The
+    temp file keeps the upload's extension (decoders sniff it).
+    """
+    suffix = Path(file.filename or "").suffix or default_suffix
+    chunk_size = max(64 * 1024, int(settings.upload_chunk_bytes))
+
+    async def chunks():
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    return await ingest_chunks(chunks(), max_bytes=max_bytes, suffix=suffix,
+                               dest_dir=dest_dir, filename=file.filename)
+
+
+# OpenAPI requestBody for the raw-body (application/octet-stream) route variants
+RAW_BODY_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}},
+    }
+}
+
+
+async def ingest_request(
+    request: Request,
+    *,
+    max_bytes: int,
+    default_suffix: str = "",
+    dest_dir: Optional[str] = None,
+) -> IngestedUpload:
+    """
+    Stream a raw request body (application/octet-stream) to disk as it arrives,
+    skipping multipart parsing entirely. The original name, if the caller has
+    one, comes from the X-Filename header and only picks the temp suffix.
+    """
+    ctype = request.headers.get("content-type", "")
+    if ctype.startswith("multipart/"):
+        raise HTTPException(status_code=415, detail="Send the file as the raw body (application/octet-stream)")
+    filename = request.headers.get("x-filename") or None
+    suffix = Path(filename or "").suffix or default_suffix
+    return await ingest_chunks(request.stream(), max_bytes=max_bytes, suffix=suffix,
+                               dest_dir=dest_dir, filename=filename)
+
+
+def sha256_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 hex of a file on disk, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# ---------- request-body limits ----------
+def upload_limit_for(path: str) -> Optional[int]:
+    """Body-size limit for an upload route (video routes get the video limit), or None."""
+    if path.endswith("/verify/auto/batch/ndjson"):
+        return None   # long-lived stream; each line is size-checked by the route
+    if path.endswith(("/watermark/image/batch", "/verify/auto/batch")):
+        return int(settings.upload_max_batch_bytes)
+    if "/watermark/video" in path or path.endswith("/verify/auto/video"):
+        return int(settings.upload_max_video_bytes)
+    if "/watermark/image" in path or "/verify/auto" in path or path.endswith(("/upload", "/verify/similar")):
+        return int(settings.upload_max_image_bytes)
+    return None
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects oversized upload bodies with 413 before the multipart parser has
+    spooled them: up front from Content-Length, or, for chunked bodies, as soon
+    as the bytes received pass the route's limit (see upload_limit_for).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") not in ("POST", "PUT"):
+            return await self.app(scope, receive, send)
+        limit = upload_limit_for(scope.get("path", ""))
+        if not limit:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b"0") or 0)
+        except ValueError:
+            declared = 0
+        if declared > limit:
+            return await _send_413(send, limit)
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise UploadTooLarge(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLarge:
+            if not started:
+                await _send_413(send, limit)
+
+
+async def _send_413(send, limit: int) -> None:
+    body = json.dumps({"detail": f"Upload exceeds the {limit} byte limit"}).encode()
+    await send({"type": "http.response.start", "status": 413,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                            (b"connection", b"close")]})
+    await send({"type": "http.response.body", "body": body})
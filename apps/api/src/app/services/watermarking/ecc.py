@@ -1,4 +1,7 @@
+import functools
 from typing import Tuple
+
+import numpy as np
 from reedsolo import RSCodec, ReedSolomonError
 
 def ecc_encode_sha256(payload_32: bytes, parity_bytes: int = 24) -> bytes:
@@ -27,3 +30,42 @@ def ecc_decode_to_sha256(codeword: bytes, parity_bytes: int = 24) -> Tuple[bytes
     except ReedSolomonError:
         # decoding failed
         return b"", False
+
+
+@functools.lru_cache(maxsize=None)
+def _parity_tables(parity_bytes: int) -> np.ndarray:
+    """
+    (32, 256, parity_bytes): the RS parity contributed by byte value v at
+    message position i. Systematic RS parity is linear over GF(2^8), so it is
+    the XOR of these contributions; built from the 256 single-bit messages.
+    """
+    rsc = RSCodec(parity_bytes)
+    basis = np.zeros((32, 8, parity_bytes), dtype=np.uint8)
+    for i in range(32):
+        for b in range(8):
+            msg = bytearray(32)
+            msg[i] = 1 << b
+            basis[i, b] = np.frombuffer(bytes(rsc.encode(bytes(msg)))[32:], dtype=np.uint8)
+    value_bits = ((np.arange(256)[:, None] >> np.arange(8)) & 1).astype(np.uint8)    # (256, 8)
+    tables = np.zeros((32, 256, parity_bytes), dtype=np.uint8)
+    for b in range(8):
+        tables ^= value_bits[None, :, b, None] * basis[:, None, b, :]
+    return tables
+
+
+def ecc_encode_sha256_many(payloads: np.ndarray, parity_bytes: int = 24) -> np.ndarray:
+    """
+    ecc_encode_sha256 for many payloads at once: (N, 32) uint8 in, (N, 32 +
+    parity_bytes) uint8 codewords out, identical to encoding each row, with no
+    per-row GF arithmetic.
+    """
+    payloads = np.ascontiguousarray(payloads, dtype=np.uint8)
+    if payloads.ndim != 2 or payloads.shape[1] != 32:
+        raise ValueError("payloads must be an (N, 32) array of SHA-256 digests.")
+    if not (2 <= parity_bytes <= 64):
+        raise ValueError("parity_bytes should be between 2 and 64 for this RS setup.")
+    tables = _parity_tables(parity_bytes)
+    parity = np.zeros((len(payloads), parity_bytes), dtype=np.uint8)
+    for i in range(32):
+        parity ^= tables[i][payloads[:, i]]
+    return np.concatenate([payloads, parity], axis=1)
@@ -29,24 +29,43 @@ def _qim_embed_coeff(c: float, bit: int, step: float) -> float:
     q = np.round((c - d) / k)
     return q * k + d
 
-def embed_dct_image(
-    input_path: str,
-    output_path: str,
+class BlockReuseCache:
+    """
+    Remembers the previous plane's input and marked blocks. For consecutive video
+    frames, blocks whose pixels did not change are copied from the previous
+    output instead of running DCT -> QIM -> IDCT again. The copy is exact, so the
+    result is identical to recomputing.
+    """
+
+    def __init__(self):
+        self.prev_in: np.ndarray | None = None
+        self.prev_out: np.ndarray | None = None
+        self.hits = 0
+        self.lookups = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return (self.hits / self.lookups) if self.lookups else 0.0
+
+
+def embed_dct_plane(
+    img: np.ndarray,
     payload_bits: np.ndarray,
-    cfg: DCTConfig = DCTConfig()
-) -> None:
+    cfg: DCTConfig = DCTConfig(),
+    cache: BlockReuseCache | None = None,
+) -> np.ndarray:
     """
-    Embed payload_bits into image using DCT-QIM at a single mid-frequency coefficient.
-    Grayscale only for v1.
+    Embed payload_bits into a single float32 plane (grayscale or Y) and return the
+    marked plane (float32, same shape, not clipped).
     """
-    img = load_grayscale_float32(input_path)
     padded, pad_hw = pad_to_multiple(img, cfg.block_size)
+    padded = padded.astype(np.float32, copy=True)
+    src = padded.copy() if cache is not None else None
 
     blocks = blocks_view(padded, cfg.block_size)  # shape (nH, nW, b, b)
     nH, nW = blocks.shape[:2]
     total_blocks = nH * nW
 
-
     # capacity-aware repetition
     reps = _effective_repetition(total_blocks, cfg.repetition, len(payload_bits))
     needed_bits = int(np.ceil(total_blocks / reps))
@@ -57,21 +76,49 @@ def embed_dct_image(
     else:
         payload_bits = payload_bits[:needed_bits]
 
-    # Assign each payload bit to `reps` blocks
-    bit_idx = 0
+    # Same shape => same bit-to-block assignment, so unchanged blocks mark identically
+    reuse = None
+    if cache is not None and cache.prev_in is not None and cache.prev_in.shape == padded.shape:
+        prev_in = blocks_view(cache.prev_in, cfg.block_size)
+        reuse = np.all(blocks == prev_in, axis=(2, 3))
+        prev_out = blocks_view(cache.prev_out, cfg.block_size)
+        cache.hits += int(reuse.sum())
+        cache.lookups += total_blocks
+
+    # Assign each payload bit to `reps` blocks (block (i, j) is bit slot (i*nW + j) // reps)
+    if reuse is not None:
+        blocks[reuse] = prev_out[reuse]
+        todo = np.argwhere(~reuse)
+    else:
+        todo = np.argwhere(np.ones((nH, nW), dtype=bool))
     br, bc = cfg.coeff_pos
-    for i in range(nH):
-        for j in range(nW):
-            curr_bit = payload_bits[bit_idx // reps]
-            B = blocks[i, j].astype(np.float32)
-            D = dct2(B)
-            D[br, bc] = _qim_embed_coeff(D[br, bc], int(curr_bit), cfg.qim_step)
-            blocks[i, j] = idct2(D)
-            bit_idx += 1
+    for i, j in todo:
+        curr_bit = int(payload_bits[(i * nW + j) // reps])
+        B = blocks[i, j].astype(np.float32)
+        D = dct2(B)
+        D[br, bc] = _qim_embed_coeff(D[br, bc], curr_bit, cfg.qim_step)
+        blocks[i, j] = idct2(D)
+
+    if cache is not None:
+        cache.prev_in = src
+        cache.prev_out = padded.copy()
 
     watermarked = blocks.swapaxes(1, 2).reshape(padded.shape)
-    result = unpad(watermarked, pad_hw)
-    save_grayscale_uint8(output_path, result)
+    return unpad(watermarked, pad_hw)
+
+
+def embed_dct_image(
+    input_path: str,
+    output_path: str,
+    payload_bits: np.ndarray,
+    cfg: DCTConfig = DCTConfig()
+) -> None:
+    """
+    Embed payload_bits into image using DCT-QIM at a single mid-frequency coefficient.
+    Grayscale only for v1.
+    """
+    img = load_grayscale_float32(input_path)
+    save_grayscale_uint8(output_path, embed_dct_plane(img, payload_bits, cfg))
 
 def build_payload_from_text(text: str) -> np.ndarray:
     """256-bit payload from SHA-256(text)."""
@@ -89,41 +136,19 @@ def embed_dct_image_ychannel(
     Embed into the Y channel (luma) of a color image for better visual quality.
     """
     bgr = load_color_bgr_float32(input_path)
-    Y, Cb, Cr = bgr_to_ycbcr(bgr)
-
-    # --- reuse grayscale pipeline on Y ---
-    img = Y
-    padded, pad_hw = pad_to_multiple(img, cfg.block_size)
-    blocks = blocks_view(padded, cfg.block_size)
-    nH, nW = blocks.shape[:2]
-    total_blocks = nH * nW
-
-    # capacity-aware repetition
-    reps = _effective_repetition(total_blocks, cfg.repetition, len(payload_bits))
-    needed_bits = int(np.ceil(total_blocks / reps))
-
-    if len(payload_bits) < needed_bits:
-        tile = int(np.ceil(needed_bits / len(payload_bits)))
-        payload_bits = np.tile(payload_bits, tile)[:needed_bits]
-    else:
-        payload_bits = payload_bits[:needed_bits]
-
-    br, bc = cfg.coeff_pos
-    bit_idx = 0
-    for i in range(nH):
-        for j in range(nW):
-            curr_bit = int(payload_bits[bit_idx // reps])
-            B = blocks[i, j].astype(np.float32)
-            D = dct2(B)
-            D[br, bc] = _qim_embed_coeff(D[br, bc], curr_bit, cfg.qim_step)
-            blocks[i, j] = idct2(D)
-            bit_idx += 1
-
-    Y_wm = blocks.swapaxes(1, 2).reshape(padded.shape)
-    Y_wm = unpad(Y_wm, pad_hw)
-
-    # Recombine and save
-    bgr_wm = ycbcr_to_bgr(Y_wm, Cb, Cr)
-    save_color_bgr_uint8(output_path, bgr_wm)
+    save_color_bgr_uint8(output_path, embed_dct_bgr_ychannel(bgr, payload_bits, cfg))
 
 
+def embed_dct_bgr_ychannel(
+    bgr: np.ndarray,
+    payload_bits: np.ndarray,
+    cfg: DCTConfig = DCTConfig(),
+    cache: BlockReuseCache | None = None,
+) -> np.ndarray:
+    """
+    Same as embed_dct_image_ychannel for a float32 BGR frame already in memory;
+    returns the marked float32 BGR frame.
+    """
+    Y, Cb, Cr = bgr_to_ycbcr(bgr)
+    Y_wm = embed_dct_plane(Y, payload_bits, cfg, cache=cache)
+    return ycbcr_to_bgr(Y_wm, Cb, Cr)
@@ -3,7 +3,7 @@ import numpy as np
 
 
 from src.app.services.watermarking.helpers import (
-    load_grayscale_float32, pad_to_multiple, unpad, blocks_view, dct2, majority_vote,
+    load_grayscale_float32, pad_to_multiple, unpad, blocks_view, dct2,
     load_color_bgr_float32, bgr_to_ycbcr
 )
 from src.app.services.watermarking.schemas import DCTConfig
@@ -18,23 +18,49 @@ def _effective_repetition(total_blocks: int, desired_rep: int, payload_bits_len:
 
 
 def _qim_guess_bit(c: float, step: float) -> int:
+    return 0 if _qim_soft_score(c, step) <= 0 else 1
+
+
+def _qim_soft_score(c, step: float):
+    """
+    Signed distance difference r0 - r1 between the coefficient and the nearest point
+    of each codebook. > 0 leans towards bit 1, < 0 towards bit 0; the magnitude
+    (at most step/2) is how sure the block is. Works on scalars and arrays.
+    """
     k = step
     d0 = -k/4.0
     d1 = +k/4.0
     # distance to nearest quantization point in each codebook
-    r0 = abs((c - d0) - k * round((c - d0) / k))
-    r1 = abs((c - d1) - k * round((c - d1) / k))
-    return 0 if r0 <= r1 else 1
+    r0 = np.abs((c - d0) - k * np.round((c - d0) / k))
+    r1 = np.abs((c - d1) - k * np.round((c - d1) / k))
+    return r0 - r1
 
-def extract_dct_image(
-    input_path: str,
+
+def soft_to_bits(scores: np.ndarray) -> np.ndarray:
+    """Final hard decision on accumulated soft scores."""
+    return (np.asarray(scores) > 0).astype(np.uint8)
+
+
+def soft_confidence(scores: np.ndarray, counts: np.ndarray, step: float) -> np.ndarray:
+    """
+    Per-bit confidence in [0, 1]: |sum(r0 - r1)| over the maximum possible
+    magnitude (count * step/2). 0 = coin flip / no blocks, 1 = every block on-lattice.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    denom = np.where(counts > 0, counts * (step / 2.0), 1.0)
+    return np.clip(np.abs(np.asarray(scores, dtype=np.float64)) / denom, 0.0, 1.0)
+
+
+def extract_dct_plane_soft(
+    img: np.ndarray,
     payload_bitlen: int,
     cfg: DCTConfig = DCTConfig()
-) -> np.ndarray:
+):
     """
-    Recover payload bits of length `payload_bitlen` using majority vote over repeated blocks.
+    Soft-decision extraction from a single float32 plane (grayscale or Y).
+    Returns (scores, counts): per payload bit, the sum of r0 - r1 over its repeated
+    blocks and how many blocks contributed. Bits past the plane's capacity get 0/0.
     """
-    img = load_grayscale_float32(input_path)
     padded, _ = pad_to_multiple(img, cfg.block_size)
     blocks = blocks_view(padded, cfg.block_size)
     nH, nW = blocks.shape[:2]
@@ -43,76 +69,102 @@ def extract_dct_image(
     # compute the same effective repetition used at embed time
     reps = _effective_repetition(total_blocks, cfg.repetition, payload_bitlen)
     needed_bits = min(int(np.ceil(total_blocks / reps)), payload_bitlen)
+    used_blocks = min(total_blocks, needed_bits * reps)
 
-
-    votes = [[] for _ in range(needed_bits)]
     br, bc = cfg.coeff_pos
-
+    coeffs = np.empty(used_blocks, dtype=np.float64)
     bit_idx = 0
     for i in range(nH):
         for j in range(nW):
-            bslot = bit_idx // reps
-            if bslot >= needed_bits:
+            if bit_idx >= used_blocks:
                 break
             B = blocks[i, j].astype(np.float32)
             D = dct2(B)
-            bit = _qim_guess_bit(float(D[br, bc]), cfg.qim_step)
-            votes[bslot].append(bit)
+            coeffs[bit_idx] = D[br, bc]
             bit_idx += 1
 
-    recovered = np.array([majority_vote(v) if v else 0 for v in votes], dtype=np.uint8)
-    # If fewer than payload_bitlen, pad zeros; if more, truncate
-    if len(recovered) < payload_bitlen:
-        recovered = np.concatenate([recovered, np.zeros(payload_bitlen - len(recovered), dtype=np.uint8)])
-    else:
-        recovered = recovered[:payload_bitlen]
-    return recovered
+    slots = np.arange(used_blocks) // reps
+    scores = np.bincount(slots, weights=_qim_soft_score(coeffs, cfg.qim_step), minlength=payload_bitlen)
+    counts = np.bincount(slots, minlength=payload_bitlen)
+    return scores[:payload_bitlen].astype(np.float64), counts[:payload_bitlen].astype(np.int64)
+
 
+def extract_dct_plane(
+    img: np.ndarray,
+    payload_bitlen: int,
+    cfg: DCTConfig = DCTConfig()
+) -> np.ndarray:
+    """
+    Recover payload bits from a single float32 plane (grayscale or Y) already in memory.
+    Bits past the plane's capacity come back as 0.
+    """
+    scores, _ = extract_dct_plane_soft(img, payload_bitlen, cfg)
+    return soft_to_bits(scores)
 
 
-def extract_dct_image_ychannel(
+def extract_dct_image_soft(
     input_path: str,
     payload_bitlen: int,
     cfg: DCTConfig = DCTConfig()
-    ) -> np.ndarray:
+):
+    """(scores, counts) for a grayscale read of the image; see extract_dct_plane_soft."""
+    img = load_grayscale_float32(input_path)
+    return extract_dct_plane_soft(img, payload_bitlen, cfg)
+
+
+def extract_dct_image(
+    input_path: str,
+    payload_bitlen: int,
+    cfg: DCTConfig = DCTConfig()
+) -> np.ndarray:
     """
-    Recover payload from Y (luma) channel of color image.
+    Recover payload bits of length `payload_bitlen` from the summed soft scores of
+    their repeated blocks.
     """
-    bgr = load_color_bgr_float32(input_path)
-    Y, _, _ = bgr_to_ycbcr(bgr)
+    scores, _ = extract_dct_image_soft(input_path, payload_bitlen, cfg)
+    return soft_to_bits(scores)
 
-    img = Y
-    padded, _ = pad_to_multiple(img, cfg.block_size)
-    blocks = blocks_view(padded, cfg.block_size)
-    nH, nW = blocks.shape[:2]
-    total_blocks = nH * nW
 
-    # compute the same effective repetition used at embed time
-    reps = _effective_repetition(total_blocks, cfg.repetition, payload_bitlen)
-    needed_bits = min(int(np.ceil(total_blocks / reps)), payload_bitlen)
 
-    votes = [[] for _ in range(needed_bits)]
-    br, bc = cfg.coeff_pos
+def extract_dct_image_ychannel_soft(
+    input_path: str,
+    payload_bitlen: int,
+    cfg: DCTConfig = DCTConfig()
+):
+    """(scores, counts) from the Y (luma) channel of a color image."""
+    bgr = load_color_bgr_float32(input_path)
+    return extract_dct_bgr_ychannel_soft(bgr, payload_bitlen, cfg)
 
-    bit_idx = 0
-    for i in range(nH):
-        for j in range(nW):
-            bslot = bit_idx // reps
-            if bslot >= needed_bits:
-                break
-            B = blocks[i, j].astype(np.float32)
-            D = dct2(B)
-            bit = _qim_guess_bit(float(D[br, bc]), cfg.qim_step)
-            votes[bslot].append(bit)
-            bit_idx += 1
 
-    recovered = np.array([majority_vote(v) if v else 0 for v in votes], dtype=np.uint8)
-    if len(recovered) < payload_bitlen:
-        recovered = np.concatenate([recovered, np.zeros(payload_bitlen - len(recovered), dtype=np.uint8)])
-    else:
-        recovered = recovered[:payload_bitlen]
-    return recovered
+def extract_dct_image_ychannel(
+    input_path: str,
+    payload_bitlen: int,
+    cfg: DCTConfig = DCTConfig()
+    ) -> np.ndarray:
+    """
+    Recover payload from Y (luma) channel of color image.
+    """
+    scores, _ = extract_dct_image_ychannel_soft(input_path, payload_bitlen, cfg)
+    return soft_to_bits(scores)
 
 
+def extract_dct_bgr_ychannel_soft(
+    bgr: np.ndarray,
+    payload_bitlen: int,
+    cfg: DCTConfig = DCTConfig()
+):
+    """(scores, counts) for a float32 BGR frame already in memory."""
+    Y, _, _ = bgr_to_ycbcr(bgr)
+    return extract_dct_plane_soft(Y, payload_bitlen, cfg)
 
 
+def extract_dct_bgr_ychannel(
+    bgr: np.ndarray,
+    payload_bitlen: int,
+    cfg: DCTConfig = DCTConfig()
+) -> np.ndarray:
+    """
+    Same as extract_dct_image_ychannel, for a float32 BGR frame already in memory.
+    """
+    scores, _ = extract_dct_bgr_ychannel_soft(bgr, payload_bitlen, cfg)
+    return soft_to_bits(scores)
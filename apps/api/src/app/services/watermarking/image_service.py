@@ -0,0 +1,89 @@
+# apps/api/src/app/services/watermarking/image_service.py
+from __future__ import annotations
+
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from src.app.services.watermarking.schemas import DCTConfig
+from src.app.services.watermarking.image_embed import embed_dct_image, embed_dct_image_ychannel
+from src.app.services.watermarking.image_extract import (
+    extract_dct_image,
+    extract_dct_image_soft,
+    extract_dct_image_ychannel,
+    extract_dct_image_ychannel_soft,
+)
+from src.app.services.watermarking.helpers import (
+    bgr_to_ycbcr,
+    load_color_bgr_float32,
+    preprocess_for_preset,
+    psnr,
+    save_color_bgr_uint8,
+    ssim_y,
+)
+from src.app.services.watermarking.perceptual import fingerprints_bgr
+
+# The functions below are the CPU-bound halves of the image routes. They take
+# paths and plain values only, so they can run in a compute worker process
+# (see services/compute.py); the routes keep the DB work and the response.
+
+
+def embed_image_file(
+    in_path: str,
+    out_path: str,
+    payload_bits: np.ndarray,
+    *,
+    qim_step: float,
+    repetition: int,
+    use_y_channel: bool,
+    long_edge: Optional[int] = None,
+    jpeg_quality: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Preprocess (optional), embed and write `out_path`. Returns PSNR/SSIM on Y
+    against the preprocessed input and its perceptual hashes (phash, dhash).
+    """
+    orig_bgr = load_color_bgr_float32(in_path)
+    work_bgr = (preprocess_for_preset(orig_bgr, long_edge=long_edge, jpeg_quality=jpeg_quality)
+                if (long_edge or jpeg_quality) else orig_bgr)
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp_work:
+        save_color_bgr_uint8(tmp_work.name, work_bgr)
+        work_in_path = Path(tmp_work.name)
+    try:
+        cfg = DCTConfig(qim_step=float(qim_step), repetition=int(repetition))
+        if use_y_channel:
+            embed_dct_image_ychannel(str(work_in_path), out_path, payload_bits, cfg)
+        else:
+            embed_dct_image(str(work_in_path), out_path, payload_bits, cfg)
+    finally:
+        work_in_path.unlink(missing_ok=True)
+
+    out_bgr = load_color_bgr_float32(out_path)
+    return {
+        "psnr_y": float(psnr(bgr_to_ycbcr(work_bgr)[0], bgr_to_ycbcr(out_bgr)[0])),
+        "ssim_y": float(ssim_y(work_bgr, out_bgr)),
+        **fingerprints_bgr(work_bgr),
+    }
+
+
+def extract_image_soft_file(
+    path: str, payload_bitlen: int, *, qim_step: float, repetition: int, use_y_channel: bool,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-bit soft scores and vote counts, as extract_dct_image(_ychannel)_soft."""
+    cfg = DCTConfig(qim_step=float(qim_step), repetition=int(repetition))
+    if use_y_channel:
+        return extract_dct_image_ychannel_soft(path, payload_bitlen, cfg)
+    return extract_dct_image_soft(path, payload_bitlen, cfg)
+
+
+def extract_image_bits_file(
+    path: str, payload_bitlen: int, *, qim_step: float, repetition: int, use_y_channel: bool,
+) -> np.ndarray:
+    """Hard-decision bits, as extract_dct_image(_ychannel)."""
+    cfg = DCTConfig(qim_step=float(qim_step), repetition=int(repetition))
+    if use_y_channel:
+        return extract_dct_image_ychannel(path, payload_bitlen, cfg)
+    return extract_dct_image(path, payload_bitlen, cfg)
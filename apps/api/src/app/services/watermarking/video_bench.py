@@ -0,0 +1,319 @@
+# apps/api/src/app/services/watermarking/video_bench.py
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+import traceback
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Callable
+
+from src.app.services.watermarking.ecc import ecc_encode_sha256
+from src.app.services.watermarking.video_embed import FFMPEG, DCTVideoConfig, VIDEO_PRESETS, embed_dct_video, _run
+from src.app.services.watermarking.video_extract import DCTVideoExtractConfig, extract_dct_video
+
+SIZES = {
+    "480p": (854, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+DURATIONS = [10, 30, 60]
+SOURCES = ["testsrc2", "mandelbrot"]
+
+# What the platform does to an upload before anyone downloads it again:
+# scaled to the preset's long edge at its frame rate, then a lower-quality x264 pass.
+PLATFORM_REENCODE = {"crf": 28, "x264_preset": "veryfast"}
+
+BENCH_CLAIM = "owner:benchmark"
+
+
+@dataclass(frozen=True)
+class ClipSpec:
+    source: str = "testsrc2"       # testsrc2 | mandelbrot (lavfi)
+    size: str = "480p"
+    duration: int = 10
+    fps: int = 30
+    audio: bool = True
+
+    @property
+    def name(self) -> str:
+        return f"{self.source}_{self.size}_{self.duration}s_{self.fps}fps_{'a' if self.audio else 'na'}"
+
+
+def clip_matrix(sources=SOURCES, sizes=SIZES, durations=DURATIONS, audio=(True, False)) -> List[ClipSpec]:
+    return [ClipSpec(src, size, int(d), 30, bool(a))
+            for src, size, d, a in itertools.product(sources, sizes, durations, audio)]
+
+
+def generate_clip(spec: ClipSpec, cache_dir: Path) -> Path:
+    """
+    Render `spec` with ffmpeg's lavfi sources. Same spec -> same file, so the
+    clip is cached under cache_dir and reused across runs.
+    """
+    w, h = SIZES[spec.size]
+    out = cache_dir / f"{spec.name}.mp4"
+    if out.exists():
+        return out
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cmd = [FFMPEG, "-y", "-f", "lavfi", "-i", f"{spec.source}=size={w}x{h}:rate={spec.fps}"]
+    if spec.audio:
+        cmd += ["-f", "lavfi", "-i", "sine=frequency=440:sample_rate=48000"]
+    cmd += ["-t", str(spec.duration), "-c:v", "libx264", "-preset", "veryfast", "-crf", "18",
+            "-g", str(2 * spec.fps), "-pix_fmt", "yuv420p"]
+    if spec.audio:
+        cmd += ["-c:a", "aac", "-b:a", "128k", "-shortest"]
+    tmp = out.with_suffix(".part.mp4")
+    _run(cmd + [str(tmp)])
+    tmp.replace(out)
+    return out
+
+
+def platform_reencode(src: Path, dst: Path, preset: str) -> None:
+    p = VIDEO_PRESETS[preset]
+    vf = []
+    if p["long_edge"]:
+        le = int(p["long_edge"])
+        vf.append(f"scale='if(gte(iw,ih),min({le},iw),-2)':'if(gte(iw,ih),-2,min({le},ih))'")
+    if p["target_fps"]:
+        vf.append(f"fps={int(p['target_fps'])}")
+    cmd = [FFMPEG, "-y", "-i", str(src)]
+    if vf:
+        cmd += ["-vf", ",".join(vf)]
+    cmd += ["-c:v", "libx264", "-preset", PLATFORM_REENCODE["x264_preset"], "-crf", str(PLATFORM_REENCODE["crf"]),
+            "-pix_fmt", "yuv420p", "-c:a", "copy", str(dst)]
+    _run(cmd)
+
+
+# ---------- measurement ----------
+def _dir_bytes(path: Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.lstat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _measured_child(fn: Callable[[], Dict[str, Any]], tmp_root: str, conn) -> None:
+    # everything the pipeline puts in tempfile.* lands in tmp_root, so its size is the temp-disk use
+    tempfile.tempdir = tmp_root
+    peak = [0]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.2):
+            peak[0] = max(peak[0], _dir_bytes(Path(tmp_root)))
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    t = time.perf_counter()
+    try:
+        out, err = fn(), None
+    except Exception:
+        out, err = None, traceback.format_exc()
+    wall = time.perf_counter() - t
+    done.set()
+    sampler.join()
+    # ru_maxrss is KiB on Linux: this process, and the largest single ffmpeg it waited for
+    conn.send({
+        "result": out, "error": err, "wall_s": round(wall, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "tmp_peak_mb": round(peak[0] / 2 ** 20, 1),
+    })
+    conn.close()
+
+
+def run_measured(fn: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Run fn in a forked process so peak RSS and temp-disk figures belong to
+    this run alone. Returns {"result", "error", "wall_s", "peak_rss_mb",
+    "peak_child_rss_mb", "tmp_peak_mb"}.
+    """
+    ctx = mp.get_context("fork")
+    with tempfile.TemporaryDirectory(prefix="vbench_") as tmp_root:
+        recv, send = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_measured_child, args=(fn, tmp_root, send))
+        proc.start()
+        send.close()
+        try:
+            msg = recv.recv()
+        except EOFError:
+            msg = {"result": None, "error": f"benchmark process died (exit {proc.exitcode})"}
+        proc.join()
+    return msg
+
+
+# ---------- one benchmark entry ----------
+def preset_qim_step(preset: str) -> float:
+    # same per-preset default as the embed route (video_service.build_video_embed_config)
+    return 28.0 if preset == "whatsapp" else 24.0
+
+
+def bench_one(clip: Path, spec: ClipSpec, preset: str, work_dir: Path,
+              qim_step: Optional[float] = None, extract_max_frames: Optional[int] = 120) -> Dict[str, Any]:
+    """Embed with `preset`, extract the output, re-encode it like the platform would and extract again."""
+    qim_step = float(qim_step) if qim_step is not None else preset_qim_step(preset)
+    payload = ecc_encode_sha256(hashlib.sha256(BENCH_CLAIM.encode()).digest(), parity_bytes=64)
+    marked = work_dir / f"{spec.name}_{preset}.mp4"
+    reenc = work_dir / f"{spec.name}_{preset}_platform.mp4"
+
+    def embed():
+        # leave crf / size / fps unset so the preset fills them in, as the API does
+        vcfg = DCTVideoConfig(preset=preset, qim_step=qim_step, crf=None, x264_preset="")
+        return embed_dct_video(str(clip), str(marked), payload, vcfg)
+
+    def extract(path: Path):
+        def run():
+            ecfg = DCTVideoExtractConfig(qim_step=qim_step, max_frames=extract_max_frames)
+            out = extract_dct_video(str(path), (32 + 64) * 8, ecfg, use_ecc=True,
+                                    ecc_parity_bytes=64, check_text=BENCH_CLAIM)
+            out.pop("bit_confidence", None)
+            return out
+        return run
+
+    entry: Dict[str, Any] = {"clip": asdict(spec), "clip_name": spec.name, "preset": preset, "qim_step": qim_step}
+    emb = run_measured(embed)
+    stats = emb.pop("result") or {}
+    emb.update({
+        "timings": stats.get("timings"),
+        "frames": stats.get("frames"),
+        "frames_marked": stats.get("frames_marked"),
+        "fps": round(stats["frames"] / max(emb["wall_s"], 1e-9), 2) if stats.get("frames") else None,
+        "output_mb": round(marked.stat().st_size / 2 ** 20, 2) if marked.exists() else None,
+    })
+    entry["embed"] = emb
+    if emb["error"]:
+        return entry
+
+    for key, path in (("extract", marked), ("extract_after_reencode", reenc)):
+        if path is reenc:
+            t = time.perf_counter()
+            platform_reencode(marked, reenc, preset)
+            entry["reencode_s"] = round(time.perf_counter() - t, 3)
+        ext = run_measured(extract(path))
+        res = ext.pop("result") or {}
+        ext.update({k: res.get(k) for k in ("timings", "frames_per_s", "frames_used", "frames_decoded",
+                                             "ecc_ok", "match_text_hash", "mean_confidence", "early_exit")})
+        entry[key] = ext
+    for p in (marked, reenc):
+        p.unlink(missing_ok=True)
+    return entry
+
+
+def host_info() -> Dict[str, Any]:
+    try:
+        ver = subprocess.run([FFMPEG, "-version"], stdout=subprocess.PIPE, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ver = None
+    return {"cpus": os.cpu_count(), "platform": platform.platform(), "python": platform.python_version(),
+            "ffmpeg": ver}
+
+
+def run_suite(
+    specs: List[ClipSpec],
+    presets: List[str],
+    cache_dir: Path,
+    qim_step: Optional[float] = None,
+    extract_max_frames: Optional[int] = 120,
+    log: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "started_at": datetime.utcnow().isoformat(),
+        "host": host_info(),
+        "params": {"qim_step": qim_step, "extract_max_frames": extract_max_frames,
+                   "platform_reencode": PLATFORM_REENCODE, "claim": BENCH_CLAIM},
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="vbench_out_") as wd:
+        for spec in specs:
+            clip = generate_clip(spec, cache_dir)
+            for preset in presets:
+                entry = bench_one(clip, spec, preset, Path(wd), qim_step, extract_max_frames)
+                report["runs"].append(entry)
+                if log is not None:
+                    log(summary_line(entry))
+    report["finished_at"] = datetime.utcnow().isoformat()
+    return report
+
+
+def summary_line(e: Dict[str, Any]) -> str:
+    emb = e["embed"]
+    if emb.get("error"):
+        return f"{e['clip_name']:<40} {e['preset']:<10} embed FAILED"
+    ext, rex = e.get("extract") or {}, e.get("extract_after_reencode") or {}
+    return (f"{e['clip_name']:<40} {e['preset']:<10} embed {emb['wall_s']:>7.2f}s {emb['fps'] or 0:>7.1f} fps "
+            f"rss {emb['peak_rss_mb']:>6.0f}MB tmp {emb['tmp_peak_mb']:>7.0f}MB | "
+            f"extract {ext.get('wall_s', 0):>6.2f}s ecc {ext.get('match_text_hash')} | "
+            f"after re-encode ecc {rex.get('match_text_hash')}")
+
+
+def compare_reports(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per (clip, preset) present in both: embed/extract wall-time ratio new/old and ECC changes."""
+    key = lambda e: (e["clip_name"], e["preset"])
+    before = {key(e): e for e in old.get("runs", [])}
+    rows = []
+    for e in new.get("runs", []):
+        o = before.get(key(e))
+        if o is None:
+            continue
+        row = {"clip_name": e["clip_name"], "preset": e["preset"]}
+        for stage in ("embed", "extract", "extract_after_reencode"):
+            a, b = (o.get(stage) or {}).get("wall_s"), (e.get(stage) or {}).get("wall_s")
+            row[f"{stage}_ratio"] = round(b / a, 3) if a and b else None
+        row["ecc_after_reencode"] = [
+            (o.get("extract_after_reencode") or {}).get("match_text_hash"),
+            (e.get("extract_after_reencode") or {}).get("match_text_hash"),
+        ]
+        rows.append(row)
+    return rows
+
+
+# ---------- CLI ----------
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Benchmark video embed/extract on synthetic ffmpeg clips.")
+    ap.add_argument("--sources", nargs="+", choices=SOURCES, default=SOURCES)
+    ap.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    ap.add_argument("--durations", nargs="+", type=int, default=DURATIONS)
+    ap.add_argument("--audio", choices=["both", "yes", "no"], default="both")
+    ap.add_argument("--presets", nargs="+", choices=list(VIDEO_PRESETS), default=list(VIDEO_PRESETS))
+    ap.add_argument("--quick", action="store_true", help="one 480p 10 s testsrc2 clip with audio, every preset")
+    ap.add_argument("--qim", type=float, default=None, help="QIM step for every preset (default: as the API picks)")
+    ap.add_argument("--extract-max-frames", type=int, default=120)
+    ap.add_argument("--cache-dir", default=str(Path(tempfile.gettempdir()) / "klyvo_video_bench"),
+                    help="where generated clips are kept between runs")
+    ap.add_argument("--out", default=None, help="JSON report path (default video_bench_<utc>.json)")
+    ap.add_argument("--compare", default=None, help="previous JSON report to compare against")
+    args = ap.parse_args()
+
+    if args.quick:
+        specs = [ClipSpec("testsrc2", "480p", 10, 30, True)]
+    else:
+        audio = {"both": (True, False), "yes": (True,), "no": (False,)}[args.audio]
+        specs = clip_matrix(args.sources, args.sizes, args.durations, audio)
+
+    report = run_suite(specs, args.presets, Path(args.cache_dir), args.qim, args.extract_max_frames, log=print)
+    out = Path(args.out or f"video_bench_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json")
+    out.write_text(json.dumps(report, indent=2))
+    print(f"wrote {out}")
+    if args.compare:
+        for row in compare_reports(json.loads(Path(args.compare).read_text()), report):
+            print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
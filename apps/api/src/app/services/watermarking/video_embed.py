@@ -5,17 +5,25 @@ import os
 import shutil
 import tempfile
 import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Callable, Iterator
 
 import numpy as np
 
 # Reuse your image embed bits
 from src.app.services.watermarking.schemas import DCTConfig
-from src.app.services.watermarking.image_embed import embed_dct_image_ychannel, embed_dct_image
-from src.app.services.watermarking.helpers import load_color_bgr_float32, save_color_bgr_uint8
+from src.app.services.watermarking.image_embed import BlockReuseCache, embed_dct_bgr_ychannel, embed_dct_plane
+from src.app.services.watermarking.helpers import (
+    load_color_bgr_float32, save_color_bgr_uint8, load_grayscale_float32, save_grayscale_uint8,
+)
 from src.app.services.watermarking.ecc import ecc_encode_sha256
+from src.app.services.watermarking.video_extract import _probe_frame_size
 
 # ---- ffmpeg / ffprobe resolution (NEW retained) ----
 FFMPEG  = os.environ.get("FFMPEG_BIN")  or shutil.which("ffmpeg")  or "ffmpeg"
@@ -46,10 +54,27 @@ class DCTVideoConfig:
     long_edge: Optional[int] = None
     crf: int = 22
     x264_preset: str = "faster"
+    x264_threads: Optional[int] = None    # None = libx264 picks (all cores)
 
     # NEW: pre-normalize switch (default ON)
     pre_normalize: bool = True
 
+    # Segment-parallel embed: split at keyframes into N GOP-aligned segments,
+    # mark each in its own process, join with the concat demuxer (no re-encode).
+    segments: int = 1
+    segment_workers: Optional[int] = None   # default: one process per segment
+
+    # Reuse the previous marked frame's output for 8x8 blocks whose pixels did
+    # not change (screencasts, slides, talking heads). Exact, so output is identical.
+    reuse_static_blocks: bool = True
+
+    # "frame_step" = mark every Nth frame; "keyframes" = mark only frames the
+    # encoder is forced to emit as IDR (every keyframe_interval frames, default
+    # one second) and give those a lower QP. Other frames are left untouched.
+    embed_mode: str = "frame_step"
+    keyframe_interval: Optional[int] = None
+    keyframe_ipratio: float = 2.0         # x264 I/P QP ratio (default 1.4); higher = better I-frames
+
     # Derived from preset if not explicitly set
     def apply_preset(self) -> None:
         p = VIDEO_PRESETS.get(self.preset.lower(), VIDEO_PRESETS["original"])
@@ -58,11 +83,78 @@ class DCTVideoConfig:
         if self.crf is None:            self.crf = p["crf"]
         if not self.x264_preset:        self.x264_preset = p["x264_preset"]
 
-
-def _run(cmd: List[str]) -> None:
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    if proc.returncode != 0:
-        raise RuntimeError(f"Command failed ({proc.returncode}): {' '.join(cmd)}\n{proc.stderr}")
+    def is_marked(self, idx: int) -> bool:
+        if self.embed_mode == "keyframes":
+            return idx % max(1, int(self.keyframe_interval or 1)) == 0
+        return idx % max(1, self.frame_step) == 0
+
+EMBED_MODES = ("frame_step", "keyframes")
+OUTPUT_MODES = ("file", "fragmented")
+
+
+# Progress events are plain dicts: {"stage", "frame", "fps", "speed", "out_time_s",
+# "elapsed_s", ...}. A callback may raise to abort the pipeline (ffmpeg is killed).
+ProgressFn = Callable[[Dict[str, Any]], None]
+
+
+def _ffmpeg_progress_event(stage: str, info: Dict[str, str], t0: float) -> Dict[str, Any]:
+    def _num(v: Optional[str]) -> Optional[float]:
+        try:
+            return float(str(v).rstrip("x"))
+        except (TypeError, ValueError):
+            return None
+    out_us = _num(info.get("out_time_us") or info.get("out_time_ms"))
+    return {
+        "stage": stage,
+        "frame": int(_num(info.get("frame")) or 0),
+        "fps": _num(info.get("fps")),
+        "speed": _num(info.get("speed")),
+        "out_time_s": (out_us / 1e6) if out_us is not None and out_us >= 0 else None,
+        "elapsed_s": round(time.perf_counter() - t0, 3),
+    }
+
+
+def _run(cmd: List[str], progress: Optional[ProgressFn] = None, stage: str = "") -> None:
+    if progress is None:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"Command failed ({proc.returncode}): {' '.join(cmd)}\n{proc.stderr}")
+        return
+
+    # ffmpeg writes key=value blocks ending in progress=continue|end to stdout
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats", *cmd[1:]]
+    t0 = time.perf_counter()
+    with tempfile.TemporaryFile() as err:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err, text=True)
+        info: Dict[str, str] = {}
+        try:
+            for line in proc.stdout:
+                k, _, v = line.strip().partition("=")
+                info[k] = v
+                if k == "progress":
+                    progress(_ffmpeg_progress_event(stage, info, t0))
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        if proc.returncode != 0:
+            err.seek(0)
+            raise RuntimeError(f"Command failed ({proc.returncode}): {' '.join(cmd)}\n"
+                               f"{err.read().decode('utf-8', 'replace')}")
+
+
+@contextmanager
+def _stage(timings: Dict[str, float], name: str, progress: Optional[ProgressFn]) -> Iterator[None]:
+    """Accumulate wall time of `name` into timings and announce the stage change."""
+    if progress is not None:
+        progress({"stage": name, "event": "start"})
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = round(timings.get(name, 0.0) + time.perf_counter() - t0, 3)
 
 
 def _ffmpeg_scale_filter(long_edge: Optional[int]) -> Optional[str]:
@@ -71,10 +163,7 @@ def _ffmpeg_scale_filter(long_edge: Optional[int]) -> Optional[str]:
     return f"scale='if(gt(iw,ih),{long_edge},-2)':'if(gt(iw,ih),-2,{long_edge})':flags=lanczos"
 
 
-def _extract_frames(video_path: str, out_dir: Path, target_fps: Optional[int], scale_filter: Optional[str]) -> float:
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    # Probe fps
+def _probe_fps(video_path: str) -> float:
     probe = subprocess.run(
         [FFPROBE, "-v", "error", "-select_streams", "v:0",
          "-show_entries", "stream=r_frame_rate", "-of", "default=nk=1:nw=1", video_path],
@@ -83,9 +172,18 @@ def _extract_frames(video_path: str, out_dir: Path, target_fps: Optional[int], s
     fps_str = (probe.stdout or "30/1").strip()
     try:
         num, den = fps_str.split("/")
-        src_fps = float(num) / float(den)
+        return float(num) / float(den)
     except Exception:
-        src_fps = 30.0
+        return 30.0
+
+
+def _extract_frames(video_path: str, out_dir: Path, target_fps: Optional[int], scale_filter: Optional[str],
+                    input_args: Optional[List[str]] = None, output_args: Optional[List[str]] = None,
+                    progress: Optional[ProgressFn] = None) -> float:
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Probe fps
+    src_fps = _probe_fps(video_path)
 
     vf_parts = []
     if scale_filter:
@@ -96,9 +194,10 @@ def _extract_frames(video_path: str, out_dir: Path, target_fps: Optional[int], s
 
     # Extract frames as PNG (lossless) for watermarking
     _run([
-        FFMPEG, "-y", "-i", video_path, "-vf", vf,
+        FFMPEG, "-y", *(input_args or []), "-i", video_path, "-vf", vf,
+        *(output_args or []),
         str(out_dir / "frame_%08d.png")
-    ])
+    ], progress, "decode")
     return src_fps
 
 
@@ -112,7 +211,8 @@ def _extract_audio(video_path: str, audio_out: Path) -> bool:
 
 # ---------- NEW: pre-normalize video to preset spec ----------
 def _pre_normalize_video(src: str, dst: Path, long_edge: Optional[int],
-                         target_fps: Optional[int], crf: int, x264_preset: str) -> None:
+                         target_fps: Optional[int], crf: int, x264_preset: str,
+                         progress: Optional[ProgressFn] = None, threads: Optional[int] = None) -> None:
     vf_parts = []
     if long_edge:
         vf_parts.append(f"scale='if(gt(iw,ih),{long_edge},-2)':'if(gt(iw,ih),-2,{long_edge})':flags=lanczos")
@@ -125,12 +225,341 @@ def _pre_normalize_video(src: str, dst: Path, long_edge: Optional[int],
         "-i", src,
         "-vf", vf,
         "-c:v", "libx264", "-preset", x264_preset, "-crf", str(crf),
+        *(["-threads", str(int(threads))] if threads else []),
         "-pix_fmt", "yuv420p", "-profile:v", "main", "-level", "4.1",
         "-g", str((target_fps or 30) * 2), "-keyint_min", str((target_fps or 30)),
         "-c:a", "aac", "-b:a", "96k",
         "-movflags", "+faststart",
         str(dst)
-    ])
+    ], progress, "decode")
+
+
+def _mark_frames(frames_dir: Path, marked_dir: Path, payload_bits: np.ndarray,
+                 icfg: DCTConfig, vcfg: DCTVideoConfig, start_index: int = 0,
+                 progress: Optional[ProgressFn] = None) -> Dict[str, Any]:
+    """
+    Embed on the frames vcfg.is_marked selects (every Nth, or the forced keyframes)
+    from frames_dir into marked_dir. `start_index` is the
+    global index of the first frame, so the frame_step phase stays continuous
+    when a video is processed as several segments. Returns frame / block-cache stats.
+    """
+    marked_dir.mkdir(parents=True, exist_ok=True)
+    frame_paths = sorted(frames_dir.glob("frame_*.png"))
+    cache = BlockReuseCache() if vcfg.reuse_static_blocks else None
+    marked = 0
+    t0 = last = time.perf_counter()
+    for n, (idx, fp) in enumerate(enumerate(frame_paths, start=start_index), start=1):
+        out_fp = marked_dir / fp.name
+        if vcfg.is_marked(idx):
+            if vcfg.use_y_channel:
+                bgr = load_color_bgr_float32(str(fp))
+                save_color_bgr_uint8(str(out_fp), embed_dct_bgr_ychannel(bgr, payload_bits, icfg, cache=cache))
+            else:
+                gray = load_grayscale_float32(str(fp))
+                save_grayscale_uint8(str(out_fp), embed_dct_plane(gray, payload_bits, icfg, cache=cache))
+            marked += 1
+        else:
+            shutil.copy2(fp, out_fp)
+        now = time.perf_counter()
+        if progress is not None and (now - last >= 0.5 or n == len(frame_paths)):
+            last = now
+            progress({
+                "stage": "mark", "frame": n, "frames_total": len(frame_paths),
+                "frames_marked": marked, "fps": round(n / max(now - t0, 1e-9), 2),
+                "elapsed_s": round(now - t0, 3),
+            })
+    return {
+        "frames": len(frame_paths),
+        "frames_marked": marked,
+        "block_cache_hits": cache.hits if cache else 0,
+        "block_cache_lookups": cache.lookups if cache else 0,
+    }
+
+
+def _merge_stats(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"frames": 0, "frames_marked": 0, "block_cache_hits": 0, "block_cache_lookups": 0}
+    for p in parts:
+        for k in out:
+            out[k] += int(p.get(k, 0))
+    lookups = out["block_cache_lookups"]
+    out["block_cache_hit_rate"] = (out["block_cache_hits"] / lookups) if lookups else 0.0
+    return out
+
+
+def _video_encode_args(vcfg: DCTVideoConfig, lossless: bool, start_index: int = 0) -> List[str]:
+    threads = ["-threads", str(int(vcfg.x264_threads))] if vcfg.x264_threads else []
+    if lossless:
+        return [
+            "-c:v", "libx264",
+            "-preset", "veryslow",
+            "-crf", "0",
+            "-g", "1",
+            "-pix_fmt", "yuv444p",
+            *threads,
+        ]
+    args = [
+        "-c:v", "libx264",
+        "-preset", vcfg.x264_preset,
+        "-crf", str(vcfg.crf),
+        "-pix_fmt", "yuv420p",
+        *threads,
+    ]
+    if vcfg.embed_mode == "keyframes":
+        # IDR exactly on the marked frames (global index, so segments line up),
+        # no extra scene-cut keyframes, and protect I-frame quality.
+        k = max(1, int(vcfg.keyframe_interval or 1))
+        args += [
+            "-force_key_frames", f"expr:eq(mod(n+{int(start_index)},{k}),0)",
+            "-g", str(k), "-keyint_min", str(k), "-sc_threshold", "0",
+            "-x264-params", f"ipratio={float(vcfg.keyframe_ipratio):g}",
+        ]
+    return args
+
+
+# ---------- Segment-parallel embedding ----------
+def _probe_keyframe_times(video_path: str) -> List[float]:
+    """Presentation times (s) of the video keyframes, from packet flags (no decode)."""
+    p = subprocess.run(
+        [FFPROBE, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if p.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {p.stderr}")
+    times = []
+    for line in p.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags:
+            try:
+                times.append(float(pts))
+            except ValueError:
+                continue
+    return sorted(times)
+
+
+def _probe_packet_times(video_path: str) -> List[float]:
+    """Presentation times (s) of every video packet, sorted (= display order)."""
+    p = subprocess.run(
+        [FFPROBE, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time", "-of", "csv=p=0", video_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if p.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {p.stderr}")
+    out = []
+    for line in p.stdout.splitlines():
+        try:
+            out.append(float(line.strip().strip(",")))
+        except ValueError:
+            continue
+    return sorted(out)
+
+
+def _plan_segments(video_path: str, n_segments: int) -> List[Tuple[float, Optional[float], int, int]]:
+    """
+    Cut the video at the keyframes nearest to N even splits.
+    Returns [(start_s, end_s or None, first_frame_index, n_frames), ...].
+    """
+    frame_times = _probe_packet_times(video_path)
+    if not frame_times:
+        raise RuntimeError("No video packets found.")
+    keyframes = [t for t in _probe_keyframe_times(video_path) if t > frame_times[0]]
+    span = frame_times[-1] - frame_times[0]
+
+    cuts: List[float] = []
+    for i in range(1, max(1, n_segments)):
+        target = frame_times[0] + span * i / n_segments
+        if not keyframes:
+            break
+        k = min(keyframes, key=lambda t: abs(t - target))
+        if k not in cuts:
+            cuts.append(k)
+    cuts.sort()
+
+    bounds = [frame_times[0], *cuts]
+    segments = []
+    for i, start in enumerate(bounds):
+        end = bounds[i + 1] if i + 1 < len(bounds) else None
+        first = sum(1 for t in frame_times if t < start)
+        last = sum(1 for t in frame_times if end is None or t < end)
+        segments.append((start, end, first, last - first))
+    return segments
+
+
+def embed_dct_video_segment(
+    source_video: str,
+    output_segment: str,
+    payload_bytes: bytes,
+    vcfg: DCTVideoConfig,
+    start_s: float,
+    end_s: Optional[float],
+    first_frame_index: int,
+    n_frames: int,
+    lossless: bool = False,
+) -> Dict[str, Any]:
+    """
+    Mark one GOP-aligned time range of `source_video` and encode it (video only)
+    to `output_segment`. Only takes paths and plain values, so it can run in a
+    local worker process or on another node that shares the filesystem.
+    Returns the segment's frame / block-cache stats.
+    """
+    payload_bits = np.unpackbits(np.frombuffer(payload_bytes, dtype=np.uint8)).astype(np.uint8)
+    icfg = DCTConfig(qim_step=float(vcfg.qim_step), repetition=int(vcfg.repetition))
+    fps = vcfg.target_fps or _probe_fps(source_video)
+    # seek half a frame early so rounding in pts_time never drops the cut keyframe
+    half = 0.5 / max(1.0, float(fps))
+    seek = ["-ss", f"{max(0.0, start_s - half):.6f}"]
+    if end_s is not None:
+        seek += ["-to", f"{end_s - half:.6f}"]
+
+    with tempfile.TemporaryDirectory() as td:
+        tmp = Path(td)
+        frames_dir = tmp / "frames"
+        marked_dir = tmp / "marked"
+        _extract_frames(source_video, frames_dir, None, None,
+                        input_args=seek, output_args=["-vsync", "0", "-frames:v", str(int(n_frames))])
+        stats = _mark_frames(frames_dir, marked_dir, payload_bits, icfg, vcfg, start_index=first_frame_index)
+        if stats["frames"] == 0:
+            raise RuntimeError(f"No frames decoded for segment starting at {start_s:.3f}s")
+        _run([
+            FFMPEG, "-y",
+            "-r", str(vcfg.target_fps or 30), "-i", str(marked_dir / "frame_%08d.png"),
+            *_video_encode_args(vcfg, lossless, start_index=first_frame_index),
+            "-an",
+            output_segment
+        ])
+        return stats
+
+
+def _segment_path(work_dir: Path, index: int) -> Path:
+    return Path(work_dir) / f"seg_{index:03d}.mp4"
+
+
+def _concat_segments(work_dir: Path, n_segments: int) -> Path:
+    """Join seg_000.mp4 ... with the concat demuxer (stream copy, no re-encode)."""
+    list_file = Path(work_dir) / "segments.txt"
+    # absolute: concat resolves relative entries against the list file's directory
+    paths = [_segment_path(work_dir, i).resolve().as_posix() for i in range(n_segments)]
+    list_file.write_text("".join(f"file '{p}'\n" for p in paths))
+    joined = Path(work_dir) / "joined.mp4"
+    _run([FFMPEG, "-y", "-f", "concat", "-safe", "0", "-i", str(list_file), "-c", "copy", str(joined)])
+    return joined
+
+
+def _embed_segmented(source_video: str, work_dir: Path, payload_bytes: bytes,
+                     vcfg: DCTVideoConfig, lossless: bool) -> Tuple[Path, Dict[str, Any]]:
+    """
+    Run embed_dct_video_segment over N keyframe-aligned ranges in parallel and
+    join the encoded pieces. Returns the path of the joined video-only file and
+    the merged stats. The API does not come through here: it runs each segment
+    as its own compute job (video_service.embed_video_on_pool).
+    """
+    plan = _plan_segments(source_video, int(vcfg.segments))
+    workers = vcfg.segment_workers or len(plan)
+
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [
+            pool.submit(embed_dct_video_segment, source_video, str(_segment_path(work_dir, i)), payload_bytes,
+                        vcfg, start, end, first, n, lossless)
+            for i, (start, end, first, n) in enumerate(plan)
+        ]
+        parts = [f.result() for f in futures]
+
+    return _concat_segments(work_dir, len(plan)), _merge_stats(parts)
+
+
+def settle_video_config(vcfg: DCTVideoConfig) -> DCTVideoConfig:
+    """Fill preset defaults and the keyframe interval, and check embed_mode, as embed_dct_video does."""
+    vcfg.apply_preset()
+    if vcfg.embed_mode not in EMBED_MODES:
+        raise ValueError(f"Unknown embed_mode '{vcfg.embed_mode}' (expected one of {EMBED_MODES})")
+    if vcfg.embed_mode == "keyframes" and not vcfg.keyframe_interval:
+        vcfg.keyframe_interval = int(vcfg.target_fps or 30)   # one IDR per second at the output rate
+    return vcfg
+
+
+def uses_segments(vcfg: DCTVideoConfig) -> bool:
+    """
+    Whether a settled config takes the segment-parallel path. It needs a
+    constant-rate source so frame indices are known up front (the
+    pre-normalized file, or one we don't resample).
+    """
+    return int(vcfg.segments or 1) > 1 and bool(vcfg.pre_normalize or (not vcfg.long_edge and not vcfg.target_fps))
+
+
+def _prepare_source(input_video: str, work_dir: Path, vcfg: DCTVideoConfig,
+                    progress: Optional[ProgressFn]) -> Tuple[str, bool]:
+    """Pre-normalize (if enabled) and pull the audio into work_dir/audio.aac: (source to mark, has_audio)."""
+    source = input_video
+    if vcfg.pre_normalize:
+        norm_mp4 = Path(work_dir) / "pre_norm.mp4"
+        _pre_normalize_video(
+            src=input_video, dst=norm_mp4,
+            long_edge=vcfg.long_edge, target_fps=vcfg.target_fps,
+            crf=vcfg.crf, x264_preset=vcfg.x264_preset, progress=progress,
+            threads=vcfg.x264_threads,
+        )
+        source = str(norm_mp4)
+    return source, _extract_audio(source, Path(work_dir) / "audio.aac")
+
+
+def _mux(video_only: Path, audio_aac: Optional[Path], output_video: str,
+         progress: Optional[ProgressFn]) -> None:
+    """Stream-copy the video with the audio track (if any), moov up front."""
+    if audio_aac is not None:
+        _run([
+            FFMPEG, "-y",
+            "-i", str(video_only),
+            "-i", str(audio_aac),
+            "-map", "0:v:0", "-map", "1:a:0",
+            "-c:v", "copy",
+            "-c:a", "aac", "-b:a", "192k",
+            "-shortest",
+            "-movflags", "+faststart",
+            output_video
+        ], progress, "mux")
+    else:
+        _run([
+            FFMPEG, "-y",
+            "-i", str(video_only),
+            "-c:v", "copy",
+            "-movflags", "+faststart",
+            output_video
+        ], progress, "mux")
+
+
+def prepare_segmented_embed(input_video: str, work_dir: str, vcfg: DCTVideoConfig, *,
+                            progress: Optional[ProgressFn] = None) -> Dict[str, Any]:
+    """
+    First step of a segment-parallel embed run as separate jobs: pre-normalize
+    into `work_dir`, pull the audio and cut the source into keyframe-aligned
+    segments. `vcfg` must be settled (settle_video_config). Returns
+    {"source", "has_audio", "segments": [(start_s, end_s, first, n), ...], "timings"}.
+    """
+    timings: Dict[str, float] = {}
+    with _stage(timings, "decode", progress):
+        source, has_audio = _prepare_source(input_video, Path(work_dir), vcfg, progress)
+    return {"source": source, "has_audio": has_audio,
+            "segments": _plan_segments(source, int(vcfg.segments)), "timings": timings}
+
+
+def finish_segmented_embed(work_dir: str, output_video: str, n_segments: int, has_audio: bool, *,
+                           progress: Optional[ProgressFn] = None) -> Dict[str, float]:
+    """
+    Last step of a segment-parallel embed run as separate jobs: join the
+    segments embed_dct_video_segment wrote to work_dir/seg_NNN.mp4 and mux the
+    audio back in. Returns {"mux": seconds}.
+    """
+    timings: Dict[str, float] = {}
+    with _stage(timings, "mux", progress):
+        joined = _concat_segments(Path(work_dir), n_segments)
+        _mux(joined, Path(work_dir) / "audio.aac" if has_audio else None, output_video, progress)
+    return timings
+
+
+def segment_output_path(work_dir: str, index: int) -> str:
+    """Where segment `index` of a prepare_segmented_embed run must be written."""
+    return str(_segment_path(Path(work_dir), index))
 
 
 def embed_dct_video(
@@ -138,9 +567,19 @@ def embed_dct_video(
     output_video: str,
     payload_bytes: bytes,
     vcfg: DCTVideoConfig,
-    *, lossless: bool = False   # NEW retained
-) -> None:
-    vcfg.apply_preset()
+    *, lossless: bool = False,   # NEW retained
+    progress: Optional[ProgressFn] = None,
+) -> Dict[str, Any]:
+    """
+    Mark `input_video` into `output_video`. Returns stats: frame counts, the
+    static-block cache hit rate (see DCTVideoConfig.reuse_static_blocks) and
+    per-stage wall times in seconds (decode / mark / encode / mux, or decode /
+    segments / mux for the segment-parallel path). `progress`, if given, gets
+    ffmpeg -progress figures and mark-stage frame rates as they happen.
+    """
+    t_start = time.perf_counter()
+    timings: Dict[str, float] = {}
+    settle_video_config(vcfg)
     payload_bits = np.unpackbits(np.frombuffer(payload_bytes, dtype=np.uint8)).astype(np.uint8)
     icfg = DCTConfig(qim_step=float(vcfg.qim_step), repetition=int(vcfg.repetition))
 
@@ -148,82 +587,235 @@ def embed_dct_video(
         tmp = Path(td)
         frames_dir = tmp / "frames"
         marked_dir = tmp / "marked"
-        audio_aac = tmp / "audio.aac"
-        norm_mp4  = tmp / "pre_norm.mp4"  # NEW
-
-        marked_dir.mkdir(parents=True, exist_ok=True)
-
-        # --------- NEW: pre-normalize once to target platform ---------
-        source_for_embed = input_video
-        if vcfg.pre_normalize:
-            _pre_normalize_video(
-                src=input_video, dst=norm_mp4,
-                long_edge=vcfg.long_edge, target_fps=vcfg.target_fps,
-                crf=vcfg.crf, x264_preset=vcfg.x264_preset
-            )
-            source_for_embed = str(norm_mp4)
-
-        # 1) Decode frames (+ optional scale/fps) and 2) audio
-        # If we already pre-normalized, do NOT scale/fps again here.
-        scale_filter = None if vcfg.pre_normalize else _ffmpeg_scale_filter(vcfg.long_edge)
-        target_fps_for_extract = None if vcfg.pre_normalize else vcfg.target_fps
-
-        _ = _extract_frames(source_for_embed, frames_dir, target_fps_for_extract, scale_filter)
-        has_audio = _extract_audio(source_for_embed, audio_aac)
-
-        # 3) Embed on every Nth frame
-        frame_paths = sorted(frames_dir.glob("frame_*.png"))
-        if not frame_paths:
-            raise RuntimeError("No frames extracted from input video.")
-
-        for idx, fp in enumerate(frame_paths, start=1):
-            out_fp = marked_dir / fp.name
-            if (idx - 1) % max(1, vcfg.frame_step) == 0:
-                if vcfg.use_y_channel:
-                    embed_dct_image_ychannel(str(fp), str(out_fp), payload_bits, icfg)
-                else:
-                    embed_dct_image(str(fp), str(out_fp), payload_bits, icfg)
-            else:
-                shutil.copy2(fp, out_fp)
-
-        # 4) Re-encode
-        video_in_pattern = str(marked_dir / "frame_%08d.png")
-
-        if lossless:
-            encode_args = [
-                "-c:v", "libx264",
-                "-preset", "veryslow",
-                "-crf", "0",
-                "-g", "1",
-                "-pix_fmt", "yuv444p"
-            ]
-        else:
-            encode_args = [
-                "-c:v", "libx264",
-                "-preset", vcfg.x264_preset,
-                "-crf", str(vcfg.crf),
-                "-pix_fmt", "yuv420p"
-            ]
-
-        if has_audio:
-            _run([
-                FFMPEG, "-y",
-                "-r", str(vcfg.target_fps or 30), "-i", video_in_pattern,
-                "-i", str(audio_aac),
-                *encode_args,
-                "-c:a", "aac", "-b:a", "192k",
-                "-shortest",
-                "-movflags", "+faststart",
-                output_video
-            ])
+
+        # pre-normalize once to target platform, and pull the audio
+        with _stage(timings, "decode", progress):
+            source_for_embed, has_audio = _prepare_source(input_video, tmp, vcfg, progress)
+
+        if uses_segments(vcfg):
+            # decode + mark + encode run inside the segment processes
+            with _stage(timings, "segments", progress):
+                video_only, stats = _embed_segmented(source_for_embed, tmp, payload_bytes, vcfg, lossless)
         else:
-            _run([
-                FFMPEG, "-y",
-                "-r", str(vcfg.target_fps or 30), "-i", video_in_pattern,
-                *encode_args,
-                "-movflags", "+faststart",
-                output_video
-            ])
+            # 1) Decode frames (+ optional scale/fps) and 2) audio
+            # If we already pre-normalized, do NOT scale/fps again here.
+            scale_filter = None if vcfg.pre_normalize else _ffmpeg_scale_filter(vcfg.long_edge)
+            target_fps_for_extract = None if vcfg.pre_normalize else vcfg.target_fps
+
+            with _stage(timings, "decode", progress):
+                _ = _extract_frames(source_for_embed, frames_dir, target_fps_for_extract, scale_filter,
+                                    progress=progress)
+
+            # 3) Embed on every Nth frame
+            with _stage(timings, "mark", progress):
+                stats = _merge_stats([_mark_frames(frames_dir, marked_dir, payload_bits, icfg, vcfg,
+                                                   progress=progress)])
+            if stats["frames"] == 0:
+                raise RuntimeError("No frames extracted from input video.")
+            stats["mark_fps"] = round(stats["frames"] / max(timings["mark"], 1e-9), 2)
+
+            # 4) Re-encode (video only; muxed below)
+            video_only = tmp / "video.mp4"
+            with _stage(timings, "encode", progress):
+                _run([
+                    FFMPEG, "-y",
+                    "-r", str(vcfg.target_fps or 30), "-i", str(marked_dir / "frame_%08d.png"),
+                    *_video_encode_args(vcfg, lossless),
+                    str(video_only)
+                ], progress, "encode")
+
+        # 5) Mux (stream copy) with the audio track, moov up front
+        with _stage(timings, "mux", progress):
+            _mux(video_only, tmp / "audio.aac" if has_audio else None, output_video, progress)
+
+    timings["total"] = round(time.perf_counter() - t_start, 3)
+    stats["timings"] = timings
+    return stats
+
+
+# ---------- Fragmented-MP4 streaming output ----------
+def _scaled_size(w: int, h: int, long_edge: Optional[int]) -> Tuple[int, int]:
+    """Frame size after scaling the long edge to `long_edge`, short edge kept even."""
+    if not long_edge or max(w, h) == long_edge:
+        return w, h
+    if w >= h:
+        return int(long_edge), max(2, int(round(h * long_edge / w / 2.0)) * 2)
+    return max(2, int(round(w * long_edge / h / 2.0)) * 2), int(long_edge)
+
+
+def _drain(stream, tail: deque) -> None:
+    for line in iter(stream.readline, b""):
+        tail.append(line.decode("utf-8", "replace").rstrip())
+    stream.close()
+
+
+def plan_stream_embed(input_video: str, vcfg: DCTVideoConfig, *, lossless: bool = False) -> Dict[str, Any]:
+    """
+    Probe and validate for a fragmented-MP4 embed: settles `vcfg` and returns
+    the frame geometry plus the decoder / encoder command lines (plain values,
+    so a worker process can run them). Raises on bad input.
+    """
+    vcfg.apply_preset()
+    if vcfg.embed_mode not in EMBED_MODES:
+        raise ValueError(f"Unknown embed_mode '{vcfg.embed_mode}' (expected one of {EMBED_MODES})")
+    fps = float(vcfg.target_fps or _probe_fps(input_video))
+    if vcfg.embed_mode == "keyframes" and not vcfg.keyframe_interval:
+        vcfg.keyframe_interval = int(round(fps))
+    w, h = _scaled_size(*_probe_frame_size(input_video), vcfg.long_edge)
+    channels = 3 if vcfg.use_y_channel else 1
+    pix_fmt = "bgr24" if channels == 3 else "gray"
+
+    vf = [f"scale={w}:{h}:flags=lanczos"]
+    if vcfg.target_fps:
+        vf.append(f"fps={int(vcfg.target_fps)}")
+    decode_cmd = [
+        FFMPEG, "-v", "error", "-i", input_video, "-vf", ",".join(vf),
+        "-f", "rawvideo", "-pix_fmt", pix_fmt, "pipe:1",
+    ]
+    encode_cmd = [
+        FFMPEG, "-v", "error",
+        "-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{w}x{h}", "-r", f"{fps:g}", "-i", "pipe:0",
+        "-i", input_video,
+        "-map", "0:v:0", "-map", "1:a:0?",
+        *_video_encode_args(vcfg, lossless),
+        "-c:a", "aac", "-b:a", "192k", "-shortest",
+        "-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        "-frag_duration", "1000000",
+        "pipe:1",
+    ]
+    return {"width": w, "height": h, "channels": channels, "fps": fps,
+            "decode_cmd": decode_cmd, "encode_cmd": encode_cmd}
+
+
+def _stream_chunks(plan: Dict[str, Any], payload_bytes: bytes, vcfg: DCTVideoConfig,
+                   chunk_size: int, stats: Optional[Dict[str, Any]]) -> Iterator[bytes]:
+    """decode (rawvideo pipe) -> mark (feeder thread) -> libx264 -> fMP4 chunks, per plan_stream_embed."""
+    w, h, channels = plan["width"], plan["height"], plan["channels"]
+    frame_bytes = w * h * channels
+    payload_bits = np.unpackbits(np.frombuffer(payload_bytes, dtype=np.uint8)).astype(np.uint8)
+    icfg = DCTConfig(qim_step=float(vcfg.qim_step), repetition=int(vcfg.repetition))
+
+    def feed(dec: subprocess.Popen, enc: subprocess.Popen, out: Dict[str, Any], errors: List[BaseException]) -> None:
+        cache = BlockReuseCache() if vcfg.reuse_static_blocks else None
+        n = marked = 0
+        try:
+            while True:
+                buf = dec.stdout.read(frame_bytes)
+                if len(buf) < frame_bytes:
+                    break
+                if vcfg.is_marked(n):
+                    frame = np.frombuffer(buf, dtype=np.uint8).reshape((h, w, channels) if channels == 3 else (h, w))
+                    if channels == 3:
+                        wm = embed_dct_bgr_ychannel(frame.astype(np.float32), payload_bits, icfg, cache=cache)
+                    else:
+                        wm = embed_dct_plane(frame.astype(np.float32), payload_bits, icfg, cache=cache)
+                    buf = np.clip(np.round(wm), 0, 255).astype(np.uint8).tobytes()
+                    marked += 1
+                enc.stdin.write(buf)
+                n += 1
+        except BaseException as e:   # BrokenPipe when the client went away
+            errors.append(e)
+        finally:
+            try:
+                enc.stdin.close()
+            except OSError:
+                pass
+            out.update(_merge_stats([{
+                "frames": n, "frames_marked": marked,
+                "block_cache_hits": cache.hits if cache else 0,
+                "block_cache_lookups": cache.lookups if cache else 0,
+            }]))
+
+    out: Dict[str, Any] = stats if stats is not None else {}
+    errors: List[BaseException] = []
+    enc_err: deque = deque(maxlen=50)
+    dec = subprocess.Popen(plan["decode_cmd"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    enc = subprocess.Popen(plan["encode_cmd"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE)
+    drain = threading.Thread(target=_drain, args=(enc.stderr, enc_err), daemon=True)
+    feeder = threading.Thread(target=feed, args=(dec, enc, out, errors), name="fmp4-feeder", daemon=True)
+    drain.start()
+    feeder.start()
+    try:
+        while True:
+            chunk = enc.stdout.read1(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        enc.wait()
+        feeder.join()
+        if enc.returncode != 0:
+            raise RuntimeError(f"Encoder failed ({enc.returncode}): " + "\n".join(enc_err))
+        if errors:
+            raise RuntimeError(f"Marking failed: {errors[0]}")
+        if out.get("frames", 0) == 0:
+            raise RuntimeError("No frames decoded from input video.")
+    finally:
+        # normal end, error, or the consumer closed us early (client disconnect)
+        for proc in (dec, enc):
+            if proc.poll() is None:
+                proc.kill()
+        feeder.join(timeout=5)
+        dec.stdout.close()
+        enc.stdout.close()
+        dec.wait()
+        enc.wait()
+
+
+def stream_embed_dct_video(
+    input_video: str,
+    payload_bytes: bytes,
+    vcfg: DCTVideoConfig,
+    *, lossless: bool = False,
+    chunk_size: int = 64 * 1024,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Iterator[bytes]:
+    """
+    Mark `input_video` and yield a fragmented MP4 (empty moov, one fragment per
+    keyframe or second) while it is being encoded, so the first bytes go out
+    within a few seconds and the output never touches disk.
+
+    decode (rawvideo pipe) -> mark (feeder thread) -> libx264 -> fMP4 on stdout.
+    Scaling / fps conversion happen in the decoder instead of a pre-normalize
+    pass; segments are not used. Probing and validation run now, so bad input
+    raises here rather than mid-stream; ffmpeg starts on first iteration.
+    `stats`, if given, is filled with frame / block-cache stats once done.
+    Marking runs in this process; the API goes through embed_dct_video_to_pipe.
+    """
+    plan = plan_stream_embed(input_video, vcfg, lossless=lossless)
+    return _stream_chunks(plan, payload_bytes, vcfg, chunk_size, stats)
+
+
+def embed_dct_video_to_pipe(
+    pipe_path: str,
+    payload_bytes: bytes,
+    vcfg: DCTVideoConfig,
+    plan: Dict[str, Any],
+    *, chunk_size: int = 64 * 1024,
+) -> Dict[str, Any]:
+    """
+    Worker-process side of a streamed embed: run the plan_stream_embed
+    pipeline and write the fMP4 into the FIFO at `pipe_path`, whose reader
+    must already be open (else this fails at once instead of blocking). A
+    reader that goes away breaks the pipe, which stops ffmpeg. Returns the
+    frame / block-cache stats.
+    """
+    try:
+        fd = os.open(pipe_path, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError as e:   # ENXIO: nobody is reading any more
+        raise RuntimeError(f"Stream reader went away: {e}") from e
+    os.set_blocking(fd, True)
+    stats: Dict[str, Any] = {}
+    chunks = _stream_chunks(plan, payload_bytes, vcfg, chunk_size, stats)
+    try:
+        for chunk in chunks:
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(fd, view):]
+    finally:
+        chunks.close()
+        os.close(fd)
+    return stats
 
 
 # ---------- Simple CLI for bash testing ----------
@@ -255,6 +847,20 @@ def main():
     ap.add_argument("--pre-normalize", dest="pre_normalize", action="store_true", default=True,
                     help="pre-normalize to preset spec before embedding (default on)")
     ap.add_argument("--no-pre-normalize", dest="pre_normalize", action="store_false")
+    ap.add_argument("--segments", type=int, default=1,
+                    help="split at keyframes into N segments and mark them in parallel processes")
+    ap.add_argument("--workers", type=int, default=None, help="max segment worker processes")
+    ap.add_argument("--embed-mode", choices=EMBED_MODES, default="frame_step",
+                    help="frame_step = every Nth frame; keyframes = forced IDR frames only")
+    ap.add_argument("--keyframe-interval", type=int, default=None, help="frames between forced IDRs (default: fps)")
+    ap.add_argument("--output-mode", choices=OUTPUT_MODES, default="file",
+                    help="fragmented = stream-encode a fragmented MP4 (no faststart pass)")
+    ap.add_argument("--deadline", type=float, default=None,
+                    help="wall-clock budget (s); plan frame_step/preset/segments/threads to meet it")
+    ap.add_argument("--target-speed", type=float, default=None,
+                    help="throughput target in x real time (alternative to --deadline)")
+    ap.add_argument("--no-block-reuse", dest="reuse_static_blocks", action="store_false", default=True,
+                    help="recompute every block even if unchanged from the previous marked frame")
     args = ap.parse_args()
 
     payload = _build_payload(args.text, not args.no_ecc, args.ecc)
@@ -267,8 +873,30 @@ def main():
         crf=args.crf if args.crf is not None else 22,
         x264_preset="faster",
         pre_normalize=args.pre_normalize,   # NEW
+        segments=max(1, args.segments), segment_workers=args.workers,
+        reuse_static_blocks=args.reuse_static_blocks,
+        embed_mode=args.embed_mode, keyframe_interval=args.keyframe_interval,
     )
-    embed_dct_video(args.inp, args.outp, payload, vcfg, lossless=args.lossless)
+    if args.deadline is not None or args.target_speed is not None:
+        from src.app.services.watermarking.video_planner import plan_video_embed
+        plan = plan_video_embed(args.inp, vcfg, deadline_s=args.deadline, target_speed=args.target_speed)
+        plan.apply(vcfg)
+        print("Plan: " + ", ".join(f"{k[7:]}={v}" for k, v in plan.headers().items()))
+    if args.output_mode == "fragmented":
+        stats = {}
+        t0 = time.perf_counter()
+        with open(args.outp, "wb") as fh:
+            for i, chunk in enumerate(stream_embed_dct_video(args.inp, payload, vcfg,
+                                                             lossless=args.lossless, stats=stats)):
+                if i == 0:
+                    print(f"First bytes after {time.perf_counter() - t0:.2f}s")
+                fh.write(chunk)
+        print(f"Marked {stats['frames_marked']}/{stats['frames']} frames in {time.perf_counter() - t0:.2f}s")
+        return
+    stats = embed_dct_video(args.inp, args.outp, payload, vcfg, lossless=args.lossless)
+    print(f"Marked {stats['frames_marked']}/{stats['frames']} frames, "
+          f"block cache hit rate {stats['block_cache_hit_rate']:.1%}")
+    print("Stage timings (s): " + ", ".join(f"{k}={v:.2f}" for k, v in stats["timings"].items()))
 
 if __name__ == "__main__":
     main()
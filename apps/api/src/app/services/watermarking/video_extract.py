@@ -1,19 +1,28 @@
 # apps/api/src/app/services/watermarking/video_extract.py
 from __future__ import annotations
 
-import tempfile
+import hashlib
+import math
+import os
+import shutil
 import subprocess
+import time
 from dataclasses import dataclass
-from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Iterator, Tuple, Callable, Dict, Any
 
+import cv2
 import numpy as np
 
 from src.app.services.watermarking.schemas import DCTConfig
-from src.app.services.watermarking.image_extract import extract_dct_image_ychannel, extract_dct_image
-from src.app.services.watermarking.helpers import bits_to_bytes
+from src.app.services.watermarking.image_extract import (
+    _effective_repetition, _qim_soft_score, soft_to_bits, soft_confidence,
+)
+from src.app.services.watermarking.helpers import bgr_to_ycbcr, bits_to_bytes, blocks_view, pad_to_multiple
 from src.app.services.watermarking.ecc import ecc_decode_to_sha256, ecc_encode_sha256
 
+FFMPEG  = os.environ.get("FFMPEG_BIN")  or shutil.which("ffmpeg")  or "ffmpeg"
+FFPROBE = os.environ.get("FFPROBE_BIN") or shutil.which("ffprobe") or "ffprobe"
+
 
 @dataclass
 class DCTVideoExtractConfig:
@@ -22,36 +31,348 @@ class DCTVideoExtractConfig:
     use_y_channel: bool = True
 
     # which frames to sample
-    frame_step: int = 2                   # analyze every Nth frame
-    max_frames: Optional[int] = 120       # cap to speed up (None = all)
+    frame_step: int = 2                   # embed marking period; each phase is voted separately
+    max_frames: Optional[int] = 120       # cap per phase to speed up (None = all)
+
+    # "dense" = every decoded frame, "keyframes" = I-frames only
+    # (decoded with -skip_frame nokey; falls back to dense if ECC fails)
+    sampling: str = "dense"
+
+    # Streaming early exit: try ECC every `decode_every` frames and stop decoding
+    # once the claim matches, or once success is statistically out of reach.
+    early_exit: bool = True
+    decode_every: int = 8
+    giveup_z: float = 3.09                # one-sided z for the give-up bound (~1e-3)
+
+SAMPLING_MODES = ("dense", "keyframes")
 
-def _run(cmd: List[str]) -> None:
-    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+# Same event shape as video_embed.ProgressFn; raising from it stops decoding.
+ProgressFn = Callable[[Dict[str, Any]], None]
+
+
+def _probe_frame_size(video_path: str) -> Tuple[int, int]:
+    """
+    (width, height) of decoded frames, accounting for rotation metadata since
+    ffmpeg auto-rotates on decode.
+    """
+    p = subprocess.run(
+        [FFPROBE, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation",
+         "-of", "default=nw=1", video_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
     if p.returncode != 0:
-        raise RuntimeError(f"Command failed: {' '.join(cmd)}\n{p.stderr}")
+        raise RuntimeError(f"ffprobe failed: {p.stderr}")
+    info = {}
+    for line in p.stdout.splitlines():
+        k, _, v = line.partition("=")
+        info[k.strip().split(":")[-1]] = v.strip()
+    try:
+        w, h = int(info["width"]), int(info["height"])
+    except (KeyError, ValueError):
+        raise RuntimeError("Could not determine video frame size.")
+    try:
+        rot = int(float(info.get("rotation") or info.get("rotate") or 0))
+    except ValueError:
+        rot = 0
+    if abs(rot) % 180 == 90:
+        w, h = h, w
+    return w, h
+
+
+def _iter_frames(
+    video_path: str,
+    frame_step: int = 1,
+    keyframes_only: bool = False,
+    start_s: Optional[float] = None,
+    duration_s: Optional[float] = None,
+) -> Iterator[np.ndarray]:
+    """
+    Stream decoded frames as float32 BGR arrays through a rawvideo pipe.
+    Nothing is written to disk, and closing the generator kills ffmpeg, so the
+    caller can stop decoding at any point. start_s / duration_s restrict decoding
+    to a time range (input-side seek, so only that range is decoded).
+    """
+    w, h = _probe_frame_size(video_path)
+    cmd = [FFMPEG, "-v", "error"]
+    if keyframes_only:
+        # I-frames need no references, so the decoder skips every P/B frame
+        cmd += ["-skip_frame", "nokey"]
+    if start_s:
+        cmd += ["-ss", f"{float(start_s):.3f}"]
+    cmd += ["-i", video_path]
+    if duration_s is not None:
+        cmd += ["-t", f"{float(duration_s):.3f}"]
+    if frame_step > 1 and not keyframes_only:
+        cmd += ["-vf", f"select=not(mod(n\\,{int(frame_step)}))"]
+    cmd += ["-vsync", "0", "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"]
+
+    frame_bytes = w * h * 3
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            buf = proc.stdout.read(frame_bytes)
+            if len(buf) < frame_bytes:
+                break
+            yield np.frombuffer(buf, dtype=np.uint8).reshape(h, w, 3).astype(np.float32)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+
+
+# orthonormal DCT-II basis, same transform as cv2.dct on an 8x8 block
+def _dct_basis(n: int) -> np.ndarray:
+    x = np.arange(n)
+    basis = np.cos((2 * x[None, :] + 1) * np.arange(n)[:, None] * np.pi / (2 * n)) * np.sqrt(2.0 / n)
+    basis[0] /= np.sqrt(2.0)
+    return basis
+
+
+def _frame_plane(frame: np.ndarray, use_y_channel: bool) -> np.ndarray:
+    if use_y_channel:
+        return bgr_to_ycbcr(frame)[0]
+    return cv2.cvtColor(frame.astype(np.uint8), cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+
+def frame_presence(plane: np.ndarray, payload_bitlen: int, icfg: DCTConfig) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    (scores, counts, presence) for one plane. scores/counts match
+    extract_dct_plane_soft, but the embedding coefficient of every block comes
+    from one vectorized projection instead of a cv2.dct call per block.
+
+    presence is the mean over payload bits of |sum(r0 - r1)| / sum|r0 - r1|
+    across the bit's repeated blocks: close to 1 when they agree (marked),
+    about 1/sqrt(reps) when the signs are random. It needs no claim and no
+    ECC, which makes it a cheap gate before voting. With one block per bit it
+    is always 1, so nothing gets skipped.
+    """
+    n = icfg.block_size
+    padded, _ = pad_to_multiple(plane, n)
+    blocks = blocks_view(padded, n)
+    total_blocks = blocks.shape[0] * blocks.shape[1]
+    reps = _effective_repetition(total_blocks, icfg.repetition, payload_bitlen)
+    needed_bits = min(int(np.ceil(total_blocks / reps)), payload_bitlen)
+    used_blocks = min(total_blocks, needed_bits * reps)
+
+    basis = _dct_basis(n)
+    br, bc = icfg.coeff_pos
+    coeffs = np.einsum("ijkl,k,l->ij", blocks, basis[br], basis[bc]).ravel()[:used_blocks]
+    soft = _qim_soft_score(coeffs, icfg.qim_step)
+
+    slots = np.arange(used_blocks) // reps
+    scores = np.bincount(slots, weights=soft, minlength=payload_bitlen)[:payload_bitlen]
+    counts = np.bincount(slots, minlength=payload_bitlen)[:payload_bitlen]
+    mags = np.bincount(slots, weights=np.abs(soft), minlength=payload_bitlen)[:needed_bits]
+    agree = np.abs(scores[:needed_bits]) / np.maximum(mags, 1e-9)
+    return scores.astype(np.float64), counts.astype(np.int64), float(agree.mean()) if len(agree) else 0.0
+
+
+class _SoftTally:
+    """
+    Running per-bit soft scores (sum of r0 - r1 over every block of every frame)
+    and block counts. The hard decision is only taken when voted() is called, so
+    confident blocks outweigh marginal ones instead of each frame casting one vote.
+    """
 
-def _extract_frames_for_read(video_path: str, out_dir: Path, frame_step: int) -> List[Path]:
+    def __init__(self, bitlen: int):
+        self.scores = np.zeros(bitlen, dtype=np.float64)
+        self.counts = np.zeros(bitlen, dtype=np.int64)
+        self.frames = 0
+
+    def add(self, scores: np.ndarray, counts: np.ndarray) -> None:
+        self.scores += scores
+        self.counts += counts
+        self.frames += 1
+
+    def voted(self) -> np.ndarray:
+        return soft_to_bits(self.scores)
+
+    def confidence(self, step: float) -> np.ndarray:
+        return soft_confidence(self.scores, self.counts, step)
+
+
+def _normal_sf(z: float) -> float:
+    return 0.5 * math.erfc(z / math.sqrt(2.0))
+
+
+def _success_reachable(
+    frame_acc: List[float],
+    bitlen: int,
+    frames_budget: int,
+    parity_bytes: int,
+    z: float,
+) -> bool:
     """
-    Extract frames at full rate, then pick every Nth by filename ordering.
-    (Simpler than filter_complex; OK for v1.)
+    Optimistic check whether voting over `frames_budget` frames could still leave
+    few enough byte errors for RS to correct (parity_bytes // 2).
+
+    Uses an upper confidence bound on per-frame bit accuracy (mean + z * stderr,
+    with the stderr floored at the binomial noise of a single frame) and a normal
+    approximation of the vote. If even that bound cannot succeed, stop decoding.
     """
-    out_dir.mkdir(parents=True, exist_ok=True)
-    _run(["ffmpeg", "-y", "-i", video_path, str(out_dir / "frame_%08d.png")])
-    frames = sorted(out_dir.glob("frame_*.png"))
-    if frame_step > 1:
-        frames = frames[::frame_step]
-    return frames
-
-def _majority_vote(batches: List[np.ndarray]) -> np.ndarray:
+    n = len(frame_acc)
+    mean = float(np.mean(frame_acc))
+    std = float(np.std(frame_acc, ddof=1)) if n > 1 else 0.5
+    std = max(std, 0.5 / math.sqrt(max(1, bitlen)))
+    p = min(1.0, mean + z * std / math.sqrt(n))
+    if p >= 1.0:
+        return True
+    if p <= 0.5:
+        return False
+    N = max(frames_budget, n)
+    bit_err = _normal_sf((N * p - N / 2.0) / math.sqrt(N * p * (1.0 - p)))
+    byte_err = 1.0 - (1.0 - bit_err) ** 8
+    return (bitlen // 8) * byte_err <= parity_bytes // 2
+
+
+def _stream_vote_and_decode(
+    frames: Iterator[np.ndarray],
+    payload_bitlen: int,
+    icfg: DCTConfig,
+    ecfg: DCTVideoExtractConfig,
+    use_ecc: bool,
+    ecc_parity_bytes: int,
+    check_text: Optional[str],
+    progress: Optional[ProgressFn] = None,
+    timings: Optional[Dict[str, float]] = None,
+    phases: int = 1,
+) -> dict:
     """
-    Combine multiple bit arrays (same length) by majority vote per position.
+    Accumulate per-bit soft scores as frames arrive, in `phases` separate tallies
+    (frame i goes to tally i % phases). The embedder marks one frame in every
+    frame_step, and which one depends on frames dropped or added upstream, so
+    every phase is voted in the same decode pass and the one with the best
+    lattice fit (mean soft confidence) wins.
+
+    With early exit on, try ECC every `decode_every` frames per phase (best fit
+    first) and stop as soon as the claim matches (or ECC succeeds when there is
+    no claim), or when _success_reachable says no phase ever will.
+    Wall time is split into decode (waiting on the ffmpeg pipe), analyze and
+    ecc and added to `timings`.
     """
-    if not batches:
-        return np.zeros(0, dtype=np.uint8)
-    M = np.stack(batches, axis=0).astype(np.uint8)
-    ones = M.sum(axis=0)
-    zeros = M.shape[0] - ones
-    return (ones >= zeros).astype(np.uint8)
+    want32 = hashlib.sha256(check_text.encode("utf-8")).digest() if check_text else None
+    expected_bits = None
+    if want32 is not None:
+        ref = ecc_encode_sha256(want32, parity_bytes=ecc_parity_bytes) if use_ecc else want32
+        expected_bits = np.unpackbits(np.frombuffer(ref, dtype=np.uint8)).astype(np.uint8)
+
+    phases = max(1, int(phases))
+    tallies = [_SoftTally(payload_bitlen) for _ in range(phases)]
+    frame_acc: List[List[float]] = [[] for _ in range(phases)]
+    every = max(1, int(ecfg.decode_every)) * phases
+    budget = int(ecfg.max_frames) * phases if ecfg.max_frames else 0
+    n = 0
+    stopped = None
+    timings = timings if timings is not None else {}
+    for k in ("decode", "analyze", "ecc"):
+        timings.setdefault(k, 0.0)
+    t0 = last = time.perf_counter()
+    frames = iter(frames)
+
+    def by_fit() -> List[int]:
+        fit = [float(t.confidence(icfg.qim_step).mean()) if t.frames else -1.0 for t in tallies]
+        return sorted(range(phases), key=lambda ph: -fit[ph])
+
+    while True:
+        t = time.perf_counter()
+        frame = next(frames, None)
+        now = time.perf_counter()
+        timings["decode"] += now - t
+        if frame is None:
+            break
+        if progress is not None and now - last >= 0.5:
+            last = now
+            progress({
+                "stage": "extract", "frame": n,
+                "fps": round(n / max(now - t0, 1e-9), 2),
+                "elapsed_s": round(now - t0, 3),
+            })
+
+        t = now
+        phase = n % phases
+        scores, counts, _ = frame_presence(_frame_plane(frame, ecfg.use_y_channel), payload_bitlen, icfg)
+        tallies[phase].add(scores, counts)
+        n += 1
+        if expected_bits is not None:
+            bits = soft_to_bits(scores)
+            L = min(len(bits), len(expected_bits))
+            frame_acc[phase].append(float(np.mean(bits[:L] == expected_bits[:L])))
+
+        timings["analyze"] += time.perf_counter() - t
+
+        if budget and n >= budget:
+            break
+        if not (ecfg.early_exit and use_ecc) or n % every:
+            continue
+
+        t = time.perf_counter()
+        for ph in by_fit():
+            orig32, ok = ecc_decode_to_sha256(bits_to_bytes(tallies[ph].voted()), parity_bytes=ecc_parity_bytes)
+            if ok and (want32 is None or orig32 == want32):
+                stopped = "match"
+                break
+        timings["ecc"] += time.perf_counter() - t
+        if stopped:
+            break
+        if expected_bits is not None and n >= 2 * every and not any(
+            _success_reachable(acc, payload_bitlen, budget // phases or 10 ** 6, ecc_parity_bytes, ecfg.giveup_z)
+            for acc in frame_acc if acc
+        ):
+            stopped = "unreachable"
+            break
+
+    close = getattr(frames, "close", None)
+    if close is not None:
+        close()   # stop ffmpeg now rather than at garbage collection
+    if n == 0:
+        return {}
+
+    order = by_fit()
+    best = order[0]
+    if use_ecc:
+        # the best-fitting phase normally decodes; if it does not, take any phase that does
+        for ph in order:
+            if ecc_decode_to_sha256(bits_to_bytes(tallies[ph].voted()), parity_bytes=ecc_parity_bytes)[1]:
+                best = ph
+                break
+    tally = tallies[best]
+    voted = tally.voted()
+    conf = tally.confidence(icfg.qim_step)
+    rec_bytes = bits_to_bytes(voted)
+    result = {
+        "payload_bitlen": int(payload_bitlen),
+        "used_repetition": int(icfg.repetition),
+        "frames_used": tally.frames,
+        "frames_decoded": n,
+        "frame_phase": best,
+        "phase_fit": [round(float(t.confidence(icfg.qim_step).mean()), 4) if t.frames else None for t in tallies],
+        "similarity": None,
+        "ecc_ok": None,
+        "match_text_hash": None,
+        "recovered_hex": hashlib.sha256(rec_bytes).hexdigest(),
+        # the recovered 32-byte claim hash (ECC-corrected when ECC is on and succeeds)
+        "payload_hex": None if use_ecc else rec_bytes[:32].hex(),
+        "early_exit": stopped,
+        "mean_confidence": float(conf.mean()) if len(conf) else None,
+        "bit_confidence": [round(float(c), 4) for c in conf],
+    }
+
+    if use_ecc:
+        orig32, ok = ecc_decode_to_sha256(rec_bytes, parity_bytes=ecc_parity_bytes)
+        result["ecc_ok"] = bool(ok)
+        if ok:
+            result["payload_hex"] = orig32.hex()
+        if want32 is not None:
+            result["match_text_hash"] = bool(want32 == orig32)
+    if expected_bits is not None:
+        # similarity at bit-level against the expected codeword (or raw hash without ECC)
+        L = min(len(voted), len(expected_bits))
+        result["similarity"] = float(np.mean(voted[:L] == expected_bits[:L]))
+
+    return result
+
 
 def extract_dct_video(
     input_video: str,
@@ -60,65 +381,52 @@ def extract_dct_video(
     use_ecc: bool = True,
     ecc_parity_bytes: int = 64,
     check_text: Optional[str] = None,
+    progress: Optional[ProgressFn] = None,
 ):
     """
-    Decode frames, run image-extract on every Nth frame, majority-vote bits, then
-    optionally ECC-decode and compare to SHA256(check_text).
-    Returns dict similar to your image API.
+    Stream-decode frames, sum per-bit soft scores across blocks and frames
+    separately for each of the frame_step phases (or over keyframes only when
+    ecfg.sampling == "keyframes"; hard decision only at the end), then
+    optionally ECC-decode and compare to SHA256(check_text). Decoding stops
+    early once the claim is recovered (see DCTVideoExtractConfig.early_exit).
+    Returns dict similar to your image API, plus per-stage wall times in
+    "timings" and the analyzed frame rate in "frames_per_s".
     """
+    t_start = time.perf_counter()
+    timings: Dict[str, float] = {}
     icfg = DCTConfig(qim_step=float(ecfg.qim_step), repetition=int(ecfg.repetition))
+    sampling = (ecfg.sampling or "dense").lower()
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling '{ecfg.sampling}' (expected one of {SAMPLING_MODES})")
+
+    if sampling == "keyframes":
+        result = _stream_vote_and_decode(
+            _iter_frames(input_video, keyframes_only=True), payload_bitlen, icfg, ecfg,
+            use_ecc, ecc_parity_bytes, check_text, progress=progress, timings=timings,
+        )
+        # ECC is the success signal; without it there is nothing to fall back on
+        if result and (not use_ecc or result["ecc_ok"]):
+            result["sampling"] = "keyframes"
+            return _with_timings(result, timings, t_start)
+
+    # every frame is decoded and voted per phase, so a shifted marking phase still decodes
+    result = _stream_vote_and_decode(
+        _iter_frames(input_video), payload_bitlen, icfg, ecfg,
+        use_ecc, ecc_parity_bytes, check_text, progress=progress, timings=timings,
+        phases=max(1, ecfg.frame_step),
+    )
+    if not result:
+        raise RuntimeError("No frames to analyze.")
+    result["sampling"] = "dense" if sampling == "dense" else "keyframes->dense"
+    return _with_timings(result, timings, t_start)
+
 
-    with tempfile.TemporaryDirectory() as td:
-        td_path = Path(td)
-        frames_dir = td_path / "frames"
-        frames = _extract_frames_for_read(input_video, frames_dir, max(1, ecfg.frame_step))
-        if ecfg.max_frames:
-            frames = frames[:ecfg.max_frames]
-        if not frames:
-            raise RuntimeError("No frames to analyze.")
-
-        recovered_sets: List[np.ndarray] = []
-        for fp in frames:
-            if ecfg.use_y_channel:
-                bits = extract_dct_image_ychannel(str(fp), payload_bitlen, icfg)
-            else:
-                bits = extract_dct_image(str(fp), payload_bitlen, icfg)
-            recovered_sets.append(bits.astype(np.uint8))
-
-        voted = _majority_vote(recovered_sets)
-        rec_bytes = bits_to_bytes(voted)
-        result = {
-            "payload_bitlen": int(payload_bitlen),
-            "used_repetition": int(ecfg.repetition),
-            "frames_used": len(recovered_sets),
-            "similarity": None,
-            "ecc_ok": None,
-            "match_text_hash": None,
-            "recovered_hex": __import__("hashlib").sha256(rec_bytes).hexdigest(),
-        }
-
-        if use_ecc:
-            orig32, ok = ecc_decode_to_sha256(rec_bytes, parity_bytes=ecc_parity_bytes)
-            result["ecc_ok"] = bool(ok)
-            if check_text:
-                want32 = __import__("hashlib").sha256(check_text.encode("utf-8")).digest()
-                result["match_text_hash"] = bool(want32 == orig32)
-
-                # build expected codeword to compute similarity at bit-level
-                expected_codeword = ecc_encode_sha256(want32, parity_bytes=ecc_parity_bytes)
-                exp_bits = np.unpackbits(np.frombuffer(expected_codeword, dtype=np.uint8)).astype(np.uint8)
-                L = min(len(voted), len(exp_bits))
-                result["similarity"] = float(np.mean(voted[:L] == exp_bits[:L]))
-        else:
-            if check_text:
-                want_bits = np.unpackbits(np.frombuffer(
-                    __import__("hashlib").sha256(check_text.encode("utf-8")).digest(),
-                    dtype=np.uint8
-                )).astype(np.uint8)
-                L = min(len(voted), len(want_bits))
-                result["similarity"] = float(np.mean(voted[:L] == want_bits[:L]))
-
-        return result
+def _with_timings(result: dict, timings: Dict[str, float], t_start: float) -> dict:
+    total = time.perf_counter() - t_start
+    result["timings"] = {k: round(v, 3) for k, v in timings.items()}
+    result["timings"]["total"] = round(total, 3)
+    result["frames_per_s"] = round(result["frames_used"] / max(total, 1e-9), 2)
+    return result
 
 
 # ---------- Simple CLI for bash testing ----------
@@ -131,9 +439,14 @@ def main():
     ap.add_argument("--use-y", action="store_true", default=True)
     ap.add_argument("--frame-step", type=int, default=2)
     ap.add_argument("--max-frames", type=int, default=120)
+    ap.add_argument("--sampling", choices=SAMPLING_MODES, default="dense",
+                    help="dense = every frame, voted per frame_step phase; keyframes = I-frames only (dense fallback on ECC failure)")
     ap.add_argument("--use-ecc", action="store_true", default=True)
     ap.add_argument("--ecc", type=int, default=64)
     ap.add_argument("--check-text", type=str, default=None, help="owner:<email_sha> to verify claim")
+    ap.add_argument("--no-early-exit", dest="early_exit", action="store_false", default=True,
+                    help="always vote over all sampled frames")
+    ap.add_argument("--decode-every", type=int, default=8, help="attempt ECC decode every K frames")
     ap.add_argument("--payload-bits", type=int, default=None, help="override payload bits; default = (32+ecc)*8 when ECC")
     args = ap.parse_args()
 
@@ -143,7 +456,8 @@ def main():
 
     ecfg = DCTVideoExtractConfig(
         qim_step=args.qim, repetition=args.rep, use_y_channel=True,
-        frame_step=max(1, args.frame_step), max_frames=args.max_frames
+        frame_step=max(1, args.frame_step), max_frames=args.max_frames,
+        sampling=args.sampling, early_exit=args.early_exit, decode_every=args.decode_every,
     )
     out = extract_dct_video(
         args.inp, payload_bits, ecfg,
@@ -0,0 +1,400 @@
+# apps/api/src/app/services/watermarking/video_jobs.py
+from __future__ import annotations
+
+import os
+import queue
+import shutil
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.db import models
+from app.db.session import SessionLocal
+from app.services.compute import call_compute, video_cost
+from app.services.uploads import IngestedUpload
+from src.app.services.watermarking.video_embed import ProgressFn
+from src.app.services.watermarking.video_service import (
+    build_video_embed_config,
+    build_video_payload,
+    embed_video_on_pool,
+    plan_video_config,
+    video_embed_headers,
+    video_extract_sync,
+)
+
+JOB_KINDS = ("embed", "extract")
+ACTIVE_STATES = ("queued", "running")
+TERMINAL_STATES = ("done", "failed", "cancelled")
+
+
+class VideoJobCancelled(Exception):
+    """Raised from the progress callback to abort a running job."""
+
+
+class VideoJobQueueFull(Exception):
+    """Raised on submit when queued + running jobs reach settings.video_job_queue_max."""
+
+    def __init__(self, active: int, limit: int):
+        super().__init__(f"Video job queue is full ({active}/{limit})")
+        self.active = active
+        self.limit = limit
+
+
+def _job_dir(job_id: str) -> Path:
+    return Path(settings.video_job_dir) / job_id
+
+
+def job_to_dict(job: models.VideoJob, queue_position: Optional[int] = None) -> Dict[str, Any]:
+    out: Dict[str, Any] = {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "original_filename": job.original_filename,
+        "params": job.params or {},
+        "error": job.error,
+        "cancel_requested": bool(job.cancel_requested),
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "result": job.result,   # extract JSON, or {"headers", "stats"} for embed
+        "has_output": job.status == "done" and bool(job.output_path),
+    }
+    if queue_position is not None:
+        out["queue_position"] = queue_position
+    return out
+
+
+class VideoJobRunner:
+    """
+    Persistent FIFO for long video embeds/extracts. Jobs live in the video_jobs
+    table, so they outlive the process; the in-memory queue only carries ids to
+    the worker threads. Those only orchestrate: the decode / mark / encode work
+    runs on the compute pool (services/compute.py), whose progress events are
+    relayed back here.
+
+    A running job is leased (video_job_leases) to the process running it,
+    which renews the lease every lease_s / 4. Any runner re-queues running
+    jobs whose lease has lapsed, at start and then periodically, so jobs of a
+    dead process are picked up again while those of a live one (another API
+    replica, or a restart that raced it) are left alone. The same beat removes
+    the directories of jobs that finished more than retention_s ago.
+    """
+
+    def __init__(self, workers: int, queue_max: int, lease_s: float = 60.0, retention_s: float = 0.0):
+        self.workers = max(1, int(workers))
+        self.queue_max = max(1, int(queue_max))
+        self.lease_s = max(1.0, float(lease_s))
+        self.retention_s = max(0.0, float(retention_s))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._q: "queue.Queue[str]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        # live progress is in-memory only; the final timings land in job.result
+        self._progress: Dict[str, Dict[str, Any]] = {}
+        self._cancel: set = set()
+        self._running: set = set()
+
+    # ---- lifecycle ----
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            self._reclaim()
+            with SessionLocal() as db:
+                pending = (
+                    db.query(models.VideoJob.id)
+                    .filter(models.VideoJob.status == "queued")
+                    .order_by(models.VideoJob.created_at)
+                    .all()
+                )
+            for (job_id,) in pending:
+                self._q.put(job_id)
+            for n in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"video-job-{n}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            t = threading.Thread(target=self._heartbeat, name="video-job-lease", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    # ---- leases ----
+    def _reclaim(self) -> List[str]:
+        """Re-queue running jobs whose lease lapsed (or that never got one); returns their ids."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_s)
+        with SessionLocal() as db:
+            live = db.query(models.VideoJobLease.job_id).filter(models.VideoJobLease.heartbeat_at >= cutoff)
+            stale = [
+                job_id for (job_id,) in db.query(models.VideoJob.id)
+                .filter(models.VideoJob.status == "running", models.VideoJob.id.not_in(live))
+            ]
+            if not stale:
+                return []
+            (db.query(models.VideoJobLease)
+             .filter(models.VideoJobLease.job_id.in_(stale))
+             .delete(synchronize_session=False))
+            (db.query(models.VideoJob)
+             .filter(models.VideoJob.id.in_(stale), models.VideoJob.status == "running")
+             .update({"status": "queued", "started_at": None}, synchronize_session=False))
+            db.commit()
+        return stale
+
+    def _sweep(self) -> List[str]:
+        """Remove the directories of jobs finished over retention_s ago; returns their ids."""
+        root = Path(settings.video_job_dir)
+        if not self.retention_s or not root.is_dir():
+            return []
+        dirs = [p.name for p in root.iterdir() if p.is_dir()]
+        if not dirs:
+            return []
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention_s)
+        with SessionLocal() as db:
+            # only dirs with a settled row: a job being submitted has no committed row yet
+            expired = [
+                job_id for (job_id,) in db.query(models.VideoJob.id).filter(
+                    models.VideoJob.id.in_(dirs),
+                    models.VideoJob.status.in_(TERMINAL_STATES),
+                    models.VideoJob.finished_at < cutoff,
+                )
+            ]
+            if not expired:
+                return []
+            for job_id in expired:
+                shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+            (db.query(models.VideoJob)
+             .filter(models.VideoJob.id.in_(expired))
+             .update({"output_path": None}, synchronize_session=False))
+            db.commit()
+        return expired
+
+    def _heartbeat(self) -> None:
+        """Renew our leases, pick up cancels requested through other processes, reclaim lapsed jobs, sweep old ones."""
+        while True:
+            time.sleep(self.lease_s / 4)
+            try:
+                with self._lock:
+                    mine = list(self._running)
+                if mine:
+                    with SessionLocal() as db:
+                        db.query(models.VideoJobLease).filter(
+                            models.VideoJobLease.job_id.in_(mine), models.VideoJobLease.owner == self.owner,
+                        ).update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+                        cancelled = [
+                            job_id for (job_id,) in db.query(models.VideoJob.id)
+                            .filter(models.VideoJob.id.in_(mine), models.VideoJob.cancel_requested.is_(True))
+                        ]
+                        db.commit()
+                    with self._lock:
+                        self._cancel.update(cancelled)
+                for job_id in self._reclaim():
+                    self._q.put(job_id)
+                self._sweep()
+            except Exception:
+                continue   # a locked / unreachable DB is retried on the next beat
+
+    # ---- API ----
+    def submit(self, kind: str, upload: IngestedUpload, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a job for an upload already spooled to disk; the file is moved into the job dir."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        self.start()
+        with self._lock, SessionLocal() as db:
+            active = db.query(models.VideoJob).filter(models.VideoJob.status.in_(ACTIVE_STATES)).count()
+            if active >= self.queue_max:
+                raise VideoJobQueueFull(active, self.queue_max)
+
+            job = models.VideoJob(kind=kind, status="queued", original_filename=upload.filename,
+                                  input_path="", params={**params, "input_sha256": upload.sha256_hex})
+            db.add(job)
+            db.flush()
+            jdir = _job_dir(job.id)
+            jdir.mkdir(parents=True, exist_ok=True)
+            suffix = Path(upload.filename or "upload.mp4").suffix or ".mp4"
+            in_path = jdir / f"input{suffix}"
+            shutil.move(str(upload.path), in_path)   # a rename when spooled into video_job_dir
+            job.input_path = str(in_path)
+            db.commit()
+            out = job_to_dict(job, queue_position=active)
+        self._q.put(out["job_id"])
+        return out
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with SessionLocal() as db:
+            job = db.get(models.VideoJob, job_id)
+            if job is None:
+                return None
+            pos = None
+            if job.status == "queued":
+                pos = (
+                    db.query(models.VideoJob)
+                    .filter(models.VideoJob.status.in_(ACTIVE_STATES),
+                            models.VideoJob.created_at < job.created_at)
+                    .count()
+                )
+            out = job_to_dict(job, queue_position=pos)
+        if out["status"] == "running":
+            out["progress"] = self.progress(job_id)
+        return out
+
+    def output(self, job_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(output_path, result) of a finished embed job, else None."""
+        with SessionLocal() as db:
+            job = db.get(models.VideoJob, job_id)
+            if job is None or job.status != "done" or not job.output_path:
+                return None
+            return job.output_path, dict(job.result or {})
+
+    def progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Latest progress event of a running job (with a "seq" counter), else None."""
+        with self._lock:
+            ev = self._progress.get(job_id)
+            return dict(ev) if ev is not None else None
+
+    def _progress_fn(self, job_id: str):
+        def report(event: Dict[str, Any]) -> None:
+            with self._lock:
+                prev = self._progress.get(job_id)
+                self._progress[job_id] = {**event, "seq": (prev["seq"] + 1) if prev else 0}
+                cancelled = job_id in self._cancel
+            if cancelled:
+                raise VideoJobCancelled(job_id)
+        return report
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Queued jobs are cancelled immediately. Running jobs are flagged and
+        stop at their next progress event (ffmpeg is killed, output discarded).
+        """
+        with self._lock, SessionLocal() as db:
+            job = db.get(models.VideoJob, job_id)
+            if job is None:
+                return None
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = datetime.utcnow()
+                shutil.rmtree(_job_dir(job.id), ignore_errors=True)
+            elif job.status == "running":
+                job.cancel_requested = True
+                self._cancel.add(job.id)   # next progress event aborts the pipeline
+            db.commit()
+            return job_to_dict(job)
+
+    # ---- worker ----
+    def _claim(self, job_id: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        with self._lock, SessionLocal() as db:
+            # conditional update, so two runners that both re-queued a job can't both run it
+            claimed = (
+                db.query(models.VideoJob)
+                .filter(models.VideoJob.id == job_id, models.VideoJob.status == "queued")
+                .update({"status": "running", "started_at": now}, synchronize_session=False)
+            )
+            if not claimed:
+                return None   # cancelled while waiting, or a duplicate id after a reclaim
+            db.merge(models.VideoJobLease(job_id=job_id, owner=self.owner, heartbeat_at=now))
+            db.commit()
+            self._running.add(job_id)
+            job = db.get(models.VideoJob, job_id)
+            return {"id": job.id, "kind": job.kind, "input_path": job.input_path, "params": dict(job.params or {})}
+
+    def _finish(self, job_id: str, *, output_path: Optional[str] = None,
+                result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._lock, SessionLocal() as db:
+            job = db.get(models.VideoJob, job_id)
+            if job is None:
+                return
+            job.finished_at = datetime.utcnow()
+            self._progress.pop(job_id, None)
+            self._cancel.discard(job_id)
+            self._running.discard(job_id)
+            db.query(models.VideoJobLease).filter(models.VideoJobLease.job_id == job_id).delete()
+            if job.cancel_requested:
+                job.status = "cancelled"
+                shutil.rmtree(_job_dir(job.id), ignore_errors=True)
+            elif error is not None:
+                job.status = "failed"
+                job.error = error
+            else:
+                job.status = "done"
+                job.output_path = output_path
+                job.result = result
+            db.commit()
+        # the upload is no longer needed once the job has settled (output stays)
+        for p in _job_dir(job_id).glob("input*"):
+            p.unlink(missing_ok=True)
+
+    def _worker(self) -> None:
+        while True:
+            job_id = self._q.get()
+            try:
+                job = self._claim(job_id)
+                if job is None:
+                    continue
+                report = self._progress_fn(job_id)
+                try:
+                    if job["kind"] == "embed":
+                        out_path, result = _run_embed_job(job, report)
+                    else:
+                        out_path, result = None, _run_extract_job(job, report)
+                except VideoJobCancelled:
+                    self._finish(job_id, error="cancelled")
+                except Exception as e:
+                    self._finish(job_id, error=str(e))
+                else:
+                    self._finish(job_id, output_path=out_path, result=result)
+            finally:
+                self._q.task_done()
+
+
+def _run_embed_job(job: Dict[str, Any], progress: ProgressFn) -> Tuple[str, Dict[str, Any]]:
+    p = job["params"]
+    ecc_par = int(p.get("ecc_parity_bytes") or 64)
+    payload = build_video_payload(p["text"], bool(p.get("use_ecc", True)), ecc_par)
+    vcfg = build_video_embed_config(
+        preset=p.get("preset", "facebook"),
+        qim_step=p.get("qim_step"), repetition=p.get("repetition"),
+        use_y_channel=p.get("use_y_channel"), use_ecc=bool(p.get("use_ecc", True)),
+        ecc_parity_bytes=ecc_par, frame_step=p.get("frame_step"),
+        long_edge=p.get("long_edge"), fps=p.get("fps"), crf=p.get("crf"),
+        segments=int(p.get("segments") or 1),
+        embed_mode=p.get("embed_mode", "frame_step"),
+        keyframe_interval=p.get("keyframe_interval"),
+    )
+    plan_headers = plan_video_config(job["input_path"], vcfg,
+                                     deadline_s=p.get("deadline_s"), target_speed=p.get("target_speed"))
+    out_path = _job_dir(job["id"]) / "output.mp4"
+    stats = embed_video_on_pool(job["input_path"], str(out_path), payload, vcfg,
+                                lossless=bool(p.get("lossless", False)), progress=progress)
+    headers = {**video_embed_headers(vcfg.preset, vcfg, stats), **plan_headers}
+    return str(out_path), {"headers": headers, "stats": stats}
+
+
+def _run_extract_job(job: Dict[str, Any], progress: ProgressFn) -> Dict[str, Any]:
+    p = job["params"]
+    frames = 120 * max(1, int(p.get("frame_step", 2)))   # video_extract_sync's max_frames
+    return call_compute(
+        video_extract_sync, job["input_path"],
+        cost=video_cost(job["input_path"], frames), wait=True,
+        qim_step=float(p.get("qim_step", 24.0)),
+        repetition=int(p.get("repetition", 160)),
+        frame_step=int(p.get("frame_step", 2)),
+        use_ecc=bool(p.get("use_ecc", True)),
+        ecc_parity_bytes=int(p.get("ecc_parity_bytes", 64)),
+        check_text=p.get("check_text"),
+        sampling=p.get("sampling", "dense"),
+        progress=progress,
+    )
+
+
+_runner: Optional[VideoJobRunner] = None
+
+
+def get_video_job_runner() -> VideoJobRunner:
+    global _runner
+    if _runner is None:
+        _runner = VideoJobRunner(settings.video_job_workers, settings.video_job_queue_max,
+                                 settings.video_job_lease_s, settings.video_job_retention_s)
+    return _runner
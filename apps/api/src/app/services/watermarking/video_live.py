@@ -0,0 +1,305 @@
+# apps/api/src/app/services/watermarking/video_live.py
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+import numpy as np
+
+from src.app.services.watermarking.schemas import DCTConfig
+from src.app.services.watermarking.image_embed import BlockReuseCache, embed_dct_bgr_ychannel, embed_dct_plane
+from src.app.services.watermarking.video_embed import (
+    FFMPEG, FFPROBE, DCTVideoConfig, _build_payload, _drain, _probe_fps, _scaled_size,
+)
+from src.app.services.watermarking.video_extract import _probe_frame_size
+
+LIVE_OUTPUT_FORMATS = ("mpegts", "fmp4")
+
+
+@dataclass
+class LiveEmbedConfig:
+    output_format: str = "mpegts"          # mpegts | fmp4 (fragmented MP4)
+    realtime_input: bool = False           # read a file at its native rate (-re), as a live stand-in
+    latency_budget_ms: float = 200.0       # max time a frame may trail real time; beyond it marking is skipped
+    width: Optional[int] = None            # required for pipe input (cannot be probed); else probed
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    gop_seconds: float = 2.0
+    audio: bool = True                     # pass the input's first audio track through (not for stdin)
+    window: int = 10000                    # frames kept for the latency percentiles
+    input_args: Tuple[str, ...] = ()       # extra demuxer options, e.g. ("-probesize", "32k") for UDP
+
+
+class LatencyStats:
+    """Rolling per-frame latency samples (ms) with percentile summaries."""
+
+    def __init__(self, window: int = 10000):
+        self.proc_ms: deque = deque(maxlen=window)
+        self.lag_ms: deque = deque(maxlen=window)
+
+    def add(self, proc_ms: float, lag_ms: float) -> None:
+        self.proc_ms.append(proc_ms)
+        self.lag_ms.append(lag_ms)
+
+    @staticmethod
+    def _pct(values: deque) -> Dict[str, float]:
+        if not values:
+            return {"p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0}
+        arr = np.fromiter(values, dtype=np.float64)
+        p50, p90, p99 = np.percentile(arr, [50, 90, 99])
+        return {"p50": round(float(p50), 2), "p90": round(float(p90), 2),
+                "p99": round(float(p99), 2), "max": round(float(arr.max()), 2)}
+
+    def summary(self) -> Dict[str, Any]:
+        return {"processing_ms": self._pct(self.proc_ms), "lag_ms": self._pct(self.lag_ms)}
+
+
+def _has_audio(source: str) -> bool:
+    p = subprocess.run(
+        [FFPROBE, "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=index",
+         "-of", "csv=p=0", source],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    return p.returncode == 0 and bool(p.stdout.strip())
+
+
+def _live_decode_cmd(source: str, w: int, h: int, pix_fmt: str, lcfg: LiveEmbedConfig,
+                     audio_fd: Optional[int]) -> List[str]:
+    cmd = [FFMPEG, "-v", "error", *lcfg.input_args]
+    if lcfg.realtime_input:
+        cmd += ["-re"]
+    cmd += ["-i", "pipe:0" if source == "-" else source,
+            "-map", "0:v:0", "-vf", f"scale={w}:{h}",
+            "-f", "rawvideo", "-pix_fmt", pix_fmt, "pipe:1"]
+    if audio_fd is not None:
+        # audio goes straight to the encoder through an OS pipe, never via Python
+        cmd += ["-map", "0:a:0?", "-c:a", "copy", "-f", "nut", f"pipe:{audio_fd}"]
+    return cmd
+
+
+def _live_encode_cmd(output: str, w: int, h: int, fps: float, pix_fmt: str,
+                     vcfg: DCTVideoConfig, lcfg: LiveEmbedConfig, audio_fd: Optional[int]) -> List[str]:
+    cmd = [FFMPEG, "-v", "error", "-y",
+           "-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{w}x{h}", "-r", f"{fps:g}", "-i", "pipe:0"]
+    if audio_fd is not None:
+        cmd += ["-thread_queue_size", "1024", "-f", "nut", "-i", f"pipe:{audio_fd}",
+                "-map", "0:v:0", "-map", "1:a:0?", "-c:a", "aac", "-b:a", "128k"]
+    gop = max(1, int(round(fps * lcfg.gop_seconds)))
+    cmd += [
+        "-c:v", "libx264", "-preset", vcfg.x264_preset, "-tune", "zerolatency",
+        "-crf", str(vcfg.crf), "-pix_fmt", "yuv420p", "-g", str(gop),
+        *(["-threads", str(int(vcfg.x264_threads))] if vcfg.x264_threads else []),
+    ]
+    if lcfg.output_format == "fmp4":
+        cmd += ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+                "-frag_duration", "500000"]
+    else:
+        cmd += ["-f", "mpegts"]
+    cmd += ["pipe:1" if output == "-" else output]
+    return cmd
+
+
+def run_live_embed(
+    source: str,
+    output: str,
+    payload_bytes: bytes,
+    vcfg: DCTVideoConfig,
+    lcfg: LiveEmbedConfig,
+    *,
+    stop: Optional[threading.Event] = None,
+    on_stats: Optional[Callable[[Dict[str, Any]], None]] = None,
+    stats_every_s: float = 5.0,
+) -> Dict[str, Any]:
+    """
+    Mark an unbounded stream (file, URL such as udp://... / rtp://..., or "-"
+    for stdin) and write continuous MPEG-TS or fragmented MP4 to `output`
+    (path, URL, or "-" for stdout). Runs until the input ends or `stop` is set.
+
+    Every frame is passed on; none are dropped. A scheduled frame (vcfg.is_marked)
+    is marked only if it would still leave the encoder within
+    lcfg.latency_budget_ms of its real-time slot, using a running estimate of the
+    mark cost. Otherwise it goes through unmarked until the pipeline catches up.
+    Returns frame counters and processing / lag latency percentiles.
+    """
+    if lcfg.output_format not in LIVE_OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output_format '{lcfg.output_format}' (expected one of {LIVE_OUTPUT_FORMATS})")
+    if lcfg.width and lcfg.height:
+        w, h = int(lcfg.width), int(lcfg.height)
+    elif source == "-":
+        raise ValueError("width/height are required when reading from a pipe")
+    else:
+        w, h = _probe_frame_size(source)
+    w, h = _scaled_size(w, h, vcfg.long_edge)
+    fps = float(lcfg.fps or (30.0 if source == "-" else _probe_fps(source)))
+    channels = 3 if vcfg.use_y_channel else 1
+    pix_fmt = "bgr24" if channels == 3 else "gray"
+    frame_bytes = w * h * channels
+    shape = (h, w, 3) if channels == 3 else (h, w)
+    payload_bits = np.unpackbits(np.frombuffer(payload_bytes, dtype=np.uint8)).astype(np.uint8)
+    icfg = DCTConfig(qim_step=float(vcfg.qim_step), repetition=int(vcfg.repetition))
+    cache = BlockReuseCache() if vcfg.reuse_static_blocks else None
+    budget_s = float(lcfg.latency_budget_ms) / 1000.0
+    stop = stop or threading.Event()
+    stopped_by_caller = False
+
+    audio_r = audio_w = None
+    # an empty audio output would make the decoder fail, so only wire it up if there is a track
+    if lcfg.audio and source != "-" and _has_audio(source):
+        audio_r, audio_w = os.pipe()
+    dec = subprocess.Popen(
+        _live_decode_cmd(source, w, h, pix_fmt, lcfg, audio_w),
+        stdin=None if source == "-" else subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        pass_fds=(audio_w,) if audio_w is not None else (),
+    )
+    enc = subprocess.Popen(
+        _live_encode_cmd(output, w, h, fps, pix_fmt, vcfg, lcfg, audio_r),
+        stdin=subprocess.PIPE, stdout=None if output == "-" else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        pass_fds=(audio_r,) if audio_r is not None else (),
+    )
+    for fd in (audio_r, audio_w):   # the children hold their own copies
+        if fd is not None:
+            os.close(fd)
+    # a blocked read only ends when the decoder does, so `stop` kills it
+    threading.Thread(target=lambda: stop.wait() and dec.kill(), daemon=True).start()
+    dec_err: deque = deque(maxlen=20)
+    enc_err: deque = deque(maxlen=20)
+    for stream, tail in ((dec.stderr, dec_err), (enc.stderr, enc_err)):
+        threading.Thread(target=_drain, args=(stream, tail), daemon=True).start()
+
+    lat = LatencyStats(lcfg.window)
+    n = marked = skipped = 0
+    mark_cost = 0.0            # EWMA of seconds per marked frame
+    t0 = None
+    last_report = time.perf_counter()
+
+    def snapshot() -> Dict[str, Any]:
+        elapsed = (time.perf_counter() - t0) if t0 is not None else 0.0
+        return {
+            "frames": n, "frames_marked": marked, "frames_skipped_behind": skipped,
+            "fps": round(n / elapsed, 2) if elapsed > 0 else 0.0,
+            "input_fps": fps, "size": [w, h],
+            "mark_cost_ms": round(mark_cost * 1000.0, 2),
+            **lat.summary(),
+        }
+
+    try:
+        while True:
+            buf = dec.stdout.read(frame_bytes)
+            if len(buf) < frame_bytes:
+                stopped_by_caller = stop.is_set()
+                break
+            t_in = time.perf_counter()
+            if t0 is None:
+                t0 = t_in
+            slot = t0 + n / fps            # when this frame is due in real time
+            lag = t_in - slot
+
+            if vcfg.is_marked(n):
+                if lag + mark_cost <= budget_s:
+                    frame = np.frombuffer(buf, dtype=np.uint8).reshape(shape).astype(np.float32)
+                    if channels == 3:
+                        wm = embed_dct_bgr_ychannel(frame, payload_bits, icfg, cache=cache)
+                    else:
+                        wm = embed_dct_plane(frame, payload_bits, icfg, cache=cache)
+                    buf = np.clip(np.round(wm), 0, 255).astype(np.uint8).tobytes()
+                    cost = time.perf_counter() - t_in
+                    mark_cost = cost if marked == 0 else 0.8 * mark_cost + 0.2 * cost
+                    marked += 1
+                else:
+                    skipped += 1
+
+            enc.stdin.write(buf)
+            t_out = time.perf_counter()
+            lat.add((t_out - t_in) * 1000.0, (t_out - slot) * 1000.0)
+            n += 1
+
+            if on_stats is not None and t_out - last_report >= stats_every_s:
+                last_report = t_out
+                on_stats(snapshot())
+    except BrokenPipeError:
+        pass   # encoder / output went away
+    finally:
+        if dec.poll() is None:
+            dec.kill()
+        try:
+            enc.stdin.close()
+        except OSError:
+            pass
+        dec.wait()
+        enc.wait()
+        dec.stdout.close()
+
+    stop.set()
+    if n == 0 and not stopped_by_caller:
+        raise RuntimeError("Live embed produced no frames: " + "\n".join([*dec_err, *enc_err]))
+    return snapshot()
+
+
+# ---------- CLI ----------
+def main():
+    import argparse
+    import json
+    import shlex
+    import signal
+
+    ap = argparse.ArgumentParser(description="Watermark a live/continuous video stream.")
+    ap.add_argument("--in", dest="inp", required=True, help="file, URL (udp://, rtp://, srt://...) or - for stdin")
+    ap.add_argument("--out", dest="outp", required=True, help="file, URL (udp://...) or - for stdout")
+    ap.add_argument("--text", required=True, help="claim text e.g. owner:<email_sha>")
+    ap.add_argument("--format", choices=LIVE_OUTPUT_FORMATS, default="mpegts")
+    ap.add_argument("--re", dest="realtime", action="store_true", help="read input at native rate (file as live stand-in)")
+    ap.add_argument("--budget-ms", type=float, default=200.0, help="per-frame latency budget")
+    ap.add_argument("--qim", type=float, default=24.0)
+    ap.add_argument("--rep", type=int, default=160)
+    ap.add_argument("--ecc", type=int, default=64)
+    ap.add_argument("--no-ecc", action="store_true", help="disable ECC")
+    ap.add_argument("--frame-step", type=int, default=2, help="mark every Nth frame (when on time)")
+    ap.add_argument("--long-edge", type=int, default=None)
+    ap.add_argument("--crf", type=int, default=23)
+    ap.add_argument("--x264-preset", default="veryfast")
+    ap.add_argument("--size", default=None, help="WxH of the input (required for stdin)")
+    ap.add_argument("--fps", type=float, default=None, help="input frame rate (default: probed, 30 for stdin)")
+    ap.add_argument("--input-args", default="", help='extra ffmpeg input options, e.g. "-probesize 32k"')
+    ap.add_argument("--no-audio", dest="audio", action="store_false", default=True)
+    ap.add_argument("--stats-every", type=float, default=5.0, help="seconds between progress lines on stderr")
+    args = ap.parse_args()
+
+    width = height = None
+    if args.size:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+    vcfg = DCTVideoConfig(
+        qim_step=args.qim, repetition=args.rep, use_y_channel=True,
+        use_ecc=not args.no_ecc, ecc_parity_bytes=args.ecc,
+        frame_step=max(1, args.frame_step), preset="original", long_edge=args.long_edge,
+        crf=args.crf, x264_preset=args.x264_preset,
+    )
+    lcfg = LiveEmbedConfig(
+        output_format=args.format, realtime_input=args.realtime, latency_budget_ms=args.budget_ms,
+        width=width, height=height, fps=args.fps, audio=args.audio,
+        input_args=tuple(shlex.split(args.input_args)),
+    )
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    def report(s: Dict[str, Any]) -> None:
+        print(f"[live] frames={s['frames']} marked={s['frames_marked']} skipped={s['frames_skipped_behind']} "
+              f"fps={s['fps']} proc_p99={s['processing_ms']['p99']}ms lag_p99={s['lag_ms']['p99']}ms",
+              file=sys.stderr, flush=True)
+
+    payload = _build_payload(args.text, not args.no_ecc, args.ecc)
+    out = run_live_embed(args.inp, args.outp, payload, vcfg, lcfg, stop=stop,
+                         on_stats=report, stats_every_s=args.stats_every)
+    # stdout may carry the stream itself
+    print(json.dumps(out, indent=2), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
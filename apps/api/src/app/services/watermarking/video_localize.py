@@ -0,0 +1,357 @@
+# apps/api/src/app/services/watermarking/video_localize.py
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from typing import Optional, List, Dict, Any, Tuple
+
+import numpy as np
+
+from src.app.services.watermarking.schemas import DCTConfig
+from src.app.services.watermarking.helpers import bits_to_bytes
+from src.app.services.watermarking.ecc import ecc_decode_to_sha256
+from src.app.services.watermarking.video_extract import (
+    ProgressFn, _SoftTally, _frame_plane, _iter_frames, frame_presence,
+)
+from src.app.services.watermarking.video_planner import probe_video
+
+
+@dataclass
+class DCTVideoLocalizeConfig:
+    qim_step: float = 24.0
+    repetition: int = 160
+    use_y_channel: bool = True
+
+    # fixed-length windows, `hop_s` apart (None = window_s / 2, i.e. 50% overlap)
+    window_s: float = 4.0
+    hop_s: Optional[float] = None
+
+    # A frame counts as marked when the blocks repeating each payload bit agree
+    # in sign (see frame_presence). Unmarked frames sit around 0.1-0.35, marked
+    # ones after a re-encode around 0.75-1.0.
+    presence_threshold: float = 0.5
+    # a window whose first `probe_frames` frames are all below the threshold is
+    # skipped without decoding the rest
+    probe_frames: int = 8
+
+    workers: Optional[int] = None         # worker processes (None = one per CPU)
+
+
+def _scan_window(
+    input_video: str,
+    index: int,
+    start_s: float,
+    duration_s: float,
+    fps: float,
+    payload_bitlen: int,
+    lcfg: Dict[str, Any],
+    use_ecc: bool,
+    ecc_parity_bytes: int,
+    want32: Optional[bytes],
+) -> Dict[str, Any]:
+    """Decode one time window and vote over its marked frames (runs in a worker process)."""
+    cfg = DCTVideoLocalizeConfig(**lcfg)
+    icfg = DCTConfig(qim_step=float(cfg.qim_step), repetition=int(cfg.repetition))
+    tally = _SoftTally(payload_bitlen)
+    presence: List[float] = []
+    marked_idx: List[int] = []
+    skipped = False
+
+    frames = _iter_frames(input_video, start_s=start_s, duration_s=duration_s)
+    try:
+        for i, frame in enumerate(frames):
+            scores, counts, p = frame_presence(_frame_plane(frame, cfg.use_y_channel), payload_bitlen, icfg)
+            presence.append(p)
+            if p >= cfg.presence_threshold:
+                tally.add(scores, counts)
+                marked_idx.append(i)
+            elif not marked_idx and i + 1 >= cfg.probe_frames:
+                skipped = True
+                break
+    finally:
+        frames.close()
+
+    out: Dict[str, Any] = {
+        "index": index,
+        "start_s": round(start_s, 3),
+        "end_s": round(start_s + duration_s, 3),
+        "frames_scanned": len(presence),
+        "frames_marked": len(marked_idx),
+        "presence": round(max(presence), 4) if presence else 0.0,
+        "skipped": skipped,
+        "marked_from_s": None,
+        "marked_to_s": None,
+        "ecc_ok": None,
+        "payload_hex": None,
+        "match_text_hash": None,
+        "mean_confidence": None,
+    }
+    if not marked_idx:
+        return out
+
+    out["marked_from_s"] = round(start_s + marked_idx[0] / fps, 3)
+    out["marked_to_s"] = round(start_s + (marked_idx[-1] + 1) / fps, 3)
+    out["mean_confidence"] = round(float(tally.confidence(icfg.qim_step).mean()), 4)
+    rec_bytes = bits_to_bytes(tally.voted())
+    if use_ecc:
+        orig32, ok = ecc_decode_to_sha256(rec_bytes, parity_bytes=ecc_parity_bytes)
+        out["ecc_ok"] = bool(ok)
+        if ok:
+            out["payload_hex"] = orig32.hex()
+    else:
+        orig32 = rec_bytes[:32]
+        out["payload_hex"] = orig32.hex()
+    if want32 is not None:
+        out["match_text_hash"] = bool(out["payload_hex"] is not None and orig32 == want32)
+    return out
+
+
+def _first_marked_s(
+    input_video: str,
+    start_s: float,
+    duration_s: float,
+    fps: float,
+    payload_bitlen: int,
+    lcfg: Dict[str, Any],
+) -> Optional[float]:
+    """Time of the first frame in [start_s, start_s + duration_s) that passes the presence threshold."""
+    cfg = DCTVideoLocalizeConfig(**lcfg)
+    icfg = DCTConfig(qim_step=float(cfg.qim_step), repetition=int(cfg.repetition))
+    frames = _iter_frames(input_video, start_s=start_s, duration_s=duration_s)
+    try:
+        for i, frame in enumerate(frames):
+            _, _, p = frame_presence(_frame_plane(frame, cfg.use_y_channel), payload_bitlen, icfg)
+            if p >= cfg.presence_threshold:
+                return round(start_s + i / fps, 3)
+    finally:
+        frames.close()
+    return None
+
+
+def _windows(duration: float, window_s: float, hop_s: float) -> List[Tuple[float, float]]:
+    starts = np.arange(0.0, max(duration - window_s, 0.0) + 1e-6, hop_s)
+    out = [(float(s), min(window_s, duration - float(s))) for s in starts]
+    # make sure the tail is covered when duration is not on the hop grid
+    if out[-1][0] + out[-1][1] < duration - 1e-3:
+        out.append((max(0.0, duration - window_s), min(window_s, duration)))
+    return out
+
+
+def merge_windows(windows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Join consecutive windows that carry marked frames with the same outcome
+    (same payload_hex, or both undecodable) into time ranges. Range bounds are
+    the first/last marked frame, not the window edges, so overlapping windows
+    do not blur the boundaries.
+    """
+    ranges: List[Dict[str, Any]] = []
+    for w in sorted(windows, key=lambda w: w["start_s"]):
+        if not w["frames_marked"]:
+            continue
+        cur = ranges[-1] if ranges else None
+        adjacent = cur is not None and cur["last_window"] + 1 == w["index"]
+        # a window that only clips the edge of a decoded range has too few
+        # marked frames to decode on its own; it is part of that range
+        if adjacent and w["payload_hex"] is None and cur["payload_hex"] is not None \
+                and w["marked_to_s"] <= cur["end_s"]:
+            cur["last_window"] = w["index"]
+            continue
+        if adjacent and cur["payload_hex"] is None and w["payload_hex"] is not None \
+                and cur["start_s"] >= w["marked_from_s"]:
+            ranges.pop()
+            cur, adjacent = None, False
+        if adjacent and cur["payload_hex"] == w["payload_hex"]:
+            cur["start_s"] = min(cur["start_s"], w["marked_from_s"])
+            cur["end_s"] = max(cur["end_s"], w["marked_to_s"])
+            cur["_conf"].append((w["mean_confidence"], w["frames_marked"]))
+            cur["windows"] += 1
+            cur["last_window"] = w["index"]
+            continue
+        ranges.append({
+            "start_s": w["marked_from_s"],
+            "end_s": w["marked_to_s"],
+            "payload_hex": w["payload_hex"],
+            "ecc_ok": w["ecc_ok"],
+            "match_text_hash": w["match_text_hash"],
+            "windows": 1,
+            "last_window": w["index"],
+            "_conf": [(w["mean_confidence"], w["frames_marked"])],
+        })
+    for r in ranges:
+        conf = r.pop("_conf")
+        r.pop("last_window")
+        total = sum(n for _, n in conf)
+        # frame-weighted, so a window that only clips the edge of a range counts less
+        r["confidence"] = round(sum(c * n for c, n in conf) / max(total, 1), 4)
+    return ranges
+
+
+def _map(pool: Optional[ProcessPoolExecutor], fn, arglist: List[tuple], ordered: bool = False):
+    """Run fn(*args) for each entry, inline without a pool; yields results as they finish unless ordered."""
+    if pool is None:
+        for a in arglist:
+            yield fn(*a)
+        return
+    futures = [pool.submit(fn, *a) for a in arglist]
+    for fut in (futures if ordered else as_completed(futures)):
+        yield fut.result()
+
+
+def plan_localize(
+    input_video: str,
+    payload_bitlen: int,
+    lcfg: DCTVideoLocalizeConfig,
+    use_ecc: bool = True,
+    ecc_parity_bytes: int = 64,
+    check_text: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Probe the video and cut it into windows: the _scan_window arguments of each one under "scans"."""
+    probe = probe_video(input_video)
+    duration, fps = probe["duration"], probe["fps"]
+    window_s = max(0.5, float(lcfg.window_s))
+    hop_s = float(lcfg.hop_s) if lcfg.hop_s else window_s / 2.0
+    spans = _windows(duration, window_s, max(0.1, hop_s))
+    want32 = hashlib.sha256(check_text.encode("utf-8")).digest() if check_text else None
+    return {
+        "input_video": input_video,
+        "duration": duration,
+        "fps": fps,
+        "window_s": window_s,
+        "hop_s": hop_s,
+        "payload_bitlen": int(payload_bitlen),
+        "lcfg": asdict(lcfg),
+        "scans": [
+            (input_video, i, s, d, fps, payload_bitlen, asdict(lcfg), use_ecc, int(ecc_parity_bytes), want32)
+            for i, (s, d) in enumerate(spans)
+        ],
+    }
+
+
+def merge_localized(
+    plan: Dict[str, Any], windows: List[Dict[str, Any]],
+) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], tuple]]]:
+    """
+    merge_windows over the scanned windows (sorted in place), plus the
+    _first_marked_s arguments for each range whose start needs refining.
+
+    A mark that starts after the probe frames of a window makes that window
+    skip; the next window then begins inside the mark. Re-scanning the hop
+    before such a range finds where it really starts.
+    """
+    windows.sort(key=lambda w: w["index"])
+    ranges = merge_windows(windows)
+    by_start = {w["marked_from_s"]: w for w in windows if w["frames_marked"]}
+    refine = []
+    for r in ranges:
+        first = by_start.get(r["start_s"])
+        if first and first["index"] > 0 and first["marked_from_s"] == first["start_s"] \
+                and not windows[first["index"] - 1]["frames_marked"]:
+            lo = max(0.0, first["start_s"] - plan["hop_s"])
+            refine.append((r, (plan["input_video"], lo, first["start_s"] - lo, plan["fps"],
+                               plan["payload_bitlen"], plan["lcfg"])))
+    return ranges, refine
+
+
+def finish_localize(
+    plan: Dict[str, Any],
+    windows: List[Dict[str, Any]],
+    ranges: List[Dict[str, Any]],
+    refine: List[Tuple[Dict[str, Any], tuple]],
+    starts: List[Optional[float]],
+    *,
+    workers: int,
+    total_s: float,
+) -> dict:
+    """Apply the refined range starts (the _first_marked_s results, in `refine` order) and build the report."""
+    for (r, _), t in zip(refine, starts):
+        if t is not None:
+            r["start_s"] = min(r["start_s"], t)
+    return {
+        "duration_s": round(plan["duration"], 3),
+        "fps": round(plan["fps"], 3),
+        "window_s": plan["window_s"],
+        "hop_s": plan["hop_s"],
+        "payload_bitlen": plan["payload_bitlen"],
+        "windows_skipped": sum(1 for w in windows if w["skipped"]),
+        "ranges": ranges,
+        "windows": windows,
+        "workers": workers,
+        "timings": {"total": round(total_s, 3)},
+    }
+
+
+def localize_dct_video(
+    input_video: str,
+    payload_bitlen: int,
+    lcfg: DCTVideoLocalizeConfig,
+    use_ecc: bool = True,
+    ecc_parity_bytes: int = 64,
+    check_text: Optional[str] = None,
+    progress: Optional[ProgressFn] = None,
+) -> dict:
+    """
+    Find which time ranges of a (long) video carry a mark. The video is cut
+    into fixed windows that worker processes decode independently (seeking, so
+    each one only decodes its own range); inside a window, only frames whose
+    presence score passes the threshold are voted, and windows that show no
+    marked frame early on are abandoned. Each window is ECC-decoded on its own,
+    then neighbours with the same payload are merged into ranges, whose start
+    is refined frame-accurately when the first window missed it.
+    """
+    t_start = time.perf_counter()
+    plan = plan_localize(input_video, payload_bitlen, lcfg, use_ecc, ecc_parity_bytes, check_text)
+    args = plan["scans"]
+    workers = max(1, min(int(lcfg.workers or os.cpu_count() or 1), len(args)))
+    windows: List[Dict[str, Any]] = []
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for w in _map(pool, _scan_window, args):
+            windows.append(w)
+            if progress is not None:
+                progress({"stage": "localize", "window": len(windows), "windows": len(args),
+                          "elapsed_s": round(time.perf_counter() - t_start, 3)})
+        ranges, refine = merge_localized(plan, windows)
+        starts = list(_map(pool, _first_marked_s, [a for _, a in refine], ordered=True))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    return finish_localize(plan, windows, ranges, refine, starts,
+                           workers=workers, total_s=time.perf_counter() - t_start)
+
+
+# ---------- Simple CLI for bash testing ----------
+def main():
+    import argparse, json
+    ap = argparse.ArgumentParser(description="Find which time ranges of a video carry a DCT watermark.")
+    ap.add_argument("--in", dest="inp", required=True, help="input video path")
+    ap.add_argument("--qim", type=float, default=24.0)
+    ap.add_argument("--rep", type=int, default=160)
+    ap.add_argument("--window", type=float, default=4.0, help="window length in seconds")
+    ap.add_argument("--hop", type=float, default=None, help="window hop in seconds (default window/2)")
+    ap.add_argument("--threshold", type=float, default=0.5, help="per-frame presence threshold")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--no-ecc", dest="use_ecc", action="store_false", default=True)
+    ap.add_argument("--ecc", type=int, default=64)
+    ap.add_argument("--check-text", type=str, default=None, help="owner:<email_sha> to verify claim")
+    ap.add_argument("--all-windows", action="store_true", help="print every window, not only the ranges")
+    args = ap.parse_args()
+
+    lcfg = DCTVideoLocalizeConfig(
+        qim_step=args.qim, repetition=args.rep, window_s=args.window, hop_s=args.hop,
+        presence_threshold=args.threshold, workers=args.workers,
+    )
+    payload_bits = (32 + (args.ecc if args.use_ecc else 0)) * 8
+    out = localize_dct_video(args.inp, payload_bits, lcfg, use_ecc=args.use_ecc,
+                             ecc_parity_bytes=args.ecc, check_text=args.check_text)
+    if not args.all_windows:
+        out.pop("windows")
+    print(json.dumps(out, indent=2))
+
+
+if __name__ == "__main__":
+    main()
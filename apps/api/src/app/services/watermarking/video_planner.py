@@ -0,0 +1,254 @@
+# apps/api/src/app/services/watermarking/video_planner.py
+from __future__ import annotations
+
+import json
+import math
+import os
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+from src.app.services.watermarking.schemas import DCTConfig
+from src.app.services.watermarking.video_embed import (
+    FFMPEG, FFPROBE, DCTVideoConfig, VIDEO_PRESETS,
+    _extract_frames, _mark_frames, _scaled_size, _run,
+)
+
+# Slowest (best quality at a given CRF, so the mark survives re-encoding best)
+# to fastest. The planner walks this list from the left.
+X264_PRESETS = ["medium", "fast", "faster", "veryfast", "superfast", "ultrafast"]
+FRAME_STEPS = [1, 2, 3, 4, 6, 8]
+
+# Where the per-host benchmark is cached (same env-override style as FFMPEG_BIN)
+PROFILE_PATH = os.environ.get("VIDEO_PLANNER_PROFILE") or str(
+    Path(tempfile.gettempdir()) / "klyvo_video_host_profile.json"
+)
+
+# estimates are padded by this factor before comparing to the budget
+SAFETY = 1.15
+# fixed cost per run (ffprobe calls, audio extract, mux) and per segment process
+FIXED_OVERHEAD_S = 1.0
+SEGMENT_OVERHEAD_S = 0.5
+
+
+@dataclass
+class HostProfile:
+    """Measured per-stage throughput on this host, in pixels per second."""
+    cpus: int
+    decode_pps: float                 # decode + write PNG frames
+    mark_pps: float                   # read PNG, embed, write PNG (one process)
+    encode_pps: Dict[str, float]      # PNG sequence -> libx264 at each preset
+    measured_at: str = ""
+
+
+@dataclass
+class VideoPlan:
+    frame_step: int
+    x264_preset: str
+    segments: int
+    x264_threads: Optional[int]
+    est_seconds: float
+    budget_seconds: float
+    feasible: bool
+    cpus_available: int
+    probe: Dict[str, Any] = field(default_factory=dict)
+
+    def apply(self, vcfg: DCTVideoConfig) -> DCTVideoConfig:
+        vcfg.frame_step = self.frame_step
+        vcfg.x264_preset = self.x264_preset
+        vcfg.segments = self.segments
+        vcfg.x264_threads = self.x264_threads
+        return vcfg
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "X-Plan-Frame-Step": str(self.frame_step),
+            "X-Plan-X264-Preset": self.x264_preset,
+            "X-Plan-Segments": str(self.segments),
+            "X-Plan-Threads": str(self.x264_threads or ""),
+            "X-Plan-Est-Seconds": f"{self.est_seconds:.2f}",
+            "X-Plan-Budget-Seconds": f"{self.budget_seconds:.2f}",
+            "X-Plan-Feasible": str(self.feasible).lower(),
+        }
+
+
+# ---------- probing ----------
+def probe_video(video_path: str) -> Dict[str, Any]:
+    """duration (s), width, height, fps and frame count estimate of the first video stream."""
+    p = subprocess.run(
+        [FFPROBE, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height,r_frame_rate,duration:format=duration",
+         "-of", "json", video_path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if p.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {p.stderr}")
+    info = json.loads(p.stdout or "{}")
+    st = (info.get("streams") or [{}])[0]
+    try:
+        num, den = str(st.get("r_frame_rate", "30/1")).split("/")
+        fps = float(num) / float(den)
+    except (ValueError, ZeroDivisionError):
+        fps = 30.0
+    duration = float(st.get("duration") or (info.get("format") or {}).get("duration") or 0.0)
+    w, h = int(st.get("width") or 0), int(st.get("height") or 0)
+    if not (w and h and duration):
+        raise RuntimeError("Could not determine video size/duration.")
+    return {"duration": duration, "width": w, "height": h, "fps": fps,
+            "frames": int(math.ceil(duration * fps))}
+
+
+# ---------- host benchmark ----------
+def benchmark_host(width: int = 640, height: int = 360, frames: int = 30) -> HostProfile:
+    """
+    Time each pipeline stage on a synthetic testsrc2 clip. Takes a few seconds;
+    use get_host_profile() for the cached result.
+    """
+    px = width * height * frames
+    with tempfile.TemporaryDirectory() as td:
+        tmp = Path(td)
+        clip = tmp / "bench.mp4"
+        _run([FFMPEG, "-y", "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate=25",
+              "-frames:v", str(frames), "-c:v", "libx264", "-preset", "ultrafast", "-crf", "18",
+              "-pix_fmt", "yuv420p", str(clip)])
+
+        t = time.perf_counter()
+        _extract_frames(str(clip), tmp / "frames", None, None)
+        decode_pps = px / max(time.perf_counter() - t, 1e-6)
+
+        bits = np.random.default_rng(0).integers(0, 2, 96 * 8).astype(np.uint8)
+        vcfg = DCTVideoConfig(frame_step=1, reuse_static_blocks=False)
+        t = time.perf_counter()
+        _mark_frames(tmp / "frames", tmp / "marked", bits, DCTConfig(), vcfg)
+        mark_pps = px / max(time.perf_counter() - t, 1e-6)
+
+        encode_pps: Dict[str, float] = {}
+        for preset in X264_PRESETS:
+            t = time.perf_counter()
+            _run([FFMPEG, "-y", "-r", "25", "-i", str(tmp / "marked" / "frame_%08d.png"),
+                  "-c:v", "libx264", "-preset", preset, "-crf", "22", "-pix_fmt", "yuv420p",
+                  str(tmp / f"enc_{preset}.mp4")])
+            encode_pps[preset] = px / max(time.perf_counter() - t, 1e-6)
+
+    return HostProfile(cpus=os.cpu_count() or 1, decode_pps=decode_pps, mark_pps=mark_pps,
+                       encode_pps=encode_pps, measured_at=datetime.utcnow().isoformat())
+
+
+_profile: Optional[HostProfile] = None
+
+
+def get_host_profile(refresh: bool = False) -> HostProfile:
+    """Benchmark once per host: cached in memory and in PROFILE_PATH across restarts."""
+    global _profile
+    if _profile is not None and not refresh:
+        return _profile
+    path = Path(PROFILE_PATH)
+    if not refresh and path.exists():
+        try:
+            data = json.loads(path.read_text())
+            if data.get("cpus") == (os.cpu_count() or 1) and set(data.get("encode_pps", {})) >= set(X264_PRESETS):
+                _profile = HostProfile(**data)
+                return _profile
+        except (ValueError, TypeError):
+            pass
+    _profile = benchmark_host()
+    try:
+        path.write_text(json.dumps(asdict(_profile)))
+    except OSError:
+        pass
+    return _profile
+
+
+def available_cpus() -> int:
+    """Cores not already busy, from the 1-minute load average."""
+    cpus = os.cpu_count() or 1
+    try:
+        load = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        load = 0.0
+    return max(1, int(round(cpus - load)))
+
+
+# ---------- planning ----------
+def estimate_seconds(probe: Dict[str, Any], vcfg: DCTVideoConfig, profile: HostProfile,
+                     frame_step: int, preset: str, segments: int, cpus: int) -> float:
+    """Wall-clock estimate of embed_dct_video for one candidate configuration."""
+    preset_cfg = VIDEO_PRESETS.get(vcfg.preset.lower(), VIDEO_PRESETS["original"])
+    long_edge = vcfg.long_edge if vcfg.long_edge is not None else preset_cfg["long_edge"]
+    fps = vcfg.target_fps or preset_cfg["target_fps"] or probe["fps"]
+    w, h = _scaled_size(probe["width"], probe["height"], long_edge)
+    n = probe["duration"] * fps
+    px_out = n * w * h
+    px_src = probe["frames"] * probe["width"] * probe["height"]
+    enc_pps = profile.encode_pps[preset]
+
+    if vcfg.embed_mode == "keyframes":
+        marked = n / max(1, int(vcfg.keyframe_interval or round(fps)))
+    else:
+        marked = n / max(1, frame_step)
+
+    t_pre = (px_src / profile.decode_pps + px_out / enc_pps) if vcfg.pre_normalize else 0.0
+    t_dec = px_out / profile.decode_pps
+    t_mark = marked * w * h / profile.mark_pps
+    t_enc = px_out / enc_pps   # libx264 already uses every core
+    par = max(1, min(segments, cpus))
+    if segments > 1:
+        t_work = (t_dec + t_mark) / par + t_enc + SEGMENT_OVERHEAD_S * segments
+    else:
+        t_work = t_dec + t_mark + t_enc
+    return SAFETY * (FIXED_OVERHEAD_S + t_pre + t_work)
+
+
+def plan_video_embed(
+    input_video: str,
+    vcfg: DCTVideoConfig,
+    *,
+    deadline_s: Optional[float] = None,
+    target_speed: Optional[float] = None,
+    profile: Optional[HostProfile] = None,
+    cpus: Optional[int] = None,
+    max_segments: Optional[int] = None,
+) -> VideoPlan:
+    """
+    Pick frame_step, x264 preset, segment count and encoder threads so that
+    embedding `input_video` finishes within `deadline_s` seconds, or at
+    `target_speed` x real time (budget = duration / speed). Among plans that
+    fit, the most robust one wins: smallest frame_step first (more marked
+    frames), then the slowest preset (less re-encode damage), then the fewest
+    segments. If nothing fits, the fastest plan is returned with feasible=False.
+    max_segments caps the segment counts considered (1 for outputs that are
+    streamed while they are encoded).
+    """
+    if deadline_s is None and target_speed is None:
+        raise ValueError("deadline_s or target_speed is required")
+    probe = probe_video(input_video)
+    budget = float(deadline_s) if deadline_s is not None else probe["duration"] / max(float(target_speed), 1e-6)
+    profile = profile or get_host_profile()
+    cpus = cpus or available_cpus()
+
+    steps = [vcfg.frame_step] if vcfg.embed_mode == "keyframes" else FRAME_STEPS
+    max_segs = min(cpus, max(1, int(max_segments))) if max_segments is not None else cpus
+    seg_options = list(range(1, max_segs + 1)) if (vcfg.pre_normalize or not vcfg.long_edge) else [1]
+
+    candidates: List[VideoPlan] = []
+    for step in steps:
+        for preset in X264_PRESETS:
+            for segs in seg_options:
+                est = estimate_seconds(probe, vcfg, profile, step, preset, segs, cpus)
+                threads = max(1, cpus // segs) if segs > 1 else None
+                candidates.append(VideoPlan(step, preset, segs, threads, est, budget, est <= budget, cpus, probe))
+            if any(c.feasible for c in candidates):
+                break
+        if any(c.feasible for c in candidates):
+            break
+
+    feasible = [c for c in candidates if c.feasible]
+    if feasible:
+        return min(feasible, key=lambda c: (c.segments, c.est_seconds))
+    return min(candidates, key=lambda c: c.est_seconds)
@@ -0,0 +1,342 @@
+# apps/api/src/app/services/watermarking/video_service.py
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from app.services.compute import call_compute, get_compute_executor, run_compute, video_cost
+from src.app.services.watermarking.ecc import ecc_encode_sha256
+from src.app.services.watermarking.video_embed import (
+    DCTVideoConfig, _merge_stats, embed_dct_video, embed_dct_video_segment, embed_dct_video_to_pipe,
+    finish_segmented_embed, plan_stream_embed, prepare_segmented_embed, segment_output_path,
+    settle_video_config, uses_segments,
+)
+from src.app.services.watermarking.video_extract import DCTVideoExtractConfig, ProgressFn, extract_dct_video
+from src.app.services.watermarking.video_localize import (
+    DCTVideoLocalizeConfig, _first_marked_s, _scan_window, finish_localize, merge_localized, plan_localize,
+)
+from src.app.services.watermarking.video_planner import plan_video_embed
+
+def build_video_payload(text: str, use_ecc: bool, parity: int) -> bytes:
+    """ECC(SHA256(text)) as embedded by the video routes and CLI."""
+    raw32 = hashlib.sha256(text.encode("utf-8")).digest()
+    return ecc_encode_sha256(raw32, parity_bytes=int(parity)) if use_ecc else raw32
+
+
+def build_video_embed_config(
+    *,
+    preset: str = "facebook",
+    qim_step: Optional[float] = None,
+    repetition: Optional[int] = None,
+    use_y_channel: Optional[bool] = None,
+    use_ecc: bool = True,
+    ecc_parity_bytes: Optional[int] = None,
+    frame_step: Optional[int] = None,
+    long_edge: Optional[int] = None,
+    fps: Optional[int] = None,
+    crf: Optional[int] = None,
+    segments: int = 1,
+    embed_mode: str = "frame_step",
+    keyframe_interval: Optional[int] = None,
+) -> DCTVideoConfig:
+    """
+    DCTVideoConfig from the embed form fields, filling unset values with the
+    per-preset defaults (WhatsApp gets a stronger step / more repetition).
+    Shared by the synchronous route and the job queue so both embed identically.
+    """
+    return DCTVideoConfig(
+        preset=preset,
+        qim_step=(qim_step if qim_step is not None else (28.0 if preset == "whatsapp" else 24.0)),
+        repetition=(repetition if repetition is not None else (240 if preset == "whatsapp" else 160)),
+        use_y_channel=(use_y_channel if use_y_channel is not None else True),
+        use_ecc=use_ecc,
+        ecc_parity_bytes=(int(ecc_parity_bytes) if ecc_parity_bytes is not None else 64),
+        frame_step=(frame_step if frame_step is not None else (1 if preset == "whatsapp" else 2)),
+        long_edge=long_edge,
+        target_fps=fps,
+        crf=(crf if crf is not None else (23 if preset != "facebook" else 22)),
+        x264_preset="faster",
+        segments=max(1, int(segments)),
+        embed_mode=embed_mode,
+        keyframe_interval=keyframe_interval,
+    )
+
+
+def plan_video_config(input_video: str, vcfg: DCTVideoConfig, *,
+                      deadline_s: Optional[float] = None,
+                      target_speed: Optional[float] = None,
+                      max_segments: Optional[int] = None) -> Dict[str, str]:
+    """
+    If a deadline or throughput target is given, let the planner overwrite
+    frame_step / x264 preset / segments / threads on `vcfg` (at most
+    max_segments segments) and return its X-Plan-* headers; otherwise leave
+    `vcfg` alone and return {}.
+    """
+    if deadline_s is None and target_speed is None:
+        return {}
+    plan = plan_video_embed(input_video, vcfg, deadline_s=deadline_s, target_speed=target_speed,
+                            max_segments=max_segments)
+    plan.apply(vcfg)
+    return plan.headers()
+
+
+def video_embed_headers(preset: str, vcfg: DCTVideoConfig, stats: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Echo embed params back so the FE can store them for later verify."""
+    headers = {
+        "X-Preset": preset,
+        "X-Params-QIM": str(vcfg.qim_step),
+        "X-Params-Repetition": str(vcfg.repetition),
+        "X-Params-FrameStep": str(vcfg.frame_step),
+        "X-Params-UseY": str(bool(vcfg.use_y_channel)).lower(),
+        "X-Params-UseECC": str(bool(vcfg.use_ecc)).lower(),
+        "X-Params-ECC-Parity": str(vcfg.ecc_parity_bytes),
+        "X-Pre-Long-Edge": str(vcfg.long_edge or ""),
+        "X-Pre-FPS": str(vcfg.target_fps or ""),
+        "X-CRF": str(vcfg.crf),
+        "X-Segments": str(vcfg.segments),
+        "X-Embed-Mode": vcfg.embed_mode,
+        "X-Keyframe-Interval": str(vcfg.keyframe_interval or ""),
+    }
+    if stats:   # unknown up front when the output is streamed
+        headers.update({
+            "X-Frames-Marked": str(stats["frames_marked"]),
+            "X-Block-Cache-Hit-Rate": f"{stats['block_cache_hit_rate']:.4f}",
+            "X-Stage-Timings": ";".join(f"{k}={v:.3f}" for k, v in (stats.get("timings") or {}).items()),
+        })
+    return headers
+
+
+def video_extract_sync(
+    input_video: str,
+    *,
+    qim_step: float,
+    repetition: int,
+    frame_step: int,
+    use_ecc: bool,
+    ecc_parity_bytes: int,
+    check_text: Optional[str],
+    sampling: str = "dense",
+    max_frames: Optional[int] = 120,
+    progress: Optional[ProgressFn] = None,
+) -> dict:
+    """
+    extract_dct_video with the same defaults as the
+    `python -m app.services.watermarking.video_extract` CLI, so results match it.
+    """
+    payload_bits = (32 + (ecc_parity_bytes if use_ecc else 0)) * 8
+    ecfg = DCTVideoExtractConfig(
+        qim_step=float(qim_step), repetition=int(repetition), use_y_channel=True,
+        frame_step=max(1, int(frame_step)), max_frames=max_frames,
+        sampling=sampling,
+    )
+    return extract_dct_video(
+        input_video, payload_bits, ecfg,
+        use_ecc=use_ecc, ecc_parity_bytes=int(ecc_parity_bytes), check_text=check_text,
+        progress=progress,
+    )
+
+
+async def run_video_extract(
+    input_video: str,
+    *,
+    qim_step: float,
+    repetition: int,
+    frame_step: int,
+    use_ecc: bool,
+    ecc_parity_bytes: int,
+    check_text: Optional[str],
+    sampling: str = "dense",
+    max_frames: Optional[int] = 120,
+) -> dict:
+    """
+    Run video_extract_sync on the compute pool (services/compute.py) without
+    blocking the event loop; costed as the frames it may decode.
+    """
+    frames = max_frames * max(1, int(frame_step)) if max_frames else None
+    cost = await run_in_threadpool(video_cost, input_video, frames)
+    return await run_compute(
+        video_extract_sync, input_video, cost=cost,
+        qim_step=qim_step, repetition=repetition, frame_step=frame_step,
+        use_ecc=use_ecc, ecc_parity_bytes=ecc_parity_bytes, check_text=check_text,
+        sampling=sampling, max_frames=max_frames,
+    )
+
+
+def video_localize_sync(
+    input_video: str,
+    *,
+    qim_step: float,
+    repetition: int,
+    use_ecc: bool,
+    ecc_parity_bytes: int,
+    check_text: Optional[str],
+    window_s: float = 4.0,
+    hop_s: Optional[float] = None,
+    presence_threshold: float = 0.5,
+    progress: Optional[ProgressFn] = None,
+    wait: bool = True,
+) -> dict:
+    """
+    localize_dct_video on the compute pool, blocking (for worker threads),
+    with the payload length derived the same way as extraction. Every window
+    is its own _scan_window job, admitted and costed on its own like the
+    segments of an embed, so the fan-out is bounded by the pool; the range
+    start refinements run the same way. With wait=False a full pool raises
+    ComputeOverloaded before any window starts.
+    """
+    t_start = time.perf_counter()
+    payload_bits = (32 + (ecc_parity_bytes if use_ecc else 0)) * 8
+    lcfg = DCTVideoLocalizeConfig(
+        qim_step=float(qim_step), repetition=int(repetition), use_y_channel=True,
+        window_s=float(window_s), hop_s=hop_s, presence_threshold=float(presence_threshold),
+        workers=1,
+    )
+    plan = plan_localize(input_video, payload_bits, lcfg, use_ecc=use_ecc,
+                         ecc_parity_bytes=int(ecc_parity_bytes), check_text=check_text)
+    # windows overlap, so they are costed by their own length rather than split from the total
+    mpx_per_s = video_cost(input_video) / max(plan["duration"], 1e-3)
+
+    def report(ev: Dict[str, Any]) -> None:
+        progress({"stage": "localize", "window": ev["done"], "windows": ev["total"],
+                  "elapsed_s": round(time.perf_counter() - t_start, 3)})
+
+    executor = get_compute_executor()
+    windows = executor.call_all(
+        _scan_window, [(args, mpx_per_s * args[3]) for args in plan["scans"]],
+        progress=report if progress is not None else None, wait=wait,
+    )
+    ranges, refine = merge_localized(plan, windows)
+    starts = executor.call_all(_first_marked_s, [(args, mpx_per_s * args[2]) for _, args in refine])
+    return finish_localize(plan, windows, ranges, refine, starts,
+                           workers=min(executor.workers, len(plan["scans"])),
+                           total_s=time.perf_counter() - t_start)
+
+
+async def run_video_localize(input_video: str, **kwargs: Any) -> dict:
+    """
+    video_localize_sync, its window jobs driven from a worker thread. A full
+    pool turns the request away (429 / 503) rather than queueing it.
+    """
+    return await run_in_threadpool(video_localize_sync, input_video, wait=False, **kwargs)
+
+
+def embed_video_on_pool(input_video: str, output_video: str, payload: bytes, vcfg: DCTVideoConfig, *,
+                        lossless: bool = False, progress: Optional[ProgressFn] = None,
+                        wait: bool = True) -> Dict[str, Any]:
+    """
+    embed_dct_video on the compute pool, blocking (for worker threads); every
+    frame is decoded and re-encoded (2 passes). A segment-parallel config runs
+    as separate jobs: prepare, one per segment, then concat + mux. Each
+    segment is admitted and costed on its own, so the fan-out is bounded by
+    the pool rather than by a process pool nested in one job. Segments turned
+    away by admission wait for a free slot; with wait=False the first job
+    raises ComputeOverloaded instead of waiting.
+    """
+    cost = video_cost(input_video, None, 2.0)
+    if not uses_segments(settle_video_config(dataclasses.replace(vcfg))):
+        return call_compute(embed_dct_video, input_video, output_video, payload, vcfg,
+                            lossless=lossless, cost=cost, progress=progress, wait=wait)
+
+    t_start = time.perf_counter()
+    vcfg = settle_video_config(dataclasses.replace(vcfg))
+    work = tempfile.mkdtemp(prefix="wm_seg_", dir=str(Path(output_video).parent))
+    try:
+        prep = call_compute(prepare_segmented_embed, input_video, work, vcfg,
+                            cost=cost / 2 if vcfg.pre_normalize else 1.0, progress=progress, wait=wait)
+        segments = prep["segments"]
+        frames = max(1, sum(n for *_, n in segments))
+        jobs = [
+            ((prep["source"], segment_output_path(work, i), payload, vcfg, start, end, first, n, lossless),
+             cost * n / frames)
+            for i, (start, end, first, n) in enumerate(segments)
+        ]
+        timings = dict(prep["timings"])
+        if progress is not None:
+            progress({"stage": "segments", "event": "start"})
+        t0 = time.perf_counter()
+        parts = get_compute_executor().call_all(
+            embed_dct_video_segment, jobs,
+            progress=(lambda ev: progress({"stage": "segments", **ev})) if progress is not None else None,
+        )
+        timings["segments"] = round(time.perf_counter() - t0, 3)
+        timings.update(call_compute(finish_segmented_embed, work, output_video, len(segments), prep["has_audio"],
+                                    cost=1.0, progress=progress, wait=True))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    stats = _merge_stats(parts)
+    timings["total"] = round(time.perf_counter() - t_start, 3)
+    stats["timings"] = timings
+    return stats
+
+
+async def run_video_embed(input_video: str, output_video: str, payload: bytes,
+                          vcfg: DCTVideoConfig, lossless: bool = False) -> Dict[str, Any]:
+    """
+    Embed on the compute pool without blocking the event loop. A full pool
+    turns the request away (429 / 503) rather than queueing it.
+    """
+    if uses_segments(settle_video_config(dataclasses.replace(vcfg))):
+        # the segment jobs are driven from a worker thread
+        return await run_in_threadpool(embed_video_on_pool, input_video, output_video, payload, vcfg,
+                                       lossless=lossless, wait=False)
+    cost = await run_in_threadpool(video_cost, input_video, None, 2.0)
+    return await run_compute(embed_dct_video, input_video, output_video, payload, vcfg,
+                             lossless=lossless, cost=cost)
+
+
+async def open_video_embed_stream(input_video: str, payload: bytes, vcfg: DCTVideoConfig, *,
+                                  lossless: bool = False, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """
+    Fragmented-MP4 embed (see stream_embed_dct_video) with the marking on the
+    compute pool: the worker writes the fMP4 into a FIFO that is read here and
+    yielded chunk by chunk. Probing, validation and admission happen before
+    this returns, so bad input or a full pool raise here rather than
+    mid-stream. Closing the iterator early (client gone) breaks the pipe,
+    which stops the worker's ffmpeg.
+    """
+    plan = await run_in_threadpool(plan_stream_embed, input_video, vcfg, lossless=lossless)
+    cost = await run_in_threadpool(video_cost, input_video, None, 2.0)
+    work = Path(tempfile.mkdtemp(prefix="wm_fmp4_"))
+    fifo = work / "out.mp4"
+    os.mkfifo(fifo)
+    # opened before the job starts, so the worker's non-blocking open finds a reader
+    fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        fut = get_compute_executor().submit(embed_dct_video_to_pipe, str(fifo), payload, vcfg, plan,
+                                            chunk_size=chunk_size, cost=cost)
+    except BaseException:
+        os.close(fd)
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+    fut.add_done_callback(lambda _: shutil.rmtree(work, ignore_errors=True))
+    return _relay_pipe(fd, fut, chunk_size)
+
+
+async def _relay_pipe(fd: int, fut: Future, chunk_size: int) -> AsyncIterator[bytes]:
+    # read() gives b"" both before the worker opened its end and after it closed
+    # it, so the end of the stream is b"" once the job itself has finished
+    try:
+        while True:
+            try:
+                chunk = os.read(fd, chunk_size)
+            except BlockingIOError:
+                chunk = None
+            if chunk:
+                yield chunk
+            elif chunk == b"" and fut.done():
+                break
+            else:
+                await asyncio.sleep(0.02)
+        await get_compute_executor().wait(fut)
+    finally:
+        os.close(fd)
@@ -0,0 +1,73 @@
+import hashlib
+import secrets
+
+import numpy as np
+
+from app.db import models
+from app.db.session import SessionLocal
+from app.services.codeword_index import CodewordIndex, false_positive_probability
+from app.services.db import crud
+from src.app.services.watermarking.ecc import ecc_encode_sha256, ecc_encode_sha256_many
+
+
+def _codeword_bits(owner, media, parity):
+    sha = hashlib.sha256(f"owner:{owner}|media:{media}".encode("utf-8")).digest()
+    return np.unpackbits(np.frombuffer(ecc_encode_sha256(sha, parity_bytes=parity), dtype=np.uint8))
+
+
+def test_batch_encoder_matches_reedsolo():
+    rng = np.random.default_rng(3)
+    for parity in (2, 16, 64):
+        payloads = rng.integers(0, 256, (50, 32), dtype=np.uint8)
+        got = ecc_encode_sha256_many(payloads, parity)
+        assert [bytes(r) for r in got] == [ecc_encode_sha256(bytes(p), parity) for p in payloads]
+
+
+def test_nearest_codeword_past_rs_capacity():
+    rng = np.random.default_rng(0)
+    owners = [rng.bytes(32).hex() for _ in range(3)]
+    claims = [(owners[i % 3], rng.bytes(32).hex()) for i in range(3000)]
+    index = CodewordIndex(16)
+    index.add(claims)
+    assert len(index) == 2 * len(claims)
+
+    owner, media = claims[1234]
+    bits = _codeword_bits(owner, media, 16)
+    noisy = bits ^ (rng.random(len(bits)) < 0.2).astype(np.uint8)   # far beyond 8 correctable bytes
+
+    for scope in (None, owner):
+        hit = index.nearest(noisy, scope)[0]
+        assert (hit["owner_email_sha"], hit["media_id"]) == (owner, media)
+        assert hit["similarity"] > 0.7 and hit["false_positive_p"] < 1e-12
+
+    # unrelated bits: the best of ~6000 rows is no better than chance
+    hit = index.nearest(rng.integers(0, 2, len(bits)).astype(np.uint8))[0]
+    assert hit["false_positive_p"] > 1e-3
+    assert false_positive_probability(0, 384, 1) == 2.0 ** -384
+
+
+def test_sync_drops_revoked_media_ids_and_reloads_reactivated_ones():
+    owner, media = secrets.token_hex(32), secrets.token_hex(32)
+    with SessionLocal() as db:
+        crud.register_media_id(db, owner_email_sha=owner, media_id=media)
+    bits = _codeword_bits(owner, media, 16)
+    index = CodewordIndex(16)
+
+    def found():
+        with SessionLocal() as db:
+            index.sync(db)
+        hits = index.nearest(bits, owner)
+        return bool(hits) and hits[0]["media_id"] == media and hits[0]["distance"] == 0
+
+    assert found()
+    with SessionLocal() as db:
+        row = db.query(models.MediaId).filter_by(owner_email_sha=owner).one()
+        row.active = False
+        crud.bump_owner_catalog(db, owner)
+        db.commit()
+    assert not found()
+    with SessionLocal() as db:
+        db.query(models.MediaId).filter_by(owner_email_sha=owner).one().active = True
+        crud.bump_owner_catalog(db, owner)
+        db.commit()
+    assert found()
@@ -0,0 +1,31 @@
+import asyncio
+import time
+
+import pytest
+
+from apps.api.src.app.services.compute import ComputeExecutor, ComputeOverloaded
+
+
+def test_admission_rejects_with_retry_after():
+    ex = ComputeExecutor(workers=1, threads_per_worker=1, queue_max=1, max_cost=100.0, mpix_per_s=10.0)
+
+    async def scenario():
+        first = asyncio.ensure_future(ex.run(time.sleep, 0.5, cost=60.0))
+        await asyncio.sleep(0)
+        with pytest.raises(ComputeOverloaded) as over_budget:
+            await ex.run(pow, 2, 3, cost=50.0)
+        second = asyncio.ensure_future(ex.run(pow, 2, 3, cost=10.0))
+        await asyncio.sleep(0)
+        with pytest.raises(ComputeOverloaded) as queue_full:
+            await ex.run(pow, 2, 3, cost=1.0)
+        await first
+        return over_budget.value, queue_full.value, await second
+
+    try:
+        over_budget, queue_full, result = asyncio.run(scenario())
+    finally:
+        ex.shutdown()
+    assert over_budget.status_code == 503 and over_budget.headers["Retry-After"] == "11"
+    assert queue_full.status_code == 429 and int(queue_full.headers["Retry-After"]) >= 1
+    assert result == 8
+    assert ex.stats()["inflight"] == 0 and ex.stats()["pending_mpx"] == 0.0
@@ -0,0 +1,62 @@
+import io
+import secrets
+
+import numpy as np
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from apps.api.src.app.main import app
+
+client = TestClient(app)
+
+KNOBS = {"repetition": "8", "ecc_parity_bytes": "16", "use_y_channel": "true"}
+
+
+def _png(seed):
+    rng = np.random.default_rng(seed)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(40, 216, (128, 160, 3), dtype=np.uint8), mode="RGB").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_byte_identical_copy_is_answered_from_the_asset_row():
+    owner, media = secrets.token_hex(32), secrets.token_hex(32)
+    r = client.post("/api/watermark/image", files={"file": ("in.png", _png(secrets.randbits(32)), "image/png")},
+                    data={"text": f"owner:{owner}|media:{media}", "qim_step": "24", **KNOBS})
+    assert r.status_code == 200
+    marked = r.content
+    # same pixels, different bytes: must still decode
+    buf = io.BytesIO()
+    Image.open(io.BytesIO(marked)).save(buf, format="PNG", compress_level=1)
+    resaved = buf.getvalue()
+    assert resaved != marked
+
+    exact, decoded = (client.post("/api/verify/auto", files={"file": ("x.png", img, "image/png")},
+                                  data={"owner_email_sha": owner, **KNOBS}).json() for img in (marked, resaved))
+    assert exact["exact_match"] is True and decoded["exact_match"] is False
+    assert exact["asset_params"]["media_id"] == media and exact["asset_params"]["owner_email_sha"] == owner
+    for body in (exact, decoded):
+        assert body["exists"] is True and body["matched_media_id"] == f"0x{media}"
+        assert (body["ecc_ok"], body["payload_bits"], body["used_repetition"]) == (True, (32 + 16) * 8, 8)
+
+    # someone else's claim: the codeword is still exact, it just is not theirs
+    other = client.post("/api/verify/auto", files={"file": ("x.png", marked, "image/png")},
+                        data={"owner_email_sha": secrets.token_hex(32), **KNOBS}).json()
+    assert (other["exists"], other["ecc_ok"], other["exact_match"]) == (False, True, True)
+
+    # extract with the asset's own knobs answers from the stored claim, no decoding
+    claim = f"owner:{owner}|media:{media}"
+    r = client.post("/api/watermark/image/extract", files={"file": ("x.png", marked, "image/png")},
+                    data={"qim_step": "24", "check_text": claim, **KNOBS})
+    body = r.json()
+    assert body["exact_match"] is True and body["asset_id"] == exact["asset_id"]
+    assert (body["ecc_ok"], body["match_text_hash"], body["similarity"]) == (True, True, 1.0)
+    assert body["payload_bitlen"] == (32 + 16) * 8 and body["bit_confidence"] is None
+
+    # other knobs are decoded as requested; the stored params are only reported
+    r = client.post("/api/watermark/image/extract", files={"file": ("x.png", marked, "image/png")},
+                    data={"qim_step": "8", "repetition": "20", "check_text": claim})
+    body = r.json()
+    assert body["exact_match"] is True and body["asset_params"]["repetition"] == 8
+    assert (body["payload_bitlen"], body["used_repetition"]) == ((32 + 24) * 8, 20)
+    assert body["bit_confidence"] is not None
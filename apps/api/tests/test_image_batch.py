@@ -0,0 +1,64 @@
+import io
+import hashlib
+import json
+import secrets
+import zipfile
+
+import numpy as np
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from apps.api.src.app.main import app
+from app.api.routes import image_batch
+from app.db.session import SessionLocal
+from app.db.models import MediaId
+
+client = TestClient(app)
+
+OWNER = "ab" * 32
+
+
+def _png(seed):
+    rng = np.random.default_rng(seed)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(40, 216, (128, 160, 3), dtype=np.uint8), mode="RGB").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_batch_zip_in_zip_out_with_per_recipient_claims(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_batch, "DATA_DIR", tmp_path)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("cat/a.png", _png(1))
+        zf.writestr("b.png", _png(2))
+    media = [secrets.token_hex(32) for _ in range(3)]
+    manifest = {
+        "defaults": {"qim_step": 24, "repetition": 8, "ecc_parity_bytes": 16},
+        "items": [
+            {"file": "a.png", "text": f"owner:{OWNER}|media:{media[0]}", "output": "a_alice.png"},
+            {"file": "a.png", "text": f"owner:{OWNER}|media:{media[1]}", "output": "a_bob.png"},
+            {"file": "b.png", "text": f"owner:{OWNER}|media:{media[2]}", "preset": "nope"},
+        ],
+    }
+    r = client.post("/api/watermark/image/batch", data={"manifest": json.dumps(manifest)},
+                    files={"archive": ("batch.zip", archive.getvalue(), "application/zip")})
+    assert r.status_code == 400 and "item 2" in r.json()["detail"]
+
+    manifest["items"][2].pop("preset")
+    r = client.post("/api/watermark/image/batch", data={"manifest": json.dumps(manifest)},
+                    files={"archive": ("batch.zip", archive.getvalue(), "application/zip")})
+    assert r.status_code == 200 and r.headers["content-type"] == "application/zip"
+
+    out = zipfile.ZipFile(io.BytesIO(r.content))
+    assert sorted(out.namelist()) == ["a_alice.png", "a_bob.png", "manifest.json", "wm_b.png"]
+    report = json.loads(out.read("manifest.json"))
+    assert report["ok"] == 3 and report["media_ids_registered"] == 3
+    for res in report["results"]:
+        assert res["sha256"] == hashlib.sha256(out.read(res["output"])).hexdigest()
+        assert res["psnr_y"] > 30
+    assert out.read("a_alice.png") != out.read("a_bob.png")
+    assert len(list(tmp_path.glob("wm_*.png"))) == 3   # the stored copies behind the MediaAsset rows
+
+    with SessionLocal() as db:
+        got = {m.media_id for m in db.query(MediaId).filter(MediaId.owner_email_sha == OWNER)}
+    assert set(media) <= got
@@ -0,0 +1,56 @@
+import io
+import secrets
+
+import numpy as np
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from apps.api.src.app.main import app
+from app.services.fingerprint_index import HammingIndex
+
+client = TestClient(app)
+
+
+def _png(seed):
+    rng = np.random.default_rng(seed)
+    base = rng.integers(40, 216, (16, 20, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(base, mode="RGB").resize((320, 256), Image.BILINEAR).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_hamming_index_matches_brute_force():
+    rng = np.random.default_rng(7)
+    codes = [int(c) for c in rng.integers(0, 2**63, 5000, dtype=np.uint64)]
+    index = HammingIndex()
+    for i, c in enumerate(codes):
+        index.add(i, c)
+    q = codes[17] ^ 0b1011   # 3 bits off
+    for radius in (0, 3, 9, 14):
+        want = sorted((i, bin(c ^ q).count("1")) for i, c in enumerate(codes) if bin(c ^ q).count("1") <= radius)
+        assert sorted(index.search(q, radius)) == want
+    assert index.search(q, 9, limit=1) == [(17, 3)]
+
+
+def test_degraded_copy_is_found_and_verified_with_the_assets_params():
+    owner, media = secrets.token_hex(32), secrets.token_hex(32)
+    r = client.post("/api/watermark/image", files={"file": ("in.png", _png(secrets.randbits(32)), "image/png")},
+                    data={"text": f"owner:{owner}|media:{media}", "qim_step": "24", "repetition": "8",
+                          "ecc_parity_bytes": "16", "use_y_channel": "true"})
+    assert r.status_code == 200
+    buf = io.BytesIO()
+    Image.open(io.BytesIO(r.content)).convert("RGB").save(buf, format="JPEG", quality=95)
+    copy = buf.getvalue()
+
+    r = client.post("/api/verify/similar", files={"file": ("c.jpg", copy, "image/jpeg")})
+    assert r.status_code == 200
+    top = r.json()["matches"][0]
+    assert top["params"]["media_id"] == media and top["phash_distance"] <= 10
+
+    # wrong knobs on purpose: the near-duplicate's stored params are tried first
+    r = client.post("/api/verify/auto", files={"file": ("c.jpg", copy, "image/jpeg")},
+                    data={"owner_email_sha": owner, "repetition": "20", "ecc_parity_bytes": "32"})
+    body = r.json()
+    assert body["exists"] is True and body["matched_media_id"] == f"0x{media}"
+    assert body["exact_match"] is False and body["asset_id"] == top["asset_id"]
+    assert body["used_repetition"] == 8 and body["fingerprint_distance"] == top["phash_distance"]
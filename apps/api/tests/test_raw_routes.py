@@ -0,0 +1,97 @@
+import io
+import secrets
+import subprocess
+
+import numpy as np
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from apps.api.src.app.main import app
+from app.api.routes import watermarking
+
+client = TestClient(app)
+RAW = {"content-type": "application/octet-stream"}
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    # the image routes keep a copy of every marked file
+    monkeypatch.setattr(watermarking, "DATA_DIR", tmp_path)
+
+
+def _png(w=256, h=256):
+    rng = np.random.default_rng(3)
+    arr = rng.integers(40, 216, (h, w, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(arr, mode="RGB").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_raw_image_routes_match_multipart():
+    params = {"text": "owner:raw-test", "qim_step": "24", "repetition": "16", "auto_register_media": "false"}
+    raw = client.post("/api/watermark/image/raw", params=params, content=_png(),
+                      headers={"content-type": "application/octet-stream", "x-filename": "in.png"})
+    assert raw.status_code == 200 and raw.headers["content-type"] == "image/png"
+    form = client.post("/api/watermark/image", data=params, files={"file": ("in.png", _png(), "image/png")})
+    assert form.status_code == 200
+    assert raw.headers["x-params-qim"] == form.headers["x-params-qim"]
+
+    q = {"qim_step": "24", "repetition": "16", "use_y_channel": "true", "ecc_parity_bytes": "32",
+         "check_text": "owner:raw-test"}
+    got_raw = client.post("/api/watermark/image/extract/raw", params=q, content=raw.content,
+                          headers={"content-type": "application/octet-stream"})
+    got_form = client.post("/api/watermark/image/extract", data=q, files={"file": ("wm.png", raw.content, "image/png")})
+    assert got_raw.status_code == got_form.status_code == 200
+    assert got_raw.json() == got_form.json()
+    assert got_raw.json()["ecc_ok"] and got_raw.json()["match_text_hash"]
+
+
+def test_raw_video_route_matches_multipart(tmp_path):
+    clip = tmp_path / "in.mp4"
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc2=size=160x120:rate=10",
+                    "-t", "2", "-pix_fmt", "yuv420p", str(clip)], check=True)
+    params = {"text": "owner:raw-video", "preset": "original", "repetition": "4", "ecc_parity_bytes": "16",
+              "frame_step": "2", "crf": "30"}
+
+    raw = client.post("/api/watermark/video/raw", params=params, content=clip.read_bytes(),
+                      headers={**RAW, "x-filename": "in.mp4"})
+    form = client.post("/api/watermark/video", data=params, files={"file": ("in.mp4", clip.read_bytes(), "video/mp4")})
+
+    assert raw.status_code == form.status_code == 200
+    assert raw.headers["content-type"] == form.headers["content-type"] == "video/mp4"
+    assert raw.content[4:8] == form.content[4:8] == b"ftyp"
+    x_headers = {k for k in form.headers if k.startswith("x-")}
+    assert {k for k in raw.headers if k.startswith("x-")} == x_headers
+    for k in x_headers - {"x-stage-timings"}:
+        assert raw.headers[k] == form.headers[k], k
+    assert raw.headers["x-frames-marked"] == "10"   # every 2nd of 20 frames
+
+
+def test_raw_verify_auto_matches_multipart():
+    owner, media = secrets.token_hex(32), secrets.token_hex(32)
+    marked = client.post("/api/watermark/image/raw", content=_png(),
+                         params={"text": f"owner:{owner}|media:{media}", "qim_step": "24", "repetition": "16",
+                                 "ecc_parity_bytes": "32"}, headers=RAW)
+    assert marked.status_code == 200
+    q = {"owner_email_sha": owner, "repetition": "16", "ecc_parity_bytes": "32"}
+
+    raw = client.post("/api/verify/auto/raw", params=q, content=marked.content, headers=RAW)
+    form = client.post("/api/verify/auto", data=q, files={"file": ("wm.png", marked.content, "image/png")})
+
+    assert raw.status_code == form.status_code == 200
+    assert raw.json() == form.json()
+    assert raw.json()["exists"] is True and raw.json()["matched_media_id"] == f"0x{media}"
+    # both go through the same result cache entry
+    assert raw.headers["x-cache"] == "miss" and form.headers["x-cache"].startswith("hit")
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/api/verify/auto/raw", {"owner_email_sha": "0" * 64}),
+    ("/api/watermark/image/raw", {"text": "owner:raw-test"}),
+    ("/api/watermark/image/extract/raw", {"check_text": "owner:raw-test"}),
+    ("/api/watermark/video/raw", {"text": "owner:raw-test"}),
+])
+def test_raw_routes_reject_multipart_bodies(path, params):
+    r = client.post(path, params=params, files={"file": ("in.png", _png(), "image/png")})
+    assert r.status_code == 415
@@ -0,0 +1,71 @@
+import io
+import secrets
+
+import numpy as np
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from apps.api.src.app.main import app
+from app.db.session import SessionLocal
+from app.services.db import crud
+from app.services.result_cache import get_result_cache
+
+client = TestClient(app)
+
+KNOBS = {"repetition": "8", "ecc_parity_bytes": "16", "use_y_channel": "true"}
+
+
+def _png(seed):
+    rng = np.random.default_rng(seed)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(40, 216, (128, 160, 3), dtype=np.uint8), mode="RGB").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_verify_is_cached_until_the_owner_catalog_changes():
+    owner, media = secrets.token_hex(32), secrets.token_hex(32)
+    r = client.post("/api/watermark/image", files={"file": ("in.png", _png(secrets.randbits(32)), "image/png")},
+                    data={"text": f"owner:{owner}|media:{media}", "qim_step": "24",
+                          "auto_register_media": "false", **KNOBS})
+    assert r.status_code == 200
+    marked = r.content
+
+    def verify():
+        r = client.post("/api/verify/auto", files={"file": ("x.png", marked, "image/png")},
+                        data={"owner_email_sha": owner, **KNOBS})
+        assert r.status_code == 200
+        return r.headers["x-cache"], r.json()
+
+    first = verify()
+    assert first[0] == "miss" and first[1]["exists"] is False
+    assert verify() == ("hit-memory", first[1])
+    get_result_cache().clear()
+    assert verify() == ("hit-db", first[1])
+
+    with SessionLocal() as db:
+        crud.register_media_id(db, owner_email_sha=owner, media_id=media)
+    state, body = verify()
+    assert state == "miss" and body["exists"] is True
+    assert body["matched_media_id"] == f"0x{media}"
+
+    # the owner is normalized before keying and matching: case does not matter
+    r = client.post("/api/verify/auto", files={"file": ("x.png", marked, "image/png")},
+                    data={"owner_email_sha": f" {owner.upper()} ", **KNOBS})
+    assert (r.headers["x-cache"], r.json()) == ("hit-memory", body)
+
+    # extract is not owner-scoped; raw and multipart share entries
+    r1 = client.post("/api/watermark/image/extract", files={"file": ("x.png", marked, "image/png")},
+                     data={"qim_step": "24", "repetition": "8", "use_y_channel": "true", "ecc_parity_bytes": "16"})
+    r2 = client.post("/api/watermark/image/extract/raw", content=marked,
+                     params={"qim_step": "24", "repetition": "8", "use_y_channel": "true", "ecc_parity_bytes": "16"},
+                     headers={"content-type": "application/octet-stream"})
+    assert (r1.headers["x-cache"], r2.headers["x-cache"]) == ("miss", "hit-memory")
+    assert r1.json() == r2.json() and r1.json()["ecc_ok"] is True
+
+    # ...but any registration can change nearest_claim, so ECC extracts are re-run after one
+    with SessionLocal() as db:
+        crud.register_media_id(db, owner_email_sha=secrets.token_hex(32), media_id=secrets.token_hex(32))
+    r3 = client.post("/api/watermark/image/extract/raw", content=marked,
+                     params={"qim_step": "24", "repetition": "8", "use_y_channel": "true", "ecc_parity_bytes": "16"},
+                     headers={"content-type": "application/octet-stream"})
+    assert r3.headers["x-cache"] == "miss" and r3.json() == r1.json()
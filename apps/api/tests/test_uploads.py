@@ -0,0 +1,47 @@
+import asyncio
+import hashlib
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from apps.api.src.app.services.uploads import UploadLimitMiddleware, UploadTooLarge, ingest_chunks, ingest_upload
+
+
+def _chunks(*parts):
+    async def gen():
+        for p in parts:
+            yield p
+    return gen()
+
+
+def test_ingest_chunks_hashes_while_writing_and_enforces_limit(tmp_path):
+    up = asyncio.run(ingest_chunks(_chunks(b"abc", b"", b"def"), max_bytes=6, suffix=".bin", dest_dir=str(tmp_path)))
+    assert up.path.read_bytes() == b"abcdef"
+    assert up.sha256_hex == hashlib.sha256(b"abcdef").hexdigest() and up.size == 6
+
+    try:
+        asyncio.run(ingest_chunks(_chunks(b"abcd", b"efgh"), max_bytes=6, dest_dir=str(tmp_path)))
+        raise AssertionError("expected UploadTooLarge")
+    except UploadTooLarge as e:
+        assert e.status_code == 413
+    assert [p.name for p in tmp_path.iterdir()] == [up.path.name]   # partial file removed
+
+
+def test_middleware_rejects_oversized_upload_routes(monkeypatch):
+    from apps.api.src.app.services import uploads
+    monkeypatch.setattr(uploads.settings, "upload_max_image_bytes", 1024)
+
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware)
+
+    @app.post("/api/watermark/image")
+    async def image(file: UploadFile = File(...)):
+        up = await ingest_upload(file, max_bytes=1024)
+        up.unlink()
+        return {"sha256": up.sha256_hex}
+
+    client = TestClient(app)
+    ok = client.post("/api/watermark/image", files={"file": ("a.png", b"x" * 100)})
+    assert ok.status_code == 200 and ok.json()["sha256"] == hashlib.sha256(b"x" * 100).hexdigest()
+    big = client.post("/api/watermark/image", files={"file": ("a.png", b"x" * 4096)})
+    assert big.status_code == 413
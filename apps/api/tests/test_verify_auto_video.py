@@ -0,0 +1,63 @@
+import hashlib
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from apps.api.src.app.main import app
+from app.api.routes import verify_auto
+from app.db.session import SessionLocal
+from app.services.db import crud
+
+client = TestClient(app)
+
+
+def _owner_with_media(seed, n):
+    rng = np.random.default_rng(seed)
+    owner = rng.bytes(32).hex()
+    media = [rng.bytes(32).hex() for _ in range(n)]
+    with SessionLocal() as db:
+        crud.bulk_register_media_ids(db, [{"owner_email_sha": owner, "media_id": m} for m in media])
+        db.commit()
+    return owner, media
+
+
+def _claim_hash(owner, media_id):
+    return hashlib.sha256(f"owner:{owner}|media:{media_id}".encode()).digest()
+
+
+def _verify(monkeypatch, owner, payload_hex, **form):
+    calls = []
+
+    async def fake_extract(path, **kw):
+        calls.append(kw)
+        return {"payload_hex": payload_hex, "ecc_ok": payload_hex is not None, "frames_used": 12}
+
+    monkeypatch.setattr(verify_auto, "run_video_extract", fake_extract)
+    r = client.post("/api/verify/auto/video", files={"file": ("v.mp4", b"not decoded", "video/mp4")},
+                    data={"owner_email_sha": f" {owner.upper()} ", **form})
+    assert r.status_code == 200
+    assert len(calls) == 1 and calls[0]["check_text"] is None   # one claim-free decode per request
+    return r.json()
+
+
+def test_one_decode_is_matched_against_every_owner_claim(monkeypatch):
+    owner, media = _owner_with_media(0, 50)
+    body = _verify(monkeypatch, owner, _claim_hash(owner, media[37]).hex())
+    assert body["exists"] is True and body["matched_media_id"] == f"0x{media[37]}"
+    assert body["checked_media_ids"] == 50 and body["owner_email_sha"] == owner
+
+    other, _ = _owner_with_media(1, 3)
+    body = _verify(monkeypatch, other, _claim_hash(owner, media[37]).hex())
+    assert body["exists"] is False and body["matched_media_id"] is None
+
+
+def test_without_ecc_the_nearest_claim_must_agree_on_most_bits(monkeypatch):
+    owner, media = _owner_with_media(2, 20)
+    noisy = bytearray(_claim_hash(owner, media[5]))
+    noisy[0] ^= 0b111          # 3 of 256 bits wrong
+    body = _verify(monkeypatch, owner, noisy.hex(), use_ecc="false")
+    assert body["exists"] is True and body["matched_media_id"] == f"0x{media[5]}"
+    assert 0.95 < body["similarity"] < 1.0
+
+    body = _verify(monkeypatch, owner, np.random.default_rng(3).bytes(32).hex(), use_ecc="false")
+    assert body["exists"] is False
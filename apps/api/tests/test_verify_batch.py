@@ -0,0 +1,64 @@
+import base64
+import io
+import json
+import secrets
+
+import numpy as np
+from PIL import Image
+from fastapi.testclient import TestClient
+
+from apps.api.src.app.main import app
+
+client = TestClient(app)
+
+KNOBS = {"repetition": "8", "ecc_parity_bytes": "16", "use_y_channel": "true"}
+
+
+def _png(seed):
+    rng = np.random.default_rng(seed)
+    buf = io.BytesIO()
+    Image.fromarray(rng.integers(40, 216, (128, 160, 3), dtype=np.uint8), mode="RGB").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _marked(owner, media, seed):
+    r = client.post("/api/watermark/image", files={"file": ("in.png", _png(seed), "image/png")},
+                    data={"text": f"owner:{owner}|media:{media}", "qim_step": "24", **KNOBS})
+    assert r.status_code == 200
+    return r.content
+
+
+def test_batch_and_ndjson_match_single_verify_in_input_order():
+    owners = [secrets.token_hex(32) for _ in range(2)]
+    media = [secrets.token_hex(32) for _ in range(2)]
+    images = [_marked(owners[0], media[0], 1), _png(2), _marked(owners[1], media[1], 3)]
+    item_owners = [owners[0], owners[0], owners[1]]
+
+    single = []
+    for img, owner in zip(images, item_owners):
+        r = client.post("/api/verify/auto", files={"file": ("x.png", img, "image/png")},
+                        data={"owner_email_sha": owner, **KNOBS})
+        single.append(r.json())
+    assert [s["exists"] for s in single] == [True, False, True]
+
+    r = client.post(
+        "/api/verify/auto/batch",
+        files=[("files", (f"{i}.png", img, "image/png")) for i, img in enumerate(images)],
+        data={"owner_email_sha": owners[0], "items": json.dumps([{}, {}, {"owner_email_sha": owners[1]}]), **KNOBS},
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert body["owners_loaded"] == 2
+    assert [it["id"] for it in body["results"]] == ["0.png", "1.png", "2.png"]
+    assert [it["result"] for it in body["results"]] == single
+
+    lines = [json.dumps({"id": i, "owner_email_sha": o, "image_b64": base64.b64encode(img).decode()})
+             for i, (img, o) in enumerate(zip(images, item_owners))]
+    lines.insert(1, "not json")
+    r = client.post("/api/verify/auto/batch/ndjson", params=KNOBS, content="\n".join(lines) + "\n",
+                    headers={"content-type": "application/x-ndjson"})
+    assert r.status_code == 200
+    out = [json.loads(x) for x in r.text.splitlines()]
+    assert [o["index"] for o in out] == [0, 1, 2, 3]
+    assert "invalid JSON" in out[1]["error"]
+    assert [o["result"] for o in out[:1] + out[2:]] == single
@@ -0,0 +1,23 @@
+from apps.api.src.app.services.watermarking.video_bench import ClipSpec, clip_matrix, compare_reports
+
+
+def _run(preset, embed_s, ecc):
+    return {"clip_name": ClipSpec().name, "preset": preset,
+            "embed": {"wall_s": embed_s}, "extract": {"wall_s": 1.0},
+            "extract_after_reencode": {"wall_s": 1.0, "match_text_hash": ecc}}
+
+
+def test_clip_matrix_covers_every_combination():
+    specs = clip_matrix(durations=[10, 60])
+    assert len(specs) == 2 * 4 * 2 * 2
+    assert len({s.name for s in specs}) == len(specs)
+
+
+def test_compare_reports_pairs_runs_by_clip_and_preset():
+    old = {"runs": [_run("facebook", 10.0, False), _run("whatsapp", 8.0, True)]}
+    new = {"runs": [_run("facebook", 5.0, True), _run("instagram", 4.0, True)]}
+    rows = compare_reports(old, new)
+    assert len(rows) == 1
+    assert rows[0]["preset"] == "facebook"
+    assert rows[0]["embed_ratio"] == 0.5
+    assert rows[0]["ecc_after_reencode"] == [False, True]
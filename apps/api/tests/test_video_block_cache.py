@@ -0,0 +1,33 @@
+import numpy as np
+
+from apps.api.src.app.services.watermarking.schemas import DCTConfig
+from apps.api.src.app.services.watermarking.image_embed import BlockReuseCache, embed_dct_plane
+
+
+def test_static_blocks_are_reused_and_match_a_full_embed():
+    rng = np.random.default_rng(0)
+    cfg = DCTConfig(qim_step=24.0, repetition=4)
+    bits = rng.integers(0, 2, 64).astype(np.uint8)
+    first = rng.uniform(0, 255, (64, 96)).astype(np.float32)
+    second = first.copy()
+    second[8:24, 16:40] += 20.0        # 2 x 3 blocks changed, 90 of 96 static
+
+    cache = BlockReuseCache()
+    embed_dct_plane(first, bits, cfg, cache=cache)
+    reused = embed_dct_plane(second, bits, cfg, cache=cache)
+
+    np.testing.assert_array_equal(reused, embed_dct_plane(second, bits, cfg))
+    assert (cache.hits, cache.lookups) == (90, 96)
+    assert cache.hit_rate == 90 / 96
+
+
+def test_cache_is_skipped_when_the_frame_size_changes():
+    rng = np.random.default_rng(1)
+    cfg = DCTConfig(qim_step=24.0, repetition=4)
+    bits = rng.integers(0, 2, 64).astype(np.uint8)
+    cache = BlockReuseCache()
+    embed_dct_plane(rng.uniform(0, 255, (64, 96)).astype(np.float32), bits, cfg, cache=cache)
+    other = rng.uniform(0, 255, (96, 64)).astype(np.float32)
+    np.testing.assert_array_equal(embed_dct_plane(other, bits, cfg, cache=cache),
+                                  embed_dct_plane(other, bits, cfg))
+    assert cache.lookups == 0
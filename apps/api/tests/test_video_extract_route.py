@@ -0,0 +1,33 @@
+import subprocess
+
+from fastapi.testclient import TestClient
+
+from apps.api.src.app.main import app
+from apps.api.src.app.services.watermarking.video_embed import DCTVideoConfig, embed_dct_video
+from apps.api.src.app.services.watermarking.video_extract import DCTVideoExtractConfig, extract_dct_video
+from apps.api.src.app.services.watermarking.video_service import build_video_payload
+
+client = TestClient(app)
+
+
+def test_route_and_cli_extract_agree_on_the_same_clip(tmp_path):
+    clip = tmp_path / "in.mp4"
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc2=size=640x480:rate=10",
+                    "-t", "4", "-pix_fmt", "yuv420p", str(clip)], check=True)
+    marked = tmp_path / "marked.mp4"
+    embed_dct_video(str(clip), str(marked), build_video_payload("owner:cli", True, 16),
+                    DCTVideoConfig(preset="original", qim_step=24.0, repetition=8, ecc_parity_bytes=16,
+                                   frame_step=2, crf=10, x264_preset="ultrafast", pre_normalize=False))
+
+    r = client.post("/api/watermark/video/extract", files={"file": ("marked.mp4", marked.read_bytes(), "video/mp4")},
+                    data={"qim_step": "24", "repetition": "8", "frame_step": "2", "ecc_parity_bytes": "16",
+                          "check_text": "owner:cli"})
+    assert r.status_code == 200
+    # what `video_extract --in marked.mp4 --qim 24 --rep 8 --ecc 16 --check-text owner:cli` runs
+    cli = extract_dct_video(str(marked), (32 + 16) * 8, DCTVideoExtractConfig(qim_step=24.0, repetition=8),
+                            ecc_parity_bytes=16, check_text="owner:cli")
+
+    api = r.json()
+    assert api["ecc_ok"] is cli["ecc_ok"] is True and api["match_text_hash"] is cli["match_text_hash"] is True
+    for key in ("payload_hex", "frames_used", "frame_phase", "sampling"):
+        assert api[key] == cli[key], key
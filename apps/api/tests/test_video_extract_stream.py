@@ -0,0 +1,56 @@
+import hashlib
+
+import numpy as np
+
+from apps.api.src.app.services.watermarking.schemas import DCTConfig
+from apps.api.src.app.services.watermarking.image_embed import _qim_embed_coeff, embed_dct_bgr_ychannel
+from apps.api.src.app.services.watermarking.image_extract import _qim_soft_score
+from apps.api.src.app.services.watermarking.video_extract import (
+    DCTVideoExtractConfig,
+    _SoftTally,
+    _stream_vote_and_decode,
+    _success_reachable,
+)
+
+
+def test_soft_tally_outweighs_marginal_frames():
+    step = 24.0
+    # one confident frame says 1, two barely-wrong frames say 0
+    c_one = _qim_embed_coeff(3.0, 1, step)
+    scores = [
+        np.array([_qim_soft_score(c_one, step)]),
+        np.array([_qim_soft_score(c_one - step / 4 - 0.5, step)]),
+        np.array([_qim_soft_score(c_one - step / 4 - 0.5, step)]),
+    ]
+    tally = _SoftTally(1)
+    for s in scores:
+        tally.add(s, np.ones(1, dtype=np.int64))
+    hard_votes = [int(s[0] > 0) for s in scores]
+    assert sum(hard_votes) == 1          # a hard majority would decide 0
+    assert tally.voted()[0] == 1
+    assert 0.0 < tally.confidence(step)[0] < 1.0
+
+
+def test_success_bound_gives_up_on_chance_level_frames():
+    # unmarked content: every frame agrees with the expected codeword ~50% of the time
+    assert not _success_reachable([0.50, 0.49, 0.51, 0.50] * 4, 768, 120, 64, 3.09)
+    # marked content: per-frame accuracy well above chance keeps decoding alive
+    assert _success_reachable([0.70, 0.72, 0.68, 0.71] * 4, 768, 120, 64, 3.09)
+
+
+def test_vote_picks_the_marked_phase_in_one_pass():
+    rng = np.random.default_rng(1)
+    claim = "owner:phase"
+    bits = np.unpackbits(np.frombuffer(hashlib.sha256(claim.encode()).digest(), dtype=np.uint8))
+    icfg = DCTConfig(qim_step=24.0, repetition=4)
+    frames = []
+    for i in range(8):
+        frame = rng.uniform(40, 215, (256, 256, 3)).astype(np.float32)
+        # marked on odd frames only, as if the first frame had been dropped
+        frames.append(embed_dct_bgr_ychannel(frame, bits, icfg) if i % 2 else frame)
+
+    ecfg = DCTVideoExtractConfig(qim_step=24.0, repetition=4, frame_step=2, early_exit=False)
+    out = _stream_vote_and_decode(iter(frames), len(bits), icfg, ecfg, False, 0, claim, phases=2)
+    assert out["frame_phase"] == 1
+    assert out["phase_fit"][1] > out["phase_fit"][0]
+    assert out["payload_hex"] == hashlib.sha256(claim.encode()).hexdigest()
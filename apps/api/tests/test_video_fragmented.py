@@ -0,0 +1,38 @@
+import subprocess
+
+from fastapi.testclient import TestClient
+
+from apps.api.src.app.main import app
+
+client = TestClient(app)
+
+
+def _frames(path):
+    out = subprocess.run(["ffprobe", "-v", "error", "-count_frames", "-select_streams", "v:0",
+                          "-show_entries", "stream=nb_read_frames", "-of", "csv=p=0", str(path)],
+                         capture_output=True, text=True, check=True).stdout
+    return int(out.strip())
+
+
+def test_fragmented_output_streams_a_playable_fmp4(tmp_path):
+    clip = tmp_path / "in.mp4"
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc2=size=160x120:rate=10",
+                    "-t", "3", "-pix_fmt", "yuv420p", str(clip)], check=True)
+    form = {"text": "owner:fmp4", "preset": "original", "repetition": "4", "ecc_parity_bytes": "16",
+            "output_mode": "fragmented"}
+
+    with client.stream("POST", "/api/watermark/video",
+                       files={"file": ("in.mp4", clip.read_bytes(), "video/mp4")}, data=form) as r:
+        assert r.status_code == 200
+        assert r.headers["x-output-mode"] == "fragmented" and "x-frames-marked" not in r.headers
+        chunks = list(r.iter_bytes())
+    body = b"".join(chunks)
+
+    # empty moov up front, then one moof + mdat per fragment
+    assert body[4:8] == b"ftyp" and body.count(b"moof") >= 2
+    out = tmp_path / "out.mp4"
+    out.write_bytes(body)
+    assert _frames(out) == 30
+
+    bad = client.post("/api/watermark/video", files={"file": ("in.mp4", b"not a video", "video/mp4")}, data=form)
+    assert bad.status_code == 400
@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from apps.api.src.app.main import app
+from app.core.config import settings
+from app.db import models
+from app.db.session import SessionLocal
+from app.api.routes import video_jobs as video_jobs_routes
+from app.services.watermarking import video_jobs
+from app.services.watermarking.video_jobs import ACTIVE_STATES, VideoJobRunner
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def job_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "video_job_dir", str(tmp_path))
+    return tmp_path
+
+
+def _active_jobs():
+    with SessionLocal() as db:
+        return db.query(models.VideoJob).filter(models.VideoJob.status.in_(ACTIVE_STATES)).count()
+
+
+def _submit():
+    return client.post("/api/watermark/video/jobs", files={"file": ("in.mp4", b"not decoded", "video/mp4")},
+                       data={"text": "owner:jobs"})
+
+
+def _wait(job_id, *states):
+    for _ in range(200):
+        job = client.get(f"/api/watermark/video/jobs/{job_id}").json()
+        if job["status"] in states:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} stuck in {job['status']}")
+
+
+def _fake_embed(gate):
+    def run(job, progress):
+        while not gate.wait(0.05):
+            progress({"stage": "mark", "frame": 1})
+        out = video_jobs._job_dir(job["id"]) / "output.mp4"
+        out.write_bytes(b"marked")
+        return str(out), {"headers": {"X-Preset": "facebook"}, "stats": {}}
+    return run
+
+
+def test_submit_queue_limit_cancel_and_result(monkeypatch):
+    gate = threading.Event()
+    runner = VideoJobRunner(workers=1, queue_max=16)
+    monkeypatch.setattr(video_jobs, "_run_embed_job", _fake_embed(gate))
+    monkeypatch.setattr(video_jobs, "_runner", runner)
+    try:
+        first = _submit()
+        assert first.status_code == 202
+        running = _wait(first.json()["job_id"], "running")
+        runner.queue_max = _active_jobs() + 1
+        second = _submit()
+        assert second.status_code == 202 and second.json()["queue_position"] >= 1
+        full = _submit()
+        assert full.status_code == 429 and full.headers["Retry-After"]
+
+        # queued jobs go at once; running ones stop at their next progress event
+        queued = client.delete(f"/api/watermark/video/jobs/{second.json()['job_id']}").json()
+        assert queued["status"] == "cancelled"
+        assert client.delete(f"/api/watermark/video/jobs/{running['job_id']}").json()["cancel_requested"] is True
+        assert _wait(running["job_id"], "cancelled", "failed", "done")["status"] == "cancelled"
+
+        third = _submit().json()["job_id"]
+        gate.set()
+        assert _wait(third, "done", "failed")["has_output"] is True
+        r = client.get(f"/api/watermark/video/jobs/{third}/result")
+        assert r.status_code == 200 and r.content == b"marked" and r.headers["x-preset"] == "facebook"
+    finally:
+        gate.set()
+
+
+def test_events_stream_status_progress_and_final_timings(monkeypatch):
+    def run(job, progress):
+        for frame in range(1, 6):
+            progress({"stage": "mark", "frame": frame})
+            time.sleep(0.05)
+        out = video_jobs._job_dir(job["id"]) / "output.mp4"
+        out.write_bytes(b"marked")
+        return str(out), {"headers": {}, "stats": {"timings": {"mark": 0.25}}}
+
+    monkeypatch.setattr(video_jobs, "_run_embed_job", run)
+    monkeypatch.setattr(video_jobs, "_runner", VideoJobRunner(workers=1, queue_max=16))
+    monkeypatch.setattr(video_jobs_routes, "_EVENTS_POLL_S", 0.02)
+    job_id = _submit().json()["job_id"]
+
+    with client.stream("GET", f"/api/watermark/video/jobs/{job_id}/events") as r:
+        assert r.headers["content-type"].startswith("text/event-stream")
+        body = "".join(r.iter_text())
+    events = [e for e in body.split("\n\n") if e.startswith("event:")]
+    names = [e.split("\n")[0].removeprefix("event: ") for e in events]
+
+    assert names[0] == "status" and names[-1] == "done"
+    progress = [json.loads(e.split("\n")[1].removeprefix("data: ")) for e in events if e.startswith("event: progress")]
+    assert progress and all(p["stage"] == "mark" for p in progress)
+    assert [p["seq"] for p in progress] == sorted(set(p["seq"] for p in progress))   # no repeats
+    assert json.loads(events[-1].split("\n")[1].removeprefix("data: "))["result"]["stats"]["timings"] == {"mark": 0.25}
+    assert client.get("/api/watermark/video/jobs/nope/events").status_code == 404
+
+
+def test_extract_job_location_points_at_the_job(monkeypatch):
+    monkeypatch.setattr(video_jobs, "_run_extract_job", lambda job, progress: {"ecc_ok": True, "frames_used": 3})
+    monkeypatch.setattr(video_jobs, "_runner", VideoJobRunner(workers=1, queue_max=16))
+    r = client.post("/api/watermark/video/jobs/extract", files={"file": ("in.mp4", b"not decoded", "video/mp4")},
+                    data={"check_text": "owner:jobs"})
+    assert r.status_code == 202
+    job_id = r.json()["job_id"]
+    assert r.headers["location"] == f"http://testserver/api/watermark/video/jobs/{job_id}"
+    assert client.get(r.headers["location"]).json()["kind"] == "extract"
+    _wait(job_id, "done")
+    assert client.get(f"/api/watermark/video/jobs/{job_id}/result").json() == {"ecc_ok": True, "frames_used": 3}
+
+
+def test_sweep_removes_only_directories_of_jobs_past_retention(job_dir):
+    runner = VideoJobRunner(workers=1, queue_max=16, retention_s=60)
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        jobs = {
+            "old": models.VideoJob(kind="embed", status="done", input_path="", finished_at=now - timedelta(seconds=120)),
+            "recent": models.VideoJob(kind="embed", status="done", input_path="", finished_at=now),
+            "running": models.VideoJob(kind="embed", status="running", input_path="",
+                                       started_at=now - timedelta(seconds=120)),
+        }
+        db.add_all(jobs.values())
+        db.flush()
+        for job in jobs.values():
+            (job_dir / job.id).mkdir()
+            job.output_path = str(job_dir / job.id / "output.mp4")
+        db.commit()
+        ids = {name: job.id for name, job in jobs.items()}
+    (job_dir / "orphan").mkdir()
+
+    try:
+        assert runner._sweep() == [ids["old"]]
+        assert sorted(p.name for p in job_dir.iterdir()) == sorted([ids["recent"], ids["running"], "orphan"])
+        with SessionLocal() as db:
+            assert db.get(models.VideoJob, ids["old"]).output_path is None
+        assert client.get(f"/api/watermark/video/jobs/{ids['old']}").json()["has_output"] is False
+        assert VideoJobRunner(workers=1, queue_max=16)._sweep() == []   # retention 0 keeps everything
+    finally:
+        with SessionLocal() as db:
+            db.query(models.VideoJob).filter(models.VideoJob.id == ids["running"]) \
+                .update({"status": "cancelled"}, synchronize_session=False)
+            db.commit()
+
+
+def test_start_reclaims_only_jobs_whose_lease_lapsed():
+    runner = VideoJobRunner(workers=1, queue_max=16, lease_s=60)
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        jobs = {name: models.VideoJob(kind="embed", status="running", input_path="")
+                for name in ("live", "lapsed", "unleased")}
+        db.add_all(jobs.values())
+        db.flush()
+        db.add_all([
+            models.VideoJobLease(job_id=jobs["live"].id, owner="other-host:1", heartbeat_at=now),
+            models.VideoJobLease(job_id=jobs["lapsed"].id, owner="other-host:2",
+                                 heartbeat_at=now - timedelta(seconds=120)),
+        ])
+        db.commit()
+        ids = {name: job.id for name, job in jobs.items()}
+
+    try:
+        assert set(runner._reclaim()) >= {ids["lapsed"], ids["unleased"]}
+        with SessionLocal() as db:
+            status = {name: db.get(models.VideoJob, job_id).status for name, job_id in ids.items()}
+            assert db.get(models.VideoJobLease, ids["lapsed"]) is None
+        assert status == {"live": "running", "lapsed": "queued", "unleased": "queued"}
+    finally:
+        with SessionLocal() as db:
+            db.query(models.VideoJob).filter(models.VideoJob.id.in_(ids.values())) \
+                .update({"status": "cancelled"}, synchronize_session=False)
+            db.commit()
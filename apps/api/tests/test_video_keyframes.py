@@ -0,0 +1,70 @@
+import subprocess
+
+from apps.api.src.app.services.watermarking.video_embed import (
+    DCTVideoConfig,
+    _probe_keyframe_times,
+    _probe_packet_times,
+    embed_dct_video,
+)
+from apps.api.src.app.services.watermarking.video_extract import DCTVideoExtractConfig, extract_dct_video
+from apps.api.src.app.services.watermarking.video_service import build_video_payload
+
+PAYLOAD_BITS = (32 + 16) * 8
+
+
+def test_keyframe_mode_marks_and_forces_idr_on_every_kth_frame(tmp_path):
+    clip = tmp_path / "in.mp4"
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc2=size=160x120:rate=10",
+                    "-t", "4", "-g", "40", "-pix_fmt", "yuv420p", str(clip)], check=True)
+    out = tmp_path / "out.mp4"
+    vcfg = DCTVideoConfig(preset="original", qim_step=24.0, repetition=4, x264_preset="ultrafast",
+                          pre_normalize=False, embed_mode="keyframes", keyframe_interval=5)
+
+    stats = embed_dct_video(str(clip), str(out), build_video_payload("owner:kf", True, 16), vcfg)
+
+    assert (stats["frames"], stats["frames_marked"]) == (40, 8)
+    assert [vcfg.is_marked(i) for i in range(6)] == [True, False, False, False, False, True]
+    # the marked frames are exactly the output's keyframes (no scene-cut extras)
+    frame_times = _probe_packet_times(str(out))
+    assert [frame_times.index(t) for t in _probe_keyframe_times(str(out))] == list(range(0, 40, 5))
+
+
+def _marked_clip(tmp_path, **vcfg):
+    # 640x480 leaves room for 12 repetitions of the payload; crf 10 keeps the marks
+    clip = tmp_path / "in.mp4"
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc2=size=640x480:rate=10",
+                    "-t", "4", "-g", "40", "-pix_fmt", "yuv420p", str(clip)], check=True)
+    out = tmp_path / "marked.mp4"
+    embed_dct_video(str(clip), str(out), build_video_payload("owner:kf", True, 16),
+                    DCTVideoConfig(preset="original", qim_step=32.0, repetition=12, ecc_parity_bytes=16, crf=10,
+                                   x264_preset="ultrafast", pre_normalize=False, **vcfg))
+    return str(out)
+
+
+def _extract(path):
+    ecfg = DCTVideoExtractConfig(qim_step=32.0, repetition=12, frame_step=2, sampling="keyframes")
+    return extract_dct_video(path, PAYLOAD_BITS, ecfg, ecc_parity_bytes=16, check_text="owner:kf")
+
+
+def test_keyframe_sampling_decodes_keyframe_marks_from_the_keyframes_alone(tmp_path):
+    marked = _marked_clip(tmp_path, embed_mode="keyframes", keyframe_interval=10)
+
+    res = _extract(marked)
+
+    assert res["sampling"] == "keyframes" and res["ecc_ok"] and res["match_text_hash"]
+    assert res["frames_decoded"] == 4            # of 40
+
+
+def test_keyframe_sampling_falls_back_to_dense_when_marks_miss_the_keyframes(tmp_path):
+    marked = _marked_clip(tmp_path, frame_step=2)
+    # drop the first frame (losslessly, one GOP): the only keyframe is now an unmarked frame
+    shifted = str(tmp_path / "shifted.mp4")
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", marked, "-vf", "select=gte(n\\,1)",
+                    "-c:v", "libx264", "-preset", "ultrafast", "-qp", "0", "-g", "1000", "-sc_threshold", "0",
+                    shifted], check=True)
+    assert _probe_keyframe_times(shifted) == _probe_packet_times(shifted)[:1]
+
+    res = _extract(shifted)
+
+    assert res["sampling"] == "keyframes->dense" and res["ecc_ok"] and res["match_text_hash"]
+    assert res["frame_phase"] == 1
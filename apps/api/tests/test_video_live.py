@@ -0,0 +1,40 @@
+import subprocess
+
+from apps.api.src.app.services.watermarking.video_embed import DCTVideoConfig
+from apps.api.src.app.services.watermarking.video_live import LatencyStats, LiveEmbedConfig, run_live_embed
+from apps.api.src.app.services.watermarking.video_service import build_video_payload
+
+
+def test_live_embed_passes_every_frame_and_marks_on_schedule(tmp_path):
+    clip = tmp_path / "in.mp4"
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc2=size=160x120:rate=10",
+                    "-f", "lavfi", "-i", "sine=frequency=440", "-t", "3", "-shortest",
+                    "-pix_fmt", "yuv420p", str(clip)], check=True)
+    out = tmp_path / "out.mp4"
+    vcfg = DCTVideoConfig(preset="original", qim_step=24.0, repetition=4, frame_step=2,
+                          crf=23, x264_preset="ultrafast")
+    seen = []
+
+    stats = run_live_embed(str(clip), str(out), build_video_payload("owner:live", True, 16), vcfg,
+                           LiveEmbedConfig(output_format="fmp4", latency_budget_ms=10_000), on_stats=seen.append, stats_every_s=0)
+
+    assert (stats["frames"], stats["frames_marked"], stats["frames_skipped_behind"]) == (30, 15, 0)
+    assert stats["size"] == [160, 120] and seen and seen[-1]["frames"] <= 30
+    assert set(stats["lag_ms"]) == {"p50", "p90", "p99", "max"}
+
+    def probe(*args):
+        return subprocess.run(["ffprobe", "-v", "error", *args, "-of", "csv=p=0", str(out)],
+                              capture_output=True, text=True, check=True).stdout.split()
+
+    assert b"moof" in out.read_bytes()
+    assert sorted(probe("-show_entries", "stream=codec_type")) == ["audio", "video"]
+    assert probe("-count_frames", "-select_streams", "v:0", "-show_entries", "stream=nb_read_frames") == ["30"]
+
+
+def test_latency_percentiles():
+    lat = LatencyStats(window=100)
+    for v in range(1, 201):            # only the last 100 samples are kept
+        lat.add(float(v), float(v) / 10)
+    s = lat.summary()
+    assert s["processing_ms"]["max"] == 200.0 and s["processing_ms"]["p50"] == 150.5
+    assert s["lag_ms"]["p99"] == 19.9
@@ -0,0 +1,74 @@
+import subprocess
+
+import numpy as np
+
+from apps.api.src.app.services.watermarking.schemas import DCTConfig
+from apps.api.src.app.services.watermarking.image_embed import embed_dct_plane
+from apps.api.src.app.services.watermarking.image_extract import extract_dct_plane_soft
+from apps.api.src.app.services.watermarking.video_extract import frame_presence
+from apps.api.src.app.services.watermarking.video_embed import DCTVideoConfig, embed_dct_video
+from apps.api.src.app.services.watermarking.video_localize import (
+    DCTVideoLocalizeConfig, localize_dct_video, merge_windows,
+)
+from apps.api.src.app.services.watermarking.video_service import build_video_payload, video_localize_sync
+
+
+def test_presence_separates_marked_from_unmarked_planes():
+    rng = np.random.default_rng(0)
+    cfg = DCTConfig(qim_step=24.0, repetition=16)
+    plane = rng.uniform(0, 255, (128, 256)).astype(np.float32)
+    bits = rng.integers(0, 2, 64).astype(np.uint8)
+    marked = embed_dct_plane(plane, bits, cfg)
+
+    scores, counts, p_marked = frame_presence(marked, len(bits), cfg)
+    _, _, p_plain = frame_presence(plane, len(bits), cfg)
+    ref_scores, ref_counts = extract_dct_plane_soft(marked, len(bits), cfg)
+
+    assert p_marked > 0.9 > 0.5 > p_plain
+    np.testing.assert_allclose(scores, ref_scores, atol=1e-2)
+    np.testing.assert_array_equal(counts, ref_counts)
+
+
+def _w(index, start, marked_from=None, marked_to=None, payload=None, frames=10):
+    return {
+        "index": index, "start_s": start, "frames_marked": frames if marked_from is not None else 0,
+        "marked_from_s": marked_from, "marked_to_s": marked_to, "payload_hex": payload,
+        "ecc_ok": payload is not None, "match_text_hash": None, "mean_confidence": 0.2,
+    }
+
+
+def test_merge_windows_joins_same_payload_and_absorbs_edge_clips():
+    windows = [
+        _w(0, 0.0),
+        _w(1, 2.0, 3.1, 6.0, "aa"),
+        _w(2, 4.0, 4.0, 8.0, "aa"),
+        _w(3, 6.0, 6.0, 7.2, None, frames=3),   # tail of the "aa" range, too short to decode
+        _w(4, 8.0),
+        _w(5, 10.0, 10.0, 12.0, "bb"),
+    ]
+    ranges = merge_windows(windows)
+    assert [(r["start_s"], r["end_s"], r["payload_hex"], r["windows"]) for r in ranges] == [
+        (3.1, 8.0, "aa", 2),
+        (10.0, 12.0, "bb", 1),
+    ]
+
+
+def test_localize_on_the_pool_runs_one_job_per_window_and_matches_in_process(tmp_path):
+    clip = tmp_path / "in.mp4"
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc2=size=160x120:rate=10",
+                    "-t", "4", "-pix_fmt", "yuv420p", str(clip)], check=True)
+    marked = str(tmp_path / "marked.mp4")
+    vcfg = DCTVideoConfig(preset="original", qim_step=24.0, repetition=4, frame_step=1, x264_preset="ultrafast")
+    embed_dct_video(str(clip), marked, build_video_payload("owner:localize", True, 16), vcfg)
+
+    events = []
+    pooled = video_localize_sync(marked, qim_step=24.0, repetition=4, use_ecc=True, ecc_parity_bytes=16,
+                                 check_text="owner:localize", window_s=0.5, progress=events.append)
+    lcfg = DCTVideoLocalizeConfig(qim_step=24.0, repetition=4, window_s=0.5, workers=1)
+    inline = localize_dct_video(marked, (32 + 16) * 8, lcfg, ecc_parity_bytes=16, check_text="owner:localize")
+
+    n = len(inline["windows"])   # the marked clip is re-encoded at 30 fps: 1.33 s
+    assert n >= 4 and len(pooled["windows"]) == n
+    assert [e["window"] for e in events] == list(range(1, n + 1)) and events[-1]["windows"] == n
+    assert pooled["windows"] == inline["windows"] and pooled["ranges"] == inline["ranges"]
+    assert pooled["windows"][0]["frames_marked"] > 0
@@ -0,0 +1,46 @@
+from apps.api.src.app.services.watermarking import video_planner
+from apps.api.src.app.services.watermarking.video_embed import DCTVideoConfig
+from apps.api.src.app.services.watermarking.video_planner import HostProfile, plan_video_embed
+
+PROFILE = HostProfile(
+    cpus=4,
+    decode_pps=40e6,
+    mark_pps=4e6,
+    encode_pps={"medium": 10e6, "fast": 12e6, "faster": 15e6,
+                "veryfast": 20e6, "superfast": 30e6, "ultrafast": 40e6},
+)
+PROBE = {"duration": 10.0, "width": 640, "height": 360, "fps": 25.0, "frames": 250}
+
+
+def _plan(monkeypatch, **kw):
+    monkeypatch.setattr(video_planner, "probe_video", lambda _path: dict(PROBE))
+    vcfg = DCTVideoConfig(preset="original", pre_normalize=False)
+    return plan_video_embed("unused.mp4", vcfg, profile=PROFILE, cpus=4, **kw)
+
+
+def test_loose_deadline_gets_most_robust_plan(monkeypatch):
+    plan = _plan(monkeypatch, deadline_s=600)
+    assert plan.feasible
+    assert (plan.frame_step, plan.x264_preset, plan.segments) == (1, "medium", 1)
+
+
+def test_tight_deadline_trades_robustness_for_speed(monkeypatch):
+    loose = _plan(monkeypatch, deadline_s=600)
+    tight = _plan(monkeypatch, target_speed=1.0)     # 10 s clip in 10 s
+    assert tight.budget_seconds == 10.0
+    assert tight.feasible
+    assert tight.est_seconds <= 10.0 < loose.est_seconds
+
+
+def test_impossible_deadline_returns_fastest_plan(monkeypatch):
+    plan = _plan(monkeypatch, deadline_s=0.01)
+    assert not plan.feasible
+    assert plan.x264_preset == "ultrafast"
+    assert plan.headers()["X-Plan-Feasible"] == "false"
+
+
+def test_max_segments_caps_the_plan(monkeypatch):
+    tight = _plan(monkeypatch, deadline_s=4.0)
+    single = _plan(monkeypatch, deadline_s=4.0, max_segments=1)
+    assert tight.segments > 1
+    assert single.segments == 1 and single.headers()["X-Plan-Segments"] == "1"
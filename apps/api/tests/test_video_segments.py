@@ -0,0 +1,46 @@
+import subprocess
+
+from apps.api.src.app.services.watermarking.video_embed import DCTVideoConfig, _plan_segments
+from apps.api.src.app.services.watermarking.video_service import build_video_payload, embed_video_on_pool
+
+
+def _clip(path, seconds=4, gop=10):
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc2=size=160x120:rate=10",
+                    "-t", str(seconds), "-g", str(gop), "-pix_fmt", "yuv420p", str(path)], check=True)
+    return str(path)
+
+
+def _frames(path):
+    out = subprocess.run(["ffprobe", "-v", "error", "-count_frames", "-select_streams", "v:0",
+                          "-show_entries", "stream=nb_read_frames", "-of", "csv=p=0", path],
+                         capture_output=True, text=True, check=True).stdout
+    return int(out.strip())
+
+
+def test_segments_cut_on_keyframes_and_cover_every_frame(tmp_path):
+    clip = _clip(tmp_path / "in.mp4")
+    plan = _plan_segments(clip, 3)
+    assert len(plan) == 3
+    assert plan[-1][1] is None
+    for (start, _, first, n), (next_start, _, next_first, _) in zip(plan, plan[1:]):
+        assert first + n == next_first
+        assert round(next_start * 10) % 10 == 0      # every 10th frame is a keyframe
+    assert sum(n for *_, n in plan) == 40
+
+
+def test_segmented_embed_on_the_pool_matches_one_pass(tmp_path):
+    clip = _clip(tmp_path / "in.mp4")
+    payload = build_video_payload("owner:segments", True, 16)
+
+    def embed(segments):
+        out = str(tmp_path / f"out_{segments}.mp4")
+        vcfg = DCTVideoConfig(preset="original", qim_step=24.0, repetition=4, frame_step=2,
+                              x264_preset="ultrafast", segments=segments)
+        return out, embed_video_on_pool(clip, out, payload, vcfg)
+
+    single_out, single = embed(1)
+    split_out, split = embed(3)
+    assert "segments" in split["timings"] and "segments" not in single["timings"]
+    # frame indices stay global across segments, so the same frames get marked
+    assert (split["frames"], split["frames_marked"]) == (single["frames"], single["frames_marked"]) == (40, 20)
+    assert _frames(split_out) == _frames(single_out) == 40